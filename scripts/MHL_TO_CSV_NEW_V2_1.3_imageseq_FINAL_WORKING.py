@@ -15,11 +15,17 @@ import argparse
 import subprocess
 import xml.etree.ElementTree as et
 import tqdm
+# mhl_input is shared with the MHL to CSV scripts in misc-scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'misc-scripts'))
+import mhl_input
 
 USE_MD5 = False
 USE_RESTORE = False
 SAVE_LOCATION = os.path.expanduser("~/Desktop/MHL_Verification_Reports/")
 SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM = False
+# MHLs read ahead of the one being parsed, and the most decompressed MHL data held in memory for them
+PREFETCH_FILES = 4
+PREFETCH_MAX_BYTES = 512 * 1024 * 1024
 frames_img_seq_clip = []
 output_csv_matched_list = []
 output_csv_mismatched_different_file_list = []
@@ -166,12 +172,12 @@ def build_hash_list(your_mhl_list):
     hash_list = []
     duplicates_list = []
     unique_hashes_set = set()
-    for input_mhl_file in your_mhl_list:
+    for input_mhl_file, mhl_stream in mhl_input.prefetch_mhls([mhl_path.strip() for mhl_path in your_mhl_list], PREFETCH_FILES, PREFETCH_MAX_BYTES):
         
         mhl_name = []
         mhl_name_extract = os.path.splitext(os.path.basename(input_mhl_file))[0]
         mhl_name = FileHash(file=mhl_name_extract, size="", xxhash64be="", md5="", hashdate="")
-        mhl_root = et.parse(input_mhl_file.strip()).getroot()
+        mhl_root = et.parse(mhl_stream).getroot()
         mhl_version = float(mhl_root.attrib["version"]) 
         if mhl_version >= 2:
             # Extract the namespace from the root tag
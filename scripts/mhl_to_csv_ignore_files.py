@@ -17,6 +17,9 @@ from datetime import datetime
 import operator
 from operator import itemgetter
 import xml.etree.ElementTree as et
+# mhl_input is shared with the MHL to CSV scripts in misc-scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'misc-scripts'))
+import mhl_input
 
 softwareName = ''
 currentTime = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -24,6 +27,15 @@ save_location = os.path.expanduser("~/Desktop/MHL_Exports/")
 new_csv_file_name = 'Restore'
 sort_enabled = False
 skip_summarise_img_seq = False
+include_patterns = []
+exclude_patterns = []
+# Directories listed at once when searching for MHLs
+discovery_workers = 8
+use_discovery_cache = True
+discovery_cache_location = save_location + "mhl_discovery_cache.json"
+# MHLs read ahead of the one being parsed, and the most decompressed MHL data held in memory for them
+prefetch_files = 4
+prefetch_max_bytes = 512 * 1024 * 1024
 use_ignored_extensions = False
 extensions_to_ignore = ['.pdf', '.bin', '.csv', '.json', '.metadata_never_index', '.xml', '.fmtsig_sounddev', '.cdl', '.cube', '.ale', '.drp', '.psla', '.csv']
 
@@ -43,28 +55,11 @@ def printHashList(hashlist):
 
 
 
-# checks for dir, makes list of mhl files if so, else returns input list
-def get_mhl_file_paths(input_paths):
-    mhl_file_list = []
-
-    for mhl in input_paths:
-        # print(mhl)
-        if os.path.isdir(mhl):
-            for file in os.listdir(mhl):
-                if not file.startswith("."):
-                    if file.endswith(".mhl"):
-                        mhl_file_list.append("{}{}".format(mhl, file))
-        elif mhl.endswith(".mhl"):
-            mhl_file_list.append(mhl)
-
-    return mhl_file_list
-
-
 def create_hash_list(mhl_file_list):
     combinedHashesList = []
 
-    for mhl in mhl_file_list:
-        combinedHashesList += parse_mhl(mhl)
+    for mhl, mhl_stream in mhl_input.prefetch_mhls(mhl_file_list, prefetch_files, prefetch_max_bytes):
+        combinedHashesList += parse_mhl(mhl, mhl_stream)
 
     if sort_enabled:
         combinedHashesList = sorted(combinedHashesList, key=lambda k: k['file'])
@@ -142,9 +137,12 @@ def parse_v2_hash(hash):
 
 
 # Imports each MHL file, parse it and get the root list of items.
-def parse_mhl(mhl_file):
-    mhl_file = et.parse(mhl_file)
-    root = mhl_file.getroot()
+# mhl_stream is the MHL already opened by prefetch_mhls, otherwise mhl_file is read here
+def parse_mhl(mhl_file, mhl_stream=None):
+    if mhl_stream is None:
+        root = et.fromstring(mhl_input.read_mhl(mhl_file))
+    else:
+        root = et.parse(mhl_stream).getroot()
     mhl_version = float(root.attrib["version"])
     hash_list = []
     global softwareName
@@ -188,6 +186,10 @@ def args_parse():
     global use_header
     global skip_summarise_img_seq
     global use_ignored_extensions
+    global include_patterns
+    global exclude_patterns
+    global discovery_workers
+    global use_discovery_cache
     parser = argparse.ArgumentParser()
 
     # parser.add_argument("mhl_file", help="The MHL you wish to use")
@@ -196,13 +198,21 @@ def args_parse():
     parser.add_argument('--header', action='store_true', help="Optionally include the header line")
     parser.add_argument('--skip-summarise-img-seq', action='store_true', help="Optionally include the header line")
     parser.add_argument('--ignore-sidecar-files', '-i', action='store_true', help="Optionally ignore files with extensions in extensions_to_ignore")
-    parser.add_argument('input_paths', nargs='+', help="The MHLs or directory of MHLs you wish to use")
+    parser.add_argument('--include', nargs='+', default=[], help="Only use MHLs matching these globs when searching directories, eg: '*_LTO*.mhl'")
+    parser.add_argument('--exclude', nargs='+', default=[], help="Skip MHLs and folders matching these globs when searching directories, eg: Proxy '*/Old/*'")
+    parser.add_argument('--discovery-workers', type=int, default=discovery_workers, help="Directories listed at once when searching for MHLs")
+    parser.add_argument('--rescan', action='store_true', help="List every directory again instead of using the cached listings")
+    parser.add_argument('input_paths', nargs='+', help="The MHLs or directories of MHLs (searched through all subdirectories) you wish to use")
 
     parsed_arguments = parser.parse_args()
 
     sort_enabled = parsed_arguments.sort
     use_header = parsed_arguments.header
     skip_summarise_img_seq = parsed_arguments.skip_summarise_img_seq
+    include_patterns = parsed_arguments.include
+    exclude_patterns = parsed_arguments.exclude
+    discovery_workers = parsed_arguments.discovery_workers
+    use_discovery_cache = not parsed_arguments.rescan
     use_ignored_extensions = parsed_arguments.ignore_sidecar_files
 
     return parsed_arguments.input_paths
@@ -329,7 +339,7 @@ def main():
     print("Converting MHL to csv...")
     create_save_directory()
     input_paths = args_parse()
-    mhl_file_list = get_mhl_file_paths(input_paths)
+    mhl_file_list = mhl_input.get_mhl_file_paths(input_paths, discovery_cache_location, use_discovery_cache, include_patterns, exclude_patterns, discovery_workers)
     new_csv_file_name = 'TEST'
     hashes = create_hash_list(mhl_file_list)
     create_csv(hashes)
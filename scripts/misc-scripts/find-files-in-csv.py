@@ -19,6 +19,7 @@ import argparse
 from datetime import datetime
 import subprocess
 import re
+import mhl_input
 
 PATH_SPLIT_STRING = 'CHLOE_S1/' # This string will be used to split the filepath, anything to the right of this will be treated as the file
 currentTime = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -54,13 +55,13 @@ def main():
     args = args_parse()
     found_list = []
     unfound_list = []
-    destination_file = open(args.destination_file)
+    destination_file = mhl_input.open_text(args.destination_file)
     destination_contents = destination_file.read()
     line_count = 0
     new_csv_file_name = f'{os.path.basename(args.destination_file).split(".")[0]}-MATCH_CHECK'
 
 
-    with open(args.source_csv, 'r') as source:
+    with mhl_input.open_text(args.source_csv) as source:
         for line in csv.reader(source):
             try:
                 filepath = line[source_file_path_column].split(PATH_SPLIT_STRING)[1] # Split the filepath at CHLOE_S1 to get relative filepath
@@ -6,6 +6,7 @@ import hashlib
 import xxhash
 import re
 import subprocess
+import mhl_input
 
 """
 Ref 
@@ -20,7 +21,7 @@ def mangle_csv_for_mhl_check(csv_file_path, output_file_path) -> None:
     :param output_file_path: (optional) csv output path, else defaults to working dir, input filename + _mangled.csv
     :return: outputs csv to paste into GSheets (Could impl google api but not worth it atm)
     """
-    with open(csv_file_path, newline='') as csvfile:
+    with mhl_input.open_text(csv_file_path) as csvfile:
         csv_for_mhl_sheet: list = []
         num_original_rows = 0
         reader = csv.reader(csvfile, delimiter=" ", skipinitialspace=True)
@@ -103,7 +104,7 @@ def is_frame_dng(file_name):
 
 def img_seq_checksums_to_clip_checksums(csv_path):
     print("Summarising image sequences (for .ari, .arx or .dng media)...")
-    with open(csv_path, 'r') as data:
+    with mhl_input.open_text(csv_path) as data:
         last_clip_name = ""
         output_csv = []
         frame_combiner = []
@@ -168,7 +169,8 @@ if __name__ == '__main__':
     if len(sys.argv) == 3:
         output_file_path = sys.argv[2]
     else:
-        output_file_path = f"{basename(csv_file_path)[:-4]}_mangled.csv"
+        # eg: listing.csv or listing.csv.gz -> listing_mangled.csv
+        output_file_path = f"{basename(csv_file_path).rsplit('.csv', 1)[0]}_mangled.csv"
     mangle_csv_for_mhl_check(csv_file_path, output_file_path)
     img_seq_checksums_to_clip_checksums(output_file_path)
     copy_csv_content_to_clipboard(output_file_path)
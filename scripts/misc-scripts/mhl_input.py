@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+__programName__ = "MHL Input"
+__description__ = "Opens compressed MHLs, finds the MHLs in directories and reads MHLs ahead of the parser. Shared by the MHL to CSV scripts."
+__author__ = "Josh Unwin/Gary Palmer"
+__version__ = "1.0"
+
+import fnmatch
+import gzip
+import io
+import json
+import lzma
+import mmap
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressed MHLs are recognised by their first bytes and decompressed as they are read
+COMPRESSION_MAGIC = {b'\x1f\x8b': 'gz', b'\xfd7zXZ\x00': 'xz', b'\x28\xb5\x2f\xfd': 'zst'}
+MHL_SUFFIXES = ('.mhl', '.mhl.gz', '.mhl.xz', '.mhl.zst')
+# Largest decompressed piece of an MHL read ahead of the parser
+PREFETCH_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+class ReadAheadFile(io.RawIOBase):
+    # Reads (and decompresses) a file in chunks on a background thread, up to max_bytes ahead of the parser,
+    # so on a high latency SMB/NFS share the network is read while the CPU parses instead of each waiting on the other.
+    # The chunks waiting in the queue and the one the thread is holding all fit in max_bytes, so a small share
+    # of the read-ahead budget is read in smaller chunks.
+    def __init__(self, input_file, max_bytes):
+        super().__init__()
+        self.name = getattr(input_file, 'name', '')
+        self.input_file = input_file
+        self.chunk_bytes = max(1, min(PREFETCH_CHUNK_BYTES, max_bytes // 2))
+        self.chunks = queue.Queue(maxsize=max(1, max_bytes // self.chunk_bytes - 1))
+        self.current_chunk = memoryview(b'')
+        self.is_at_end = False
+        self.stopped = threading.Event()
+        threading.Thread(target=self.read_ahead, daemon=True).start()
+
+    def read_ahead(self):
+        try:
+            while not self.stopped.is_set():
+                chunk = self.input_file.read(self.chunk_bytes)
+                self.put_chunk(chunk)
+                if not chunk:
+                    break
+        except Exception as error:
+            # Raised in the parser when it reaches the point the read failed
+            self.put_chunk(error)
+        finally:
+            self.input_file.close()
+
+    def put_chunk(self, chunk):
+        # Waits for the parser to make room, giving up if the file is closed before it is read to the end
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.current_chunk:
+            if self.is_at_end:
+                return 0
+            chunk = self.chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                self.is_at_end = True
+                return 0
+            self.current_chunk = memoryview(chunk)
+        length = min(len(buffer), len(self.current_chunk))
+        buffer[:length] = self.current_chunk[:length]
+        self.current_chunk = self.current_chunk[length:]
+        return length
+
+    def close(self):
+        self.stopped.set()
+        # Drops chunks read ahead that were never used, eg: when the MHL is mapped into memory instead
+        while not self.chunks.empty():
+            self.chunks.get_nowait()
+        super().close()
+
+
+def detect_compression(path):
+    with open(path, 'rb') as input_file:
+        start = input_file.read(6)
+    for magic, compression in COMPRESSION_MAGIC.items():
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def open_mhl(mhl_path, read_ahead_bytes=None):
+    # Decompresses gzip, xz and zstd files as they are read, so archived MHLs never have to be unpacked to disk first
+    compression = detect_compression(mhl_path)
+    if compression == 'gz':
+        mhl_input = gzip.open(mhl_path, 'rb')
+    elif compression == 'xz':
+        mhl_input = lzma.open(mhl_path, 'rb')
+    elif compression == 'zst':
+        if zstandard is None:
+            raise RuntimeError(f"{mhl_path} is zstd compressed, reading it needs the zstandard package (pip3 install zstandard)")
+        mhl_input = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(mhl_path, 'rb'), closefd=True))
+    else:
+        mhl_input = open(mhl_path, 'rb')
+    if read_ahead_bytes:
+        return io.BufferedReader(ReadAheadFile(mhl_input, read_ahead_bytes))
+    return mhl_input
+
+
+def open_text(path):
+    # CSVs and other text files, decompressed as they are read when gzip, xz or zstd compressed, like MHLs
+    return io.TextIOWrapper(open_mhl(path), encoding='utf-8', newline='')
+
+
+def read_mhl(mhl_path):
+    with open_mhl(mhl_path) as mhl_input:
+        return mhl_input.read()
+
+
+# Listings of every directory searched for MHLs, reused while a directory's modified time is unchanged
+def load_discovery_cache(cache_location):
+    if not os.path.isfile(cache_location):
+        return {}
+    try:
+        with open(cache_location) as cache_file:
+            return json.load(cache_file)
+    except ValueError:
+        return {}
+
+
+def save_discovery_cache(cache_location, cache):
+    os.makedirs(os.path.dirname(cache_location), exist_ok=True)
+    # Written to a temporary file first so an interrupted run never leaves a half written cache
+    with open(cache_location + ".tmp", 'w') as cache_file:
+        json.dump(cache, cache_file)
+    os.replace(cache_location + ".tmp", cache_location)
+
+
+def list_mhl_directory(directory, cache, new_cache):
+    # Returns the subdirectories and MHLs in a directory. Adding or removing a file changes the directory's
+    # modified time, so an unchanged directory is taken from the cache without listing it again.
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        return [], []
+    cached = cache.get(directory)
+    if cached and cached['mtime'] == mtime:
+        subdirectories, mhls = cached['dirs'], cached['mhls']
+    else:
+        subdirectories, mhls = [], []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.name)
+                elif entry.name.endswith(MHL_SUFFIXES):
+                    mhls.append(entry.name)
+    new_cache[directory] = {'mtime': mtime, 'dirs': subdirectories, 'mhls': mhls}
+    return subdirectories, mhls
+
+
+def matches_patterns(top, path, patterns):
+    # Globs match either the name or the path relative to the directory given, eg: *_LTO.mhl or */Proxy
+    relative_path = os.path.relpath(path, top)
+    return any(fnmatch.fnmatch(os.path.basename(path), pattern) or fnmatch.fnmatch(relative_path, pattern) for pattern in patterns)
+
+
+def find_mhls(top, cache, new_cache, executor, include_patterns=(), exclude_patterns=()):
+    # Walks the tree a level at a time, listing all the directories of a level at once so a NAS is not waited on one folder at a time
+    mhl_file_list = []
+    level = [top]
+    while level:
+        next_level = []
+        for directory, (subdirectories, mhls) in zip(level, executor.map(lambda directory: list_mhl_directory(directory, cache, new_cache), level)):
+            for name in mhls:
+                path = os.path.join(directory, name)
+                if (not include_patterns or matches_patterns(top, path, include_patterns)) and not matches_patterns(top, path, exclude_patterns):
+                    mhl_file_list.append(path)
+            next_level += [os.path.join(directory, name) for name in subdirectories if not matches_patterns(top, os.path.join(directory, name), exclude_patterns)]
+        level = next_level
+    return sorted(mhl_file_list)
+
+
+# checks for dir, makes list of mhl files in it and all its subdirectories if so, else returns input list.
+# use_cache False lists every directory again, the new listings are still saved for the next run.
+def get_mhl_file_paths(input_paths, cache_location, use_cache=True, include_patterns=(), exclude_patterns=(), discovery_workers=8):
+    mhl_file_list = []
+    cache = load_discovery_cache(cache_location) if use_cache else {}
+    new_cache = {}
+
+    with ThreadPoolExecutor(max_workers=discovery_workers) as executor:
+        for mhl in input_paths:
+            if os.path.isdir(mhl):
+                top = os.path.abspath(mhl)
+                mhl_file_list += find_mhls(top, cache, new_cache, executor, include_patterns, exclude_patterns)
+                # Directories under this one that were not reached this time no longer exist
+                cache = {directory: listing for directory, listing in cache.items() if directory != top and not directory.startswith(top + os.sep)}
+            elif mhl.endswith(MHL_SUFFIXES):
+                mhl_file_list.append(mhl)
+
+    cache.update(new_cache)
+    if new_cache:
+        save_discovery_cache(cache_location, cache)
+    return mhl_file_list
+
+
+# Yields (path, open MHL) of each MHL in order. The current MHL and the next prefetch_files are opened together and each
+# is read (and decompressed) ahead on its own thread, sharing prefetch_max_bytes of decompressed data, so on an SMB/NFS
+# share the network is read while the CPU parses instead of each waiting on the other. However well an MHL compresses,
+# no more than its share is held in memory ahead of the parser. Opening errors (eg: a missing MHL) are raised when that
+# MHL is reached. open_function(path, read_ahead_bytes) can open an MHL another way, returning None for nothing to open
+# or a memory mapping, which is left open for whatever is still reading from it.
+def prefetch_mhls(mhl_paths, prefetch_files=4, prefetch_max_bytes=512 * 1024 * 1024, open_function=open_mhl):
+    read_ahead_bytes = prefetch_max_bytes // (prefetch_files + 1) if prefetch_files else None
+    pending = deque()
+    next_index = 0
+    try:
+        while pending or next_index < len(mhl_paths):
+            while next_index < len(mhl_paths) and len(pending) <= prefetch_files:
+                try:
+                    mhl_file = open_function(mhl_paths[next_index], read_ahead_bytes)
+                except (OSError, RuntimeError) as error:
+                    mhl_file = error
+                pending.append((mhl_paths[next_index], mhl_file))
+                next_index += 1
+            mhl_path, mhl_file = pending.popleft()
+            if isinstance(mhl_file, Exception):
+                raise mhl_file
+            try:
+                yield mhl_path, mhl_file
+            finally:
+                if mhl_file is not None and not isinstance(mhl_file, mmap.mmap):
+                    mhl_file.close()
+    finally:
+        # Stops the read-ahead of MHLs that were never reached, eg: after --fail-fast
+        for mhl_path, mhl_file in pending:
+            if mhl_file is not None and not isinstance(mhl_file, Exception):
+                mhl_file.close()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+__program_name__ = "ASC MHL Writer"
+__description__ = "Writes a verification report as a new ASC MHL v2 generation in the ascmhl folder of the verified volume."
+__author__ = "Josh Unwin/Gary Palmer"
+__version__ = "0.1"
+
+import csv
+import hashlib
+import os
+import re
+import socket
+import sys
+import argparse
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
+
+from source_destination_mhl_compare import find_ascmhl_folder, open_input, read_ascmhl_chain, ASCMHL_FOLDER, ASCMHL_CHAIN_FILE, ASC_MHL_DIRECTORY_NAMESPACE
+from source_destination_mhl_compare import BLUE, DEFAULT, GREEN, ORANGE
+
+ASC_MHL_NAMESPACE = "urn:ASC:MHL:v2.0"
+C4_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+# Report status to the ASC MHL action recorded against the hash. Unfound files have nothing to record.
+STATUS_ACTIONS = {'MATCHED': 'verified', 'MISMATCHED': 'failed'}
+# Summarised image sequence rows (eg: A001C001.0000001-0000100.ari) describe a whole clip, not a file on disk
+IMAGE_SEQ_CLIP_ROW = re.compile(r'(\.\d+-\d+\.(ari|arx)|R\d{5}-R\d{5}\.dng)$')
+
+
+def mhl_date(timestamp=None):
+    moment = datetime.fromtimestamp(timestamp, timezone.utc) if timestamp is not None else datetime.now(timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+def c4_id(path):
+    # C4 ID (SMPTE ST 2114) of a file: "c4" followed by the base58 SHA-512, as ascmhl uses to chain generations
+    sha512 = hashlib.sha512()
+    with open(path, 'rb') as mhl_file:
+        for chunk in iter(lambda: mhl_file.read(1024 * 1024), b''):
+            sha512.update(chunk)
+    number = int.from_bytes(sha512.digest(), 'big')
+    characters = []
+    while number:
+        number, remainder = divmod(number, 58)
+        characters.append(C4_ALPHABET[remainder])
+    return "c4" + "".join(reversed(characters)).rjust(88, "1")
+
+
+def write_chain(ascmhl_folder, chain):
+    # Written to a temporary file first so an interrupted run never leaves a half written chain
+    chain_path = os.path.join(ascmhl_folder, ASCMHL_CHAIN_FILE)
+    with open(chain_path + ".tmp", 'w', encoding='utf-8') as chain_file:
+        chain_file.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<ascmhldirectory xmlns="{ASC_MHL_DIRECTORY_NAMESPACE}">\n')
+        for sequence_number, path, c4 in chain:
+            chain_file.write(f'  <hashlist sequencenr="{sequence_number}">\n    <path>{escape(path)}</path>\n    <c4>{c4}</c4>\n  </hashlist>\n')
+        chain_file.write('</ascmhldirectory>\n')
+    os.replace(chain_path + ".tmp", chain_path)
+
+
+class AscMhlWriter:
+    # Streams <hash> elements straight to disk, so memory use stays the same however many files are written.
+    # The generation only gets its final name and a place in the chain once it is closed without an error.
+    def __init__(self, root, process="in-place"):
+        self.root = os.path.abspath(root)
+        self.ascmhl_folder = os.path.join(self.root, ASCMHL_FOLDER)
+        os.makedirs(self.ascmhl_folder, exist_ok=True)
+        self.chain = read_ascmhl_chain(self.ascmhl_folder) if find_ascmhl_folder(self.ascmhl_folder) else []
+        self.sequence_number = max([entry[0] for entry in self.chain], default=0) + 1
+        self.creation_date = datetime.now(timezone.utc)
+        self.generation_name = f"{self.sequence_number:04d}_{os.path.basename(self.root)}_{self.creation_date.strftime('%Y-%m-%d_%H%M%SZ')}.mhl"
+        self.generation_path = os.path.join(self.ascmhl_folder, self.generation_name)
+        self.hash_count = 0
+        self.mhl_file = open(self.generation_path + ".tmp", 'w', encoding='utf-8')
+        self.mhl_file.write(
+            f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<hashlist version="2.0" xmlns="{ASC_MHL_NAMESPACE}">\n'
+            f'  <creatorinfo>\n'
+            f'    <creationdate>{self.creation_date.strftime("%Y-%m-%dT%H:%M:%S+00:00")}</creationdate>\n'
+            f'    <hostname>{escape(socket.gethostname())}</hostname>\n'
+            f'    <tool version="{__version__}">{escape(__program_name__)}</tool>\n'
+            f'  </creatorinfo>\n'
+            f'  <processinfo>\n'
+            f'    <process>{process}</process>\n'
+            f'  </processinfo>\n'
+            f'  <hashes>\n'
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add_hash(self, path, size, hashes, action, hashdate="", lastmodificationdate=""):
+        # path is relative to the root, hashes is {hash format: checksum} eg: {"xxh64": "0ea03b369a463d9d"}
+        modified = f' lastmodificationdate={quoteattr(lastmodificationdate)}' if lastmodificationdate else ""
+        self.mhl_file.write(f'    <hash>\n      <path size="{size}"{modified}>{escape(path)}</path>\n')
+        for hash_format, checksum in hashes.items():
+            self.mhl_file.write(f'      <{hash_format} action="{action}" hashdate={quoteattr(hashdate or mhl_date())}>{checksum.lower()}</{hash_format}>\n')
+        self.mhl_file.write('    </hash>\n')
+        self.hash_count += 1
+
+    def add_report_row(self, row):
+        # Records a verification report row (OUTPUT_CSV_HEADER) against the file on disk. Returns False for rows with nothing to record.
+        if row[0] not in STATUS_ACTIONS or len(row) < 11 or IMAGE_SEQ_CLIP_ROW.search(row[6]):
+            return False
+        path = self.relative_path(row[6])
+        hashes = {hash_format: checksum for hash_format, checksum in (("xxh64", row[8]), ("md5", row[9])) if checksum}
+        if not hashes:
+            return False
+        try:
+            lastmodificationdate = mhl_date(os.stat(os.path.join(self.root, path)).st_mtime)
+        except OSError:
+            lastmodificationdate = ""
+        self.add_hash(path, row[7], hashes, STATUS_ACTIONS[row[0]], row[10], lastmodificationdate)
+        return True
+
+    def relative_path(self, path):
+        if os.path.isabs(path) and os.path.abspath(path).startswith(self.root + os.sep):
+            return os.path.relpath(path, self.root)
+        return path
+
+    def close(self):
+        self.mhl_file.write('  </hashes>\n</hashlist>\n')
+        self.mhl_file.close()
+        os.replace(self.generation_path + ".tmp", self.generation_path)
+        self.chain.append((self.sequence_number, self.generation_name, c4_id(self.generation_path)))
+        write_chain(self.ascmhl_folder, self.chain)
+
+    def abort(self):
+        self.mhl_file.close()
+        os.remove(self.generation_path + ".tmp")
+
+
+def write_mhl_from_report(report_path, root):
+    # Reads the report a row at a time, so a 5M row report is written without holding it in memory
+    skipped_rows = 0
+    with open_input(report_path, text=True) as report_file, AscMhlWriter(root) as writer:
+        csv_reader = csv.reader(report_file)
+        next(csv_reader, None)
+        for row in csv_reader:
+            if not writer.add_report_row(row):
+                skipped_rows += 1
+    return writer, skipped_rows
+
+
+def args_parse(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('report', help="A verification report CSV from source_destination_mhl_compare.py or mhl_rehash.py (can be compressed)")
+    parser.add_argument('-r', '--root', required=True, help="The root of the verified volume, the new generation is written to its ascmhl folder")
+    return parser.parse_args(argv[1:]) # skip the first argument (the script name)
+
+
+def main(argv):
+    arguments = args_parse(argv)
+    print(f"\t{BLUE}\n{__program_name__} v{__version__} | {__author__}{DEFAULT}")
+    writer, skipped_rows = write_mhl_from_report(arguments.report, arguments.root)
+    print(f"\n\t{GREEN}\u2713{DEFAULT} Hashes written: {writer.hash_count}")
+    print(f"\t{ORANGE}?{DEFAULT} Rows skipped (unfound, summarised image sequences or no checksum): {skipped_rows}")
+    print(f"\n\tASC MHL generation {writer.sequence_number} has been saved to {writer.generation_path}")
+
+    # Counts returned when running tests
+    if __name__ != '__main__':
+        return {
+            "generation_path": writer.generation_path,
+            "sequence_number": writer.sequence_number,
+            "hash_count": writer.hash_count,
+            "skipped_rows": skipped_rows,
+        }
+
+
+# Runs when opened from command line, passing sys.argv through to allow tests to run script
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+__program_name__ = "MHL Re-hash Benchmark"
+__description__ = "Compares the read-ahead hashing in mhl_rehash.py with a plain read loop on one large file."
+__author__ = "Josh Unwin/Gary Palmer"
+__version__ = "0.1"
+
+import os
+import sys
+import argparse
+import tempfile
+import time
+import xxhash
+
+import mhl_rehash
+from source_destination_mhl_compare import BLUE, DEFAULT, GREEN
+
+
+def args_parse(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', nargs='?', help="A large media file to hash. A temporary file is written when not given")
+    parser.add_argument('--size', type=int, default=2048, help="Size of the temporary file in MiB (default 2048)")
+    parser.add_argument('--runs', type=int, default=3, help="Runs of each method, the fastest is reported (default 3)")
+    return parser.parse_args(argv[1:]) # skip the first argument (the script name)
+
+
+def write_test_file(path, size_mib):
+    chunk = os.urandom(1024 * 1024)
+    with open(path, 'wb') as test_file:
+        for _ in range(size_mib):
+            test_file.write(chunk)
+        test_file.flush()
+        os.fsync(test_file.fileno())
+
+
+def evict_from_page_cache(path):
+    # Each run should read from disk, not from what the previous run left in the cache
+    if hasattr(os, 'posix_fadvise'):
+        with open(path, 'rb') as media_file:
+            os.posix_fadvise(media_file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def plain_read_loop(path):
+    hasher = xxhash.xxh64()
+    with open(path, 'rb') as media_file:
+        for chunk in iter(lambda: media_file.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def read_ahead(path):
+    return mhl_rehash.hash_file(path)[1]
+
+
+def fastest_run(method, path, runs):
+    timings = []
+    for _ in range(runs):
+        evict_from_page_cache(path)
+        start_time = time.perf_counter()
+        digest = method(path)
+        timings.append(time.perf_counter() - start_time)
+    return min(timings), digest
+
+
+def main(argv):
+    arguments = args_parse(argv)
+    print(f"\t{BLUE}\n{__program_name__} v{__version__} | {__author__}{DEFAULT}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = arguments.file
+        if not path:
+            path = os.path.join(temp_dir, 'benchmark.bin')
+            print(f"\tWriting {arguments.size} MiB test file...")
+            write_test_file(path, arguments.size)
+        size = os.path.getsize(path)
+        plain_seconds, plain_digest = fastest_run(plain_read_loop, path, arguments.runs)
+        read_ahead_seconds, read_ahead_digest = fastest_run(read_ahead, path, arguments.runs)
+
+    assert plain_digest == read_ahead_digest, "Read-ahead hash does not match the plain read loop"
+    print(f"\tPlain read loop: {size / plain_seconds / 1000000:.0f} MB/s ({plain_seconds:.2f}s)")
+    print(f"\tRead-ahead:      {size / read_ahead_seconds / 1000000:.0f} MB/s ({read_ahead_seconds:.2f}s)")
+    print(f"\t{GREEN}Speed-up: {plain_seconds / read_ahead_seconds:.2f}x{DEFAULT}\n")
+
+    if __name__ != '__main__':
+        return {"plain_seconds": plain_seconds, "read_ahead_seconds": read_ahead_seconds}
+
+
+# Runs when opened from command line, passing sys.argv through
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+__program_name__ = "Duplicate Media Finder"
+__description__ = "Finds camera media duplicated across drives, RAIDs and MHLs by size, MHL checksum, partial hash and full hash. Exports a CSV report."
+__author__ = "Josh Unwin/Gary Palmer"
+__version__ = "0.1"
+
+import csv
+import hashlib
+import os
+import sys
+import argparse
+import time
+import xxhash
+from concurrent.futures import ThreadPoolExecutor
+
+import mhl_rehash
+import source_destination_mhl_compare as mhl_compare
+import volume_inventory
+from source_destination_mhl_compare import BLUE, DEFAULT, YELLOW, GREEN, ORANGE
+
+SAVE_LOCATION = os.path.expanduser("~/Desktop/MHL_Verification_Reports/")
+# Bytes read from the start and end of each file for the partial hash
+PARTIAL_HASH_BYTES = 1024 * 1024
+# Files smaller than this are left out, empty files would all be duplicates of each other
+MIN_SIZE = 1
+HASH_WORKERS = 8
+COMPRESS_OUTPUT = None
+DUPLICATES_CSV_HEADER = ['Group', 'Size', 'Checksum', 'Copies', 'Reclaimable Bytes', 'Location', 'File']
+duplicate_groups = []
+total_files = 0
+size_candidate_files = 0
+partial_hashed_files = 0
+full_hashed_files = 0
+unsupported_checksum_files = 0
+unreadable_files = []
+
+
+def args_parse(argv):
+    global SAVE_LOCATION
+    global PARTIAL_HASH_BYTES
+    global MIN_SIZE
+    global HASH_WORKERS
+    global COMPRESS_OUTPUT
+    parser = argparse.ArgumentParser()
+    parser.add_argument('locations', nargs='+', help="Volumes or folders to walk, and MHLs to read checksums from")
+    parser.add_argument('-o', '--output-dir', default=SAVE_LOCATION, help="Directory to save the report CSV to")
+    parser.add_argument('--partial-mib', type=float, default=PARTIAL_HASH_BYTES / (1024 * 1024), help="MiB read from the start and end of each file for the partial hash (default 1)")
+    parser.add_argument('--min-size', type=int, default=MIN_SIZE, help="Leave out files smaller than this many bytes (default 1)")
+    parser.add_argument('--workers', type=int, default=HASH_WORKERS, help="Files hashed at once (default 8)")
+    parser.add_argument('--compress', choices=['gz', 'xz', 'zst'], help="Compress the report CSV")
+    parsed_arguments = parser.parse_args(argv[1:]) # skip the first argument (the script name)
+    SAVE_LOCATION = parsed_arguments.output_dir
+    PARTIAL_HASH_BYTES = max(int(parsed_arguments.partial_mib * 1024 * 1024), 1)
+    MIN_SIZE = parsed_arguments.min_size
+    HASH_WORKERS = parsed_arguments.workers
+    COMPRESS_OUTPUT = parsed_arguments.compress
+    return parsed_arguments
+
+
+def mhl_checksums(mhl_hash):
+    # ("xxh64:...", "md5:...") for whichever of the two the MHL entry has, xxHash first
+    checksums = []
+    if mhl_hash.xxhash64be:
+        checksums.append("xxh64:" + mhl_hash.xxhash64be.lower())
+    if mhl_hash.md5:
+        checksums.append("md5:" + mhl_hash.md5.lower())
+    return tuple(checksums)
+
+
+def gather_candidates(locations):
+    # {size: [(location index, path, checksums or None)]}. Files on disk have no checksum yet, MHL entries do.
+    # A file listed more than once in an MHL is one file, the last entry wins.
+    global total_files
+    global unsupported_checksum_files
+    candidates = {}
+    for location_index, location in enumerate(locations):
+        if os.path.isdir(location) and not mhl_compare.find_ascmhl_folder(location):
+            print(f"\t{DEFAULT}Scanning {location}...")
+            files = {path: (size, None) for path, (size, mtime) in volume_inventory.scan_volume(location)[0].items()}
+        else:
+            print(f"\t{DEFAULT}Reading {location}...")
+            files = {}
+            unsupported = set()
+            for mhl_hash in mhl_compare.parse_mhl_hashes(location):
+                if mhl_hash.file and mhl_hash.size:
+                    checksums = mhl_checksums(mhl_hash)
+                    if checksums:
+                        files[mhl_hash.file] = (int(mhl_hash.size), checksums)
+                        unsupported.discard(mhl_hash.file)
+                    else:
+                        # eg: only a C4 or SHA1 checksum, which nothing else can be compared with
+                        files.pop(mhl_hash.file, None)
+                        unsupported.add(mhl_hash.file)
+            if unsupported:
+                print(f"\t{YELLOW}{len(unsupported)} files in {location} have no xxHash or MD5 checksum and are left out{DEFAULT}")
+            unsupported_checksum_files += len(unsupported)
+        total_files += len(files)
+        for path, (size, checksum) in files.items():
+            if size >= MIN_SIZE:
+                candidates.setdefault(size, []).append((location_index, path, checksum))
+    return candidates
+
+
+def partial_hash(path):
+    # Hashes the first and last PARTIAL_HASH_BYTES, which separates most same-size clips and frames for very little reading
+    hasher = xxhash.xxh64()
+    try:
+        with open(path, 'rb') as media_file:
+            size = os.fstat(media_file.fileno()).st_size
+            hasher.update(media_file.read(PARTIAL_HASH_BYTES))
+            if size > PARTIAL_HASH_BYTES:
+                media_file.seek(max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES))
+                hasher.update(media_file.read())
+    except OSError:
+        return None
+    return hasher.hexdigest()
+
+
+def full_hash(path, algorithm='xxh64'):
+    hasher = hashlib.md5() if algorithm == 'md5' else xxhash.xxh64()
+    try:
+        return f"{algorithm}:" + mhl_rehash.hash_file(path, hasher=hasher)[1]
+    except OSError:
+        return None
+
+
+def hash_paths(executor, hash_function, paths):
+    # {path: digest}, files that could not be read (eg: a decomposed unicode name that no longer opens once normalised) are reported and left out
+    digests = {}
+    for path, digest in zip(paths, executor.map(hash_function, paths)):
+        if digest is None:
+            print(f"\t{YELLOW}Could not read {path}, left out{DEFAULT}")
+            unreadable_files.append(path)
+        else:
+            digests[path] = digest
+    return digests
+
+
+def resolve_size_group(executor, size, members, locations):
+    # Narrows one size group down to its duplicate groups, reading as little media as possible:
+    # MHL entries already have a checksum, files on disk get a partial hash first and are only hashed in full when
+    # their partial hash collides with another file on disk, or there is an MHL entry of the same size to compare with.
+    global partial_hashed_files
+    global full_hashed_files
+    disk_paths = sorted(os.path.join(locations[location_index], path) for location_index, path, checksums in members if checksums is None)
+    mhl_checksum_sets = [checksums for location_index, path, checksums in members if checksums is not None]
+    if disk_paths:
+        partial_digests = hash_paths(executor, partial_hash, disk_paths)
+        partial_hashed_files += len(partial_digests)
+        digest_counts = {}
+        for digest in partial_digests.values():
+            digest_counts[digest] = digest_counts.get(digest, 0) + 1
+        disk_paths = [path for path, digest in partial_digests.items() if mhl_checksum_sets or digest_counts[digest] > 1]
+    # Files on disk are hashed with xxHash, and with MD5 as well when an MHL entry of the same size only has an MD5
+    algorithms = ['xxh64']
+    if any(not checksums[0].startswith('xxh64:') for checksums in mhl_checksum_sets):
+        algorithms = ['md5'] if all(not checksums[0].startswith('xxh64:') for checksums in mhl_checksum_sets) else ['xxh64', 'md5']
+    disk_checksums = {}
+    for algorithm in algorithms:
+        for disk_path, digest in hash_paths(executor, lambda disk_path: full_hash(disk_path, algorithm), disk_paths).items():
+            disk_checksums[disk_path] = disk_checksums.get(disk_path, ()) + (digest,)
+    full_hashed_files += len(disk_checksums)
+
+    member_checksums = []
+    for location_index, path, checksums in members:
+        checksums = checksums or disk_checksums.get(os.path.join(locations[location_index], path))
+        if checksums:
+            member_checksums.append((location_index, path, checksums))
+    # Anything with both checksums links the MD5 to the xxHash, so MD5 only entries group with xxHash ones
+    md5_to_xxh64 = {checksums[1]: checksums[0] for location_index, path, checksums in member_checksums if len(checksums) == 2}
+    groups = {}
+    for location_index, path, checksums in member_checksums:
+        checksum = md5_to_xxh64.get(checksums[0], checksums[0])
+        groups.setdefault(checksum, []).append((location_index, path))
+    return [(size, checksum, sorted(copies)) for checksum, copies in groups.items() if len(copies) > 1]
+
+
+def find_duplicates(locations):
+    global size_candidate_files
+    candidates = gather_candidates(locations)
+    # Sizes only one file has cannot be duplicated, most clips drop out here without being read
+    size_groups = {size: members for size, members in candidates.items() if len(members) > 1}
+    del candidates
+    size_candidate_files = sum(len(members) for members in size_groups.values())
+    print(f"\t{DEFAULT}{size_candidate_files} of {total_files} files share a size with another file")
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+        for size in sorted(size_groups):
+            duplicate_groups.extend(resolve_size_group(executor, size, size_groups.pop(size), locations))
+    # Biggest savings first
+    duplicate_groups.sort(key=lambda group: (-group[0] * (len(group[2]) - 1), group[1]))
+
+
+def reclaimable_bytes(group):
+    size, checksum, copies = group
+    return size * (len(copies) - 1)
+
+
+def export_duplicates_csv(output_report_csv_name, locations):
+    report_path = SAVE_LOCATION + output_report_csv_name + (f".{COMPRESS_OUTPUT}" if COMPRESS_OUTPUT else "")
+    with mhl_compare.open_output(report_path, COMPRESS_OUTPUT) as new_file:
+        csv_writer = csv.writer(new_file)
+        csv_writer.writerow(DUPLICATES_CSV_HEADER)
+        for group_number, group in enumerate(duplicate_groups, start=1):
+            size, checksum, copies = group
+            for location_index, path in copies:
+                csv_writer.writerow([group_number, size, checksum, len(copies), reclaimable_bytes(group), locations[location_index], path])
+
+    total_reclaimable_bytes = sum(reclaimable_bytes(group) for group in duplicate_groups)
+    print(f"\n\t{YELLOW}={DEFAULT} Files partially hashed: {partial_hashed_files}")
+    print(f"\t{YELLOW}={DEFAULT} Files fully hashed: {full_hashed_files}")
+    if unsupported_checksum_files:
+        print(f"\t{YELLOW}={DEFAULT} MHL entries left out without an xxHash or MD5 checksum: {unsupported_checksum_files}")
+    if unreadable_files:
+        print(f"\t{YELLOW}={DEFAULT} Files left out that could not be read: {len(unreadable_files)}")
+    print(f"\t{ORANGE}?{DEFAULT} Duplicate groups: {len(duplicate_groups)} ({sum(len(group[2]) for group in duplicate_groups)} files)")
+    print(f"\t{GREEN}\u2713{DEFAULT} Reclaimable: {total_reclaimable_bytes / 1000000000:.2f} GB ({total_reclaimable_bytes} bytes)")
+    print(f"\n\tDuplicate check complete. Output report CSV has been saved to {report_path}")
+
+
+def create_save_directory():
+    if not os.path.isdir(SAVE_LOCATION):
+        os.mkdir(SAVE_LOCATION)
+
+
+def main(argv):
+    arguments = args_parse(argv)
+    print(f"\t{BLUE}\n{__program_name__} v{__version__} | {__author__}{DEFAULT}")
+    create_save_directory()
+    locations = [location.rstrip('/') or '/' for location in arguments.locations]
+    start_time = time.time()
+    find_duplicates(locations)
+    print(f"\t{DEFAULT}Checked {total_files} files in {time.time() - start_time:.1f}s")
+    output_report_csv_name = "_".join(os.path.basename(location).split('.')[0] for location in locations) + "_duplicates.csv"
+    export_duplicates_csv(output_report_csv_name, locations)
+
+    # Counts returned when running tests
+    if __name__ != '__main__':
+        return {
+            "total_files": total_files,
+            "size_candidate_files": size_candidate_files,
+            "partial_hashed_files": partial_hashed_files,
+            "full_hashed_files": full_hashed_files,
+            "unsupported_checksum_files": unsupported_checksum_files,
+            "unreadable_file_count": len(unreadable_files),
+            "duplicate_group_count": len(duplicate_groups),
+            "reclaimable_bytes": sum(reclaimable_bytes(group) for group in duplicate_groups),
+        }
+
+
+# Runs when opened from command line, passing sys.argv through to allow tests to run script
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
+
+
+def reset_for_tests():
+    # Tests dont run independently, so we need to reset the global variables
+    global SAVE_LOCATION
+    global PARTIAL_HASH_BYTES
+    global MIN_SIZE
+    global HASH_WORKERS
+    global COMPRESS_OUTPUT
+    global duplicate_groups
+    global total_files
+    global size_candidate_files
+    global partial_hashed_files
+    global full_hashed_files
+    global unsupported_checksum_files
+    global unreadable_files
+    volume_inventory.reset_for_tests()
+    SAVE_LOCATION = os.path.expanduser("~/Desktop/MHL_Verification_Reports/")
+    PARTIAL_HASH_BYTES = 1024 * 1024
+    MIN_SIZE = 1
+    HASH_WORKERS = 8
+    COMPRESS_OUTPUT = None
+    duplicate_groups = []
+    total_files = 0
+    size_candidate_files = 0
+    partial_hashed_files = 0
+    full_hashed_files = 0
+    unsupported_checksum_files = 0
+    unreadable_files = []
@@ -0,0 +1,794 @@
+#!/usr/bin/env python3
+
+__program_name__ = "MHL Media Re-hash"
+__description__ = "Re-hashes the media listed in an MHL from a root directory on disk and checks the checksums match the MHL. Exports a CSV report."
+__author__ = "Josh Unwin/Gary Palmer"
+__version__ = "0.1"
+
+import csv
+import fcntl
+import hashlib
+import json
+import math
+import os
+import queue
+import random
+import sys
+import argparse
+import subprocess
+import threading
+import time
+import xxhash
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+import source_destination_mhl_compare as mhl_compare
+from ascmhl_writer import AscMhlWriter
+from source_destination_mhl_compare import FileHash, BLUE, DEFAULT, YELLOW, GREEN, RED, ORANGE
+
+USE_MD5 = False
+SAVE_LOCATION = os.path.expanduser("~/Desktop/MHL_Verification_Reports/")
+# Files hashed at once per physical device. Spinning disks thrash with more than one reader.
+DEVICE_CLASS_WORKERS = {'hdd': 1, 'ssd': 8, 'network': 4}
+# Files hashed at once on every device whatever its class, None sizes each device by its class
+HASH_WORKERS = None
+NETWORK_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'afpfs', 'webdav', 'fuse.sshfs', 'fuse.rclone')
+HASH_ORDER = 'inode'
+PROGRESS_SECONDS = 5
+READ_BUFFER_SIZE = 8 * 1024 * 1024
+# Files at least this big are read by a separate reader thread into a ring of buffers while the last one is hashed
+READ_AHEAD_MIN_SIZE = 64 * 1024 * 1024
+READ_AHEAD_BUFFERS = 4
+# Completed files are flushed to disk in the journal at least this often, so a crash or unplugged drive loses little work
+JOURNAL_SYNC_SECONDS = 30
+# Percentage of frames re-hashed per image sequence clip, None hashes every frame
+SAMPLE_PERCENT = None
+SAMPLE_SEED = 0
+SAMPLE_CONFIDENCE = 0.95
+# Quick check hashes only the first and last QUICK_CHECK_MIB of each file, None runs a full re-hash
+QUICK_CHECK_MIB = None
+# A file whose last block is all zeros has most likely been zero-filled by a failed copy or restore
+ZERO_TAIL_BYTES = 64 * 1024
+# Compression for report CSVs, None writes plain CSVs
+COMPRESS_OUTPUT = None
+QUICK_CSV_HEADER = ['Status', 'File', 'MHL Size', 'Disk Size', 'Partial Hash', 'Reason']
+total_bytes_hashed = 0
+device_stats = {}
+device_stats_lock = threading.Lock()
+output_csv_matched_list = []
+output_csv_mismatched_list = []
+output_csv_unfound_list = []
+sample_stats = {"clips": 0, "frames": 0, "sampled_frames": 0, "random_frames": 0}
+quick_ok_list = []
+quick_flagged_list = []
+
+# Read buffers are allocated once per worker thread and reused for every file that thread hashes
+thread_buffers = threading.local()
+
+
+def parse_device_workers(value):
+    # eg: "hdd=1,ssd=8,network=4"
+    device_class_workers = dict(DEVICE_CLASS_WORKERS)
+    for item in value.split(","):
+        device_class, workers = item.split("=")
+        if device_class.strip() not in device_class_workers:
+            raise argparse.ArgumentTypeError(f"Unknown device class {device_class}, use one of {', '.join(device_class_workers)}")
+        device_class_workers[device_class.strip()] = int(workers)
+    return device_class_workers
+
+
+def args_parse(argv):
+    global USE_MD5
+    global SAVE_LOCATION
+    global DEVICE_CLASS_WORKERS
+    global HASH_WORKERS
+    global HASH_ORDER
+    global SAMPLE_PERCENT
+    global SAMPLE_SEED
+    global QUICK_CHECK_MIB
+    global COMPRESS_OUTPUT
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mhls', nargs='*', help="One or more MHLs listing the media to re-hash")
+    parser.add_argument('-r', '--root', nargs='+', help="The directory the paths in the MHL are relative to (eg: the root of the restored volume). Give one root for all MHLs or one per MHL")
+    parser.add_argument('-o', '--output-dir', help="The directory to save the output CSV file to.", default=SAVE_LOCATION)
+    parser.add_argument('--device-workers', type=parse_device_workers, default=DEVICE_CLASS_WORKERS, help="Files hashed at once per device for each device class (default hdd=1,ssd=8,network=4)")
+    parser.add_argument('-w', '--workers', type=int, help="Files hashed at once on every device, overriding --device-workers")
+    parser.add_argument('--journal', help="Where to write the journal of hashed files (default <mhl>_rehash_journal.jsonl next to the report)")
+    parser.add_argument('--resume', action='store_true', help="Carry on from the journal, skipping files already hashed whose size and modified time are unchanged")
+    parser.add_argument('--report-from-journal', metavar='JOURNAL', help="Write the report from a journal alone, without reading any MHLs or media")
+    parser.add_argument('--sample', type=float, metavar='PERCENT', help="Only re-hash this percentage of the frames of each image sequence clip (always including the first and last frame)")
+    parser.add_argument('--seed', type=int, default=SAMPLE_SEED, help="Seed for picking sampled frames, the same seed picks the same frames (default 0)")
+    parser.add_argument('--quick', nargs='?', type=int, const=4, metavar='MiB', help="Quick check for truncated files: compare sizes with the MHL and only hash the first and last N MiB of each file (default 4)")
+    parser.add_argument('--quick-cache', help="Where to keep the partial checksums of quick checks (default quick_check_cache.json next to the report)")
+    parser.add_argument('--write-mhl', action='store_true', help="Also write the results as a new ASC MHL v2 generation in the ascmhl folder of the root")
+    parser.add_argument('--order', choices=['inode', 'path'], default=HASH_ORDER, help="Order files are read in on each device (default inode)")
+    parser.add_argument('--compress', choices=['gz', 'xz', 'zst'], help="Compress the report CSVs")
+    checksum_type_group = parser.add_mutually_exclusive_group()
+    checksum_type_group.add_argument('--xxhash', help="Use xxHash checksum (default)")
+    checksum_type_group.add_argument('--md5', action='store_true', help="Use md5 checksum")
+    parsed_arguments = parser.parse_args(argv[1:]) # skip the first argument (the script name)
+    if parsed_arguments.report_from_journal:
+        if parsed_arguments.mhls or parsed_arguments.root:
+            parser.error("--report-from-journal does not take MHLs or --root")
+    elif not parsed_arguments.mhls or not parsed_arguments.root:
+        parser.error("Provide one or more MHLs and --root")
+    elif len(parsed_arguments.root) not in (1, len(parsed_arguments.mhls)):
+        parser.error("Provide one --root for all MHLs or one per MHL")
+    if parsed_arguments.write_mhl and (parsed_arguments.report_from_journal or parsed_arguments.quick is not None or len(parsed_arguments.root) != 1):
+        parser.error("--write-mhl needs a single --root and a full re-hash")
+    if parsed_arguments.compress == 'zst' and mhl_compare.zstandard is None:
+        parser.error("Writing .zst reports needs the zstandard package (pip3 install zstandard)")
+    if parsed_arguments.workers is not None and parsed_arguments.workers < 1:
+        parser.error("--workers must be at least 1")
+    if parsed_arguments.sample is not None and not 0 < parsed_arguments.sample <= 100:
+        parser.error("--sample must be a percentage between 0 and 100")
+    USE_MD5 = parsed_arguments.md5
+    SAVE_LOCATION = parsed_arguments.output_dir
+    DEVICE_CLASS_WORKERS = parsed_arguments.device_workers
+    HASH_WORKERS = parsed_arguments.workers
+    HASH_ORDER = parsed_arguments.order
+    SAMPLE_PERCENT = parsed_arguments.sample
+    SAMPLE_SEED = parsed_arguments.seed
+    QUICK_CHECK_MIB = parsed_arguments.quick
+    COMPRESS_OUTPUT = parsed_arguments.compress
+
+    return parsed_arguments
+
+
+def read_buffers():
+    buffers = getattr(thread_buffers, "buffers", None)
+    if buffers is None:
+        buffers = thread_buffers.buffers = [memoryview(bytearray(READ_BUFFER_SIZE)) for _ in range(READ_AHEAD_BUFFERS)]
+    return buffers
+
+
+def advise_sequential(media_file):
+    # Tells the OS to read ahead aggressively. macOS has no posix_fadvise, F_NOCACHE keeps reads out of its cache instead.
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(media_file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    elif hasattr(fcntl, 'F_NOCACHE'):
+        fcntl.fcntl(media_file.fileno(), fcntl.F_NOCACHE, 1)
+
+
+def drop_from_page_cache(media_file, offset, length):
+    # Hashed data is never read again, dropping it stops terabytes of media flushing everything else from the page cache
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(media_file.fileno(), offset, length, os.POSIX_FADV_DONTNEED)
+
+
+def mount_filesystems():
+    # [(mount point, filesystem type)] from /proc/mounts on Linux or the mount command on macOS
+    mounts = []
+    if os.path.isfile('/proc/mounts'):
+        with open('/proc/mounts') as mounts_file:
+            for line in mounts_file:
+                fields = line.split()
+                mounts.append((fields[1].replace('\\040', ' '), fields[2]))
+    else:
+        try:
+            mount_output = subprocess.run('mount', capture_output=True, universal_newlines=True).stdout
+        except OSError:
+            return mounts
+        for line in mount_output.splitlines():
+            # eg: //user@nas/share on /Volumes/share (smbfs, nodev, nosuid, mounted by user)
+            if ' on ' in line and ' (' in line:
+                mount_point, options = line.split(' on ', 1)[1].rsplit(' (', 1)
+                mounts.append((mount_point, options.split(',')[0].strip(')')))
+    return mounts
+
+
+def is_rotational_device_macos(path):
+    # diskutil reports "Solid State: Yes/No" for the disk a path lives on
+    try:
+        diskutil_output = subprocess.run(['diskutil', 'info', path], capture_output=True, universal_newlines=True).stdout
+    except OSError:
+        return None
+    for line in diskutil_output.splitlines():
+        if line.strip().startswith('Solid State:'):
+            return line.split(':', 1)[1].strip() == 'No'
+    return None
+
+
+def is_rotational_device(st_dev, path=None):
+    # Linux exposes whether a block device spins, partitions inherit it from their parent disk
+    sys_path = f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}"
+    if not os.path.exists(sys_path):
+        return is_rotational_device_macos(path) if path and sys.platform == 'darwin' else None
+    sys_path = os.path.realpath(sys_path)
+    for queue_path in (os.path.join(sys_path, 'queue', 'rotational'), os.path.join(os.path.dirname(sys_path), 'queue', 'rotational')):
+        if os.path.isfile(queue_path):
+            with open(queue_path) as rotational_file:
+                return rotational_file.read().strip() == '1'
+    return None
+
+
+def device_class(path, st_dev, mounts):
+    real_path = os.path.realpath(path)
+    mount_points = [(mount_point, filesystem) for mount_point, filesystem in mounts if real_path == mount_point or real_path.startswith(mount_point.rstrip('/') + '/')]
+    if mount_points:
+        filesystem = max(mount_points, key=lambda mount: len(mount[0]))[1]
+        if filesystem in NETWORK_FILESYSTEMS:
+            return 'network'
+    # Only drives known to spin are read one file at a time, anything unidentified is hashed in parallel
+    return 'hdd' if is_rotational_device(st_dev, path) else 'ssd'
+
+
+def plan_device_queues(jobs):
+    # Groups files by the physical device they live on and orders each group so reads stay sequential.
+    # The stat of each file is kept for the journal, taken before hashing so a file changed mid-hash is re-hashed on resume.
+    device_queues = {}
+    device_classes = {}
+    file_stats = {}
+    mounts = mount_filesystems()
+    for index, (source_hash, path) in enumerate(jobs):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if not os.path.isfile(path):
+            continue
+        if stat.st_dev not in device_classes:
+            device_classes[stat.st_dev] = device_class(path, stat.st_dev, mounts)
+        file_stats[index] = stat
+        device_queues.setdefault(stat.st_dev, []).append((stat.st_ino if HASH_ORDER == 'inode' else path, index, path))
+    for queue in device_queues.values():
+        queue.sort()
+    return device_queues, device_classes, file_stats
+
+
+def count_device_bytes(device, byte_count):
+    with device_stats_lock:
+        device_stats[device]["bytes"] += byte_count
+
+
+def print_device_progress(start_time):
+    elapsed = max(time.time() - start_time, 0.001)
+    with device_stats_lock:
+        for device, stats in device_stats.items():
+            print(f"\t{YELLOW}Device {os.major(device)}:{os.minor(device)} ({stats['class']}): {stats['files']}/{stats['total_files']} files, {stats['bytes'] / elapsed / 1000000:.0f} MB/s{DEFAULT}")
+
+
+def read_ahead(media_file, free_buffers, filled_buffers):
+    # Reader thread, keeps the disk busy filling free buffers while the worker thread hashes the filled ones
+    try:
+        while True:
+            buffer = free_buffers.get()
+            if buffer is None:
+                return
+            read_length = media_file.readinto(buffer)
+            filled_buffers.put((buffer, read_length))
+            if not read_length:
+                return
+    except OSError as error:
+        filled_buffers.put((None, error))
+
+
+def hash_file_read_ahead(media_file, hasher, device=None):
+    free_buffers = queue.Queue()
+    filled_buffers = queue.Queue()
+    for buffer in read_buffers():
+        free_buffers.put(buffer)
+    reader = threading.Thread(target=read_ahead, args=(media_file, free_buffers, filled_buffers), daemon=True)
+    reader.start()
+    size = 0
+    try:
+        while True:
+            buffer, read_length = filled_buffers.get()
+            if buffer is None:
+                raise read_length
+            if not read_length:
+                break
+            hasher.update(buffer[:read_length])
+            drop_from_page_cache(media_file, size, read_length)
+            size += read_length
+            if device is not None:
+                count_device_bytes(device, read_length)
+            free_buffers.put(buffer)
+    finally:
+        # Unblocks the reader if hashing stopped early, before the file is closed underneath it
+        free_buffers.put(None)
+        reader.join()
+    return size
+
+
+def hash_file(path, device=None, hasher=None):
+    # xxhash and hashlib release the GIL while hashing, so worker threads hash in parallel
+    hasher = hasher or (hashlib.md5() if USE_MD5 else xxhash.xxh64())
+    size = 0
+    with open(path, 'rb', buffering=0) as media_file:
+        advise_sequential(media_file)
+        if os.fstat(media_file.fileno()).st_size >= READ_AHEAD_MIN_SIZE:
+            size = hash_file_read_ahead(media_file, hasher, device)
+        else:
+            buffer = read_buffers()[0]
+            while True:
+                read_length = media_file.readinto(buffer)
+                if not read_length:
+                    break
+                hasher.update(buffer[:read_length])
+                size += read_length
+                if device is not None:
+                    count_device_bytes(device, read_length)
+            drop_from_page_cache(media_file, 0, 0)
+    return size, hasher.hexdigest()
+
+
+def print_read_error(path, error):
+    print(f"\t{RED}\u00D7{DEFAULT} Could not read {path}: {error.strerror or error}")
+
+
+def rehash(path, device=None):
+    # Returns the hash of the file on disk, or None when it is missing or unreadable so check_hash reports it as UNFOUND
+    try:
+        size, digest = hash_file(path, device)
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+    except OSError as error:
+        # eg: an I/O error from a failing drive or permission denied, the rest of the files still get hashed
+        print_read_error(path, error)
+        return None
+    finally:
+        if device is not None:
+            with device_stats_lock:
+                device_stats[device]["files"] += 1
+    hashdate = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    if USE_MD5:
+        return FileHash(file=path, size=str(size), md5=digest, hashdate=hashdate)
+    return FileHash(file=path, size=str(size), xxhash64be=digest, hashdate=hashdate)
+
+
+def hash_fields(file_hash):
+    return [file_hash.file, file_hash.size, file_hash.xxhash64be, file_hash.md5, file_hash.hashdate]
+
+
+def open_journal(journal_path, resume):
+    # Append-only, one JSON line per file. A fresh run starts a new journal.
+    if resume and os.path.isfile(journal_path):
+        journal = open(journal_path, 'a+')
+        # A crash can leave half a line at the end, start on a new line so the next entry is readable
+        if journal.tell():
+            journal.seek(journal.tell() - 1)
+            if journal.read(1) != "\n":
+                journal.write("\n")
+        return journal
+    return open(journal_path, 'w')
+
+
+def write_journal_entry(journal, source_hash, path, stat, disk_hash):
+    # Holds the MHL entry as well as the result so the report can be rebuilt from the journal alone
+    journal.write(json.dumps({
+        "path": path,
+        "size": stat.st_size if stat else None,
+        "mtime": stat.st_mtime_ns if stat else None,
+        "md5": USE_MD5,
+        "source": hash_fields(source_hash),
+        "result": hash_fields(disk_hash) if disk_hash else None,
+    }) + "\n")
+
+
+def sync_journal(journal):
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def load_journal(journal_path):
+    # {path: entry}, a later entry for the same path replaces an earlier one. A half written last line is ignored.
+    entries = {}
+    if not os.path.isfile(journal_path):
+        return entries
+    with open(journal_path) as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries[entry["path"]] = entry
+    return entries
+
+
+def is_unchanged_since_journaled(entry, path):
+    # Missing files are always checked again, they may have been plugged back in
+    if entry["result"] is None or entry["md5"] != USE_MD5:
+        return False
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime"]
+
+
+def rehash_by_device(jobs, journal=None, hash_function=rehash, on_result=None):
+    # Each device gets its own pool sized for its class, fed in inode/path order. Returns results in job order,
+    # on_result(index, result) is called as each file finishes.
+    device_queues, device_classes, file_stats = plan_device_queues(jobs)
+    results = [None] * len(jobs)
+    for index, (source_hash, path) in enumerate(jobs):
+        if index not in file_stats:
+            # Missing files are finished before hashing starts
+            if journal:
+                write_journal_entry(journal, source_hash, path, None, None)
+            if on_result:
+                on_result(index, None)
+    executors = []
+    futures = {}
+    start_time = time.time()
+    for device, queue in device_queues.items():
+        workers = HASH_WORKERS or DEVICE_CLASS_WORKERS[device_classes[device]]
+        device_stats[device] = {"class": device_classes[device], "bytes": 0, "files": 0, "total_files": len(queue)}
+        print(f"\t{DEFAULT}Device {os.major(device)}:{os.minor(device)} ({device_classes[device]}): {len(queue)} files, {workers} at a time")
+        executor = ThreadPoolExecutor(max_workers=workers)
+        executors.append(executor)
+        for _, index, path in queue:
+            futures[executor.submit(hash_function, path, device)] = index
+
+    pending = set(futures)
+    last_sync = time.time()
+    while pending:
+        done, pending = wait(pending, timeout=min(PROGRESS_SECONDS, JOURNAL_SYNC_SECONDS))
+        for future in sorted(done, key=futures.get):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except OSError as error:
+                print_read_error(jobs[index][1], error)
+            if journal:
+                write_journal_entry(journal, jobs[index][0], jobs[index][1], file_stats[index], results[index])
+            if on_result:
+                on_result(index, results[index])
+        if journal and time.time() - last_sync >= JOURNAL_SYNC_SECONDS:
+            sync_journal(journal)
+            last_sync = time.time()
+        if pending:
+            print_device_progress(start_time)
+    for executor in executors:
+        executor.shutdown()
+    if journal:
+        sync_journal(journal)
+    return results
+
+
+def sequence_frame(source_hash):
+    # (clipname, frame number) for image sequence frames, None for anything else
+    if not source_hash.is_image_seq():
+        return None
+    try:
+        return source_hash.clipname(), source_hash.frame_number()
+    except AttributeError:
+        # A .dng without an R00000 frame number
+        return None
+
+
+def sample_image_sequences(jobs):
+    # Keeps every non-sequence file and SAMPLE_PERCENT of the frames of each clip, always including its first and last frame.
+    # Each clip is sampled with its own seeded generator so the same frames are picked whatever else is in the MHLs.
+    clips = {}
+    sampled_jobs = []
+    for job in jobs:
+        frame = sequence_frame(job[0])
+        if frame is None:
+            sampled_jobs.append(job)
+        else:
+            clips.setdefault(frame[0], []).append((frame[1], job))
+    for clipname, frames in clips.items():
+        frames.sort(key=lambda frame: frame[0])
+        sample_size = max(min(len(frames), 2), math.ceil(len(frames) * SAMPLE_PERCENT / 100))
+        middle = random.Random(f"{SAMPLE_SEED}:{clipname}").sample(frames[1:-1], sample_size - min(len(frames), 2))
+        sampled_frames = frames[:1] + sorted(middle, key=lambda frame: frame[0]) + frames[1:][-1:]
+        sampled_jobs.extend(job for _, job in sampled_frames)
+        sample_stats["clips"] += 1
+        sample_stats["frames"] += len(frames)
+        sample_stats["sampled_frames"] += len(sampled_frames)
+        sample_stats["random_frames"] += len(middle)
+    return sampled_jobs
+
+
+def sampled_frames_bad_fraction_bound():
+    # With no bad frames found in n random frames, the fraction of bad frames is below 1 - (1 - confidence)^(1/n).
+    # The first and last frames are always checked rather than picked at random, so they are not counted in n.
+    return 1 - (1 - SAMPLE_CONFIDENCE) ** (1 / sample_stats["random_frames"])
+
+
+def print_sample_confidence(mismatched_frames):
+    print(f"\n\t{DEFAULT}Sampled {sample_stats['sampled_frames']} of {sample_stats['frames']} frames from {sample_stats['clips']} image sequence clips (seed {SAMPLE_SEED})")
+    if mismatched_frames:
+        print(f"\t{RED}\u00D7{DEFAULT} {mismatched_frames} sampled frames failed, around {mismatched_frames / sample_stats['sampled_frames']:.1%} of all frames may be bad. Re-hash every frame.")
+    elif sample_stats["random_frames"]:
+        print(f"\t{GREEN}\u2713{DEFAULT} {SAMPLE_CONFIDENCE:.0%} confident fewer than {sampled_frames_bad_fraction_bound():.2%} of frames are bad")
+    else:
+        print(f"\t{YELLOW}Only the first and last frames were checked, raise --sample to say how many frames might be bad{DEFAULT}")
+
+
+def add_row_to_output_list(row):
+    if row[0] == 'MATCHED':
+        output_csv_matched_list.append(row)
+    elif row[0] == 'MISMATCHED':
+        output_csv_mismatched_list.append(row)
+    elif row[0] == 'UNFOUND':
+        output_csv_unfound_list.append(row)
+
+
+def gather_jobs(mhl_paths, roots):
+    # [(MHL entry, path on disk)]
+    jobs = []
+    for (mhl_path, mhl_file), root in zip(mhl_compare.prefetch_mhls(mhl_paths), roots * len(mhl_paths) if len(roots) == 1 else roots):
+        print(f"\t{DEFAULT}Gathering files listed in {mhl_path} from {root}...")
+        jobs.extend((source_hash, os.path.join(root, source_hash.file)) for source_hash in mhl_compare.parse_mhl_hashes(mhl_path, mhl_file))
+    if SAMPLE_PERCENT is not None:
+        jobs = sample_image_sequences(jobs)
+    return jobs
+
+
+def run_rehash(mhl_paths, roots, journal_path=None, resume=False, mhl_writer=None):
+    global total_bytes_hashed
+    # check_hash compares whichever checksum the compare tool is set to use
+    mhl_compare.USE_MD5 = USE_MD5
+    jobs = gather_jobs(mhl_paths, roots)
+    disk_hashes = {}
+    if resume:
+        journaled = load_journal(journal_path)
+        for index, (source_hash, path) in enumerate(jobs):
+            if path in journaled and is_unchanged_since_journaled(journaled[path], path):
+                disk_hashes[index] = FileHash(*journaled[path]["result"])
+        print(f"\t{DEFAULT}Resuming from {journal_path}: {len(disk_hashes)} files already hashed")
+    rows = {}
+
+    def add_result(index, disk_hash):
+        # Each file goes into the ASC MHL generation as soon as it is hashed, so a stopped re-hash still records what it checked
+        rows[index] = mhl_compare.check_hash(jobs[index][0], disk_hash)
+        if mhl_writer:
+            mhl_writer.add_report_row(rows[index])
+
+    for index, disk_hash in disk_hashes.items():
+        add_result(index, disk_hash)
+    remaining = [index for index in range(len(jobs)) if index not in disk_hashes]
+    print(f"\t{DEFAULT}Re-hashing {len(remaining)} files...")
+    start_time = time.time()
+    with open_journal(journal_path, resume) if journal_path else nullcontext() as journal:
+        for index, disk_hash in zip(remaining, rehash_by_device([jobs[index] for index in remaining], journal, on_result=lambda position, disk_hash: add_result(remaining[position], disk_hash))):
+            if disk_hash:
+                total_bytes_hashed += int(disk_hash.size)
+    for index in range(len(jobs)):
+        add_row_to_output_list(rows[index])
+    elapsed = max(time.time() - start_time, 0.001)
+    print(f"\n\t{DEFAULT}Hashed {total_bytes_hashed} bytes from {len(remaining)} files in {elapsed:.1f}s ({total_bytes_hashed / elapsed / 1000000:.0f} MB/s)")
+    if sample_stats["sampled_frames"]:
+        print_sample_confidence(sum(1 for row in output_csv_mismatched_list + output_csv_unfound_list if sequence_frame(FileHash(file=row[1]))))
+    return len(jobs)
+
+
+def partial_hash(path, device=None):
+    # Hashes only the first and last QUICK_CHECK_MIB of the file.
+    # Returns {size, mtime, digest, zero_tail, bytes_read}, or None when the file is missing or unreadable.
+    span = QUICK_CHECK_MIB * 1024 * 1024
+    hasher = xxhash.xxh64()
+    try:
+        with open(path, 'rb') as media_file:
+            stat = os.fstat(media_file.fileno())
+            head = media_file.read(span)
+            hasher.update(head)
+            tail = b''
+            if stat.st_size > span:
+                media_file.seek(max(span, stat.st_size - span))
+                tail = media_file.read()
+                hasher.update(tail)
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
+    except OSError as error:
+        print_read_error(path, error)
+        return None
+    finally:
+        if device is not None:
+            with device_stats_lock:
+                device_stats[device]["files"] += 1
+    if device is not None:
+        count_device_bytes(device, len(head) + len(tail))
+    last_block = (head + tail)[-ZERO_TAIL_BYTES:]
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "digest": hasher.hexdigest(),
+        "zero_tail": bool(last_block) and last_block.count(0) == len(last_block),
+        "bytes_read": len(head) + len(tail),
+    }
+
+
+def load_quick_cache(cache_path):
+    if not os.path.isfile(cache_path):
+        return {}
+    with open(cache_path) as cache_file:
+        return json.load(cache_file)
+
+
+def is_quick_cache_current(entry, path):
+    # Cached partial checksums are reused without reading the file as long as its size and modified time have not changed
+    if entry is None or entry["span_mib"] != QUICK_CHECK_MIB:
+        return False
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime"]
+
+
+def quick_check_reasons(source_hash, result, cached):
+    # Why a file needs a full re-hash, empty when it looks fine
+    if result is None:
+        return ["missing"]
+    reasons = []
+    if source_hash.size and int(source_hash.size) != result["size"]:
+        reasons.append("truncated" if result["size"] < int(source_hash.size) else "size mismatch")
+    if result["zero_tail"]:
+        reasons.append("zero-filled tail")
+    if cached and cached["size"] == result["size"] and cached["digest"] != result["digest"]:
+        reasons.append("changed since last quick check")
+    return reasons
+
+
+def run_quick_check(mhl_paths, roots, cache_path):
+    global total_bytes_hashed
+    jobs = gather_jobs(mhl_paths, roots)
+    cache = load_quick_cache(cache_path)
+    results = {}
+    for index, (source_hash, path) in enumerate(jobs):
+        if is_quick_cache_current(cache.get(path), path):
+            results[index] = cache[path]
+    remaining = [index for index in range(len(jobs)) if index not in results]
+    print(f"\t{DEFAULT}Quick checking {len(jobs)} files, {len(results)} unchanged since the last quick check...")
+    start_time = time.time()
+    for index, result in zip(remaining, rehash_by_device([jobs[index] for index in remaining], hash_function=partial_hash)):
+        results[index] = result
+        if result:
+            total_bytes_hashed += result.pop("bytes_read")
+    for index, (source_hash, path) in enumerate(jobs):
+        result = results[index]
+        reasons = quick_check_reasons(source_hash, result, cache.get(path))
+        row = [
+            'FLAGGED' if reasons else 'OK',
+            source_hash.file,
+            source_hash.size,
+            result["size"] if result else '',
+            result["digest"] if result else '',
+            ", ".join(reasons),
+        ]
+        (quick_flagged_list if reasons else quick_ok_list).append(row)
+        if result:
+            cache[path] = dict(result, span_mib=QUICK_CHECK_MIB)
+    # Written to a temporary file first so an interrupted run never leaves a half written cache
+    with open(cache_path + ".tmp", 'w') as cache_file:
+        json.dump(cache, cache_file)
+    os.replace(cache_path + ".tmp", cache_path)
+    elapsed = max(time.time() - start_time, 0.001)
+    print(f"\n\t{DEFAULT}Read {total_bytes_hashed} bytes from {len(remaining)} files in {elapsed:.1f}s")
+    return len(jobs)
+
+
+def report_path(output_report_csv_name):
+    return SAVE_LOCATION + output_report_csv_name + (f".{COMPRESS_OUTPUT}" if COMPRESS_OUTPUT else "")
+
+
+def export_quick_check_csv(output_report_csv_name):
+    with mhl_compare.open_output(report_path(output_report_csv_name), COMPRESS_OUTPUT) as new_file:
+        csv_writer = csv.writer(new_file)
+        csv_writer.writerow(QUICK_CSV_HEADER)
+        for line in quick_flagged_list + quick_ok_list:
+            csv_writer.writerow(line)
+
+    print(f"\n\t{GREEN}\u2713{DEFAULT} Files that look complete: {len(quick_ok_list)}")
+    print(f"\t{RED}\u00D7{DEFAULT} Files flagged for a full re-hash: {len(quick_flagged_list)}")
+    for row in quick_flagged_list[:10]:
+        print(f"\t\t{row[1]} ({row[5]})")
+    print(f"\n\tQuick check complete. Output report CSV has been saved to {report_path(output_report_csv_name)}")
+
+
+def report_from_journal(journal_path):
+    # Rebuilds the report without the MHLs or the media, eg: after the restore volume has been unmounted
+    entries = load_journal(journal_path)
+    for entry in entries.values():
+        mhl_compare.USE_MD5 = entry["md5"]
+        disk_hash = FileHash(*entry["result"]) if entry["result"] else None
+        add_row_to_output_list(mhl_compare.check_hash(FileHash(*entry["source"]), disk_hash))
+    return len(entries)
+
+
+def export_output_csv(output_report_csv_name):
+    with mhl_compare.open_output(report_path(output_report_csv_name), COMPRESS_OUTPUT) as new_file:
+        csv_writer = csv.writer(new_file)
+        csv_writer.writerow(mhl_compare.OUTPUT_CSV_HEADER)
+        for line in output_csv_matched_list + output_csv_mismatched_list + output_csv_unfound_list:
+            csv_writer.writerow(line)
+
+    print(f"\n\t{GREEN}\u2713{DEFAULT} Matched files: {len(output_csv_matched_list)}")
+    print(f"\t{RED}\u00D7{DEFAULT} Unfound files: {len(output_csv_unfound_list)}")
+    print(f"\t{ORANGE}?{DEFAULT} Mismatched files: {len(output_csv_mismatched_list)}")
+    print(f"\n\tCheck complete. Output report CSV has been saved to {report_path(output_report_csv_name)}")
+
+
+def create_save_directory():
+    if not os.path.isdir(SAVE_LOCATION):
+        os.mkdir(SAVE_LOCATION)
+
+
+def main(argv):
+    arguments = args_parse(argv)
+    print(f"\t{BLUE}\n{__program_name__} v{__version__} | {__author__}{DEFAULT}")
+    create_save_directory()
+    if QUICK_CHECK_MIB is not None:
+        report_name = "_".join(os.path.basename(mhl).split('.')[0] for mhl in arguments.mhls)
+        files_checked = run_quick_check(arguments.mhls, arguments.root, arguments.quick_cache or SAVE_LOCATION + "quick_check_cache.json")
+        export_quick_check_csv(report_name + "_quick_check.csv")
+        if __name__ != '__main__':
+            return {
+                "files_checked": files_checked,
+                "total_bytes_hashed": total_bytes_hashed,
+                "quick_ok_list_length": len(quick_ok_list),
+                "quick_flagged_list_length": len(quick_flagged_list),
+            }
+        return 1 if quick_flagged_list else 0
+    if arguments.report_from_journal:
+        files_hashed = report_from_journal(arguments.report_from_journal)
+        report_name = os.path.basename(arguments.report_from_journal).split('.')[0].replace("_rehash_journal", "")
+    else:
+        report_name = "_".join(os.path.basename(mhl).split('.')[0] for mhl in arguments.mhls)
+        journal_path = arguments.journal or SAVE_LOCATION + report_name + "_rehash_journal.jsonl"
+        if arguments.write_mhl:
+            with AscMhlWriter(arguments.root[0]) as mhl_writer:
+                try:
+                    files_hashed = run_rehash(arguments.mhls, arguments.root, journal_path, arguments.resume, mhl_writer)
+                except KeyboardInterrupt:
+                    files_hashed = None
+            if files_hashed is None:
+                # The generation is still saved with the files hashed before stopping, --resume carries on from the journal
+                print(f"\n\t{RED}Stopped before every file was hashed. ASC MHL generation {mhl_writer.sequence_number} records the {mhl_writer.hash_count} files checked so far and has been saved to {mhl_writer.generation_path}{DEFAULT}")
+                return 1
+            print(f"\t{DEFAULT}ASC MHL generation {mhl_writer.sequence_number} has been saved to {mhl_writer.generation_path}")
+        else:
+            files_hashed = run_rehash(arguments.mhls, arguments.root, journal_path, arguments.resume)
+    output_report_csv_name = report_name + "_rehash_verified.csv"
+    export_output_csv(output_report_csv_name)
+
+    # Counts returned when running tests
+    if __name__ != '__main__':
+        return {
+            "files_hashed": files_hashed,
+            "total_bytes_hashed": total_bytes_hashed,
+            "output_csv_matched_list_length": len(output_csv_matched_list),
+            "output_csv_mismatched_list_length": len(output_csv_mismatched_list),
+            "output_csv_unfound_list_length": len(output_csv_unfound_list),
+            "sampled_frames": sample_stats["sampled_frames"],
+            "sequence_frames": sample_stats["frames"],
+        }
+    if output_csv_mismatched_list or output_csv_unfound_list:
+        return 1
+
+
+# Runs when opened from command line, passing sys.argv through to allow tests to run script
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
+
+
+def reset_for_tests():
+    # Tests dont run independently, so we need to reset the global variables
+    global USE_MD5
+    global SAVE_LOCATION
+    global total_bytes_hashed
+    global device_stats
+    global output_csv_matched_list
+    global output_csv_mismatched_list
+    global output_csv_unfound_list
+    global sample_stats
+    global quick_ok_list
+    global quick_flagged_list
+    global COMPRESS_OUTPUT
+    mhl_compare.reset_for_tests()
+    USE_MD5 = False
+    SAVE_LOCATION = os.path.expanduser("~/Desktop/MHL_Verification_Reports/")
+    total_bytes_hashed = 0
+    device_stats = {}
+    output_csv_matched_list = []
+    output_csv_mismatched_list = []
+    output_csv_unfound_list = []
+    sample_stats = {"clips": 0, "frames": 0, "sampled_frames": 0, "random_frames": 0}
+    quick_ok_list = []
+    quick_flagged_list = []
+    COMPRESS_OUTPUT = None
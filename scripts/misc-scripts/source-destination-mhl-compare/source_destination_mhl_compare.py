@@ -6,29 +6,98 @@ __author__ = "Josh Unwin/Gary Palmer"
 __version__ = "0.8"
 
 import csv
+import ctypes
+import ctypes.util
+import gc
+import gzip
 import hashlib
+import io
+import json
+import lzma
+import math
+import mmap
+import multiprocessing
 import re
+import select
+import sqlite3
+import struct
 import sys
+import time
 import xxhash
+import zlib
 import os
 import argparse
 import subprocess
 import xml.etree.ElementTree as et
+from collections.abc import Sequence
+from datetime import datetime
+
+# The MHL opening and read-ahead shared with the MHL to CSV scripts, one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mhl_input
+from mhl_input import MHL_SUFFIXES, detect_compression, open_mhl, zstandard
+
+try:
+    import lxml.etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
 total_source_file_count = 0
 total_touched_files = 0
 USE_MD5 = False
 SAVE_LOCATION = os.path.expanduser("~/Desktop/MHL_Verification_Reports/")
 SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM = False
+SUMMARY_ONLY_PATH_LIMIT = None
+FAIL_FAST_LIMIT = None
+WATCH_POLL_SECONDS = 5
+WATCH_SETTLE_SECONDS = 2
+# An MHL that still can not be read after settling this many times is logged as failed instead of being retried forever
+WATCH_MAX_RETRIES = 3
+FOLLOW_POLL_SECONDS = 2
+# Compression for report CSVs, None writes plain CSVs
+COMPRESS_OUTPUT = None
+# MHLs read ahead on background threads while the current one is parsed, and the most that is held in memory for them
+PREFETCH_FILES = 4
+PREFETCH_MAX_BYTES = 256 * 1024 * 1024
+# Bytes the v1 scanner reads from an MHL at a time
+SCAN_CHUNK_BYTES = 4 * 1024 * 1024
+# How MHLs are parsed: 'auto' picks per file, or 'etree' (standard library), 'lxml' or 'scan' (v1 scanner)
+XML_BACKEND = 'auto'
+XML_BACKENDS = ('auto', 'etree', 'lxml', 'scan')
+# v2 MHLs at least this big are parsed with lxml when it is installed
+LXML_MIN_BYTES = 8 * 1024 * 1024
+MHL_HEAD_BYTES = 4096
+MHL_VERSION_PATTERN = re.compile(rb'<hashlist[^>]*\sversion="(\d+)')
+MHL_ENCODING_PATTERN = re.compile(rb'<\?xml[^>]*\sencoding="([^"]+)"')
+# Children of a v1 <hash> that are plain <tag>text</tag>. A <hash> with anything else (attributes, entities, CDATA, comments) is parsed with ElementTree.
+V1_HASH_FIELD = re.compile(r'<(\w+)>([^<&]*)</\1>')
+V1_HASH_FIELDS = {'file', 'size', 'xxhash64be', 'md5', 'hashdate'}
+# Uncompressed v1 MHLs at least this big are mapped into memory, and the MD5 and hash date of each hash are only read from
+# the mapped MHL when a report row needs them. None reads every field up front.
+LAZY_FIELDS_MIN_BYTES = 8 * 1024 * 1024
+# Index the destination in SQLite on disk, with a Bloom filter of its filenames in memory, instead of holding every hash in memory
+USE_DISK_INDEX = False
+BLOOM_FALSE_POSITIVE_RATE = 0.01
+DISK_INDEX_BATCH_SIZE = 10000
+# Worker processes a full report comparison is split across, 1 compares in this process
+SHARD_COUNT = 1
+# The source hashes and destination index of a sharded comparison, inherited by the forked worker processes
+shard_source_hashes = []
+shard_destination_index = {}
+ASCMHL_FOLDER = "ascmhl"
+ASCMHL_CHAIN_FILE = "ascmhl_chain.xml"
+ASC_MHL_DIRECTORY_NAMESPACE = "urn:ASC:MHL:DIRECTORY:v2.0"
+OUTPUT_CSV_HEADER = ['Status', 'Src File', 'Src Size', 'Src xxHash', 'Src MD5', 'Src Hash Date', 'Dest File', 'Dest Size', 'Dest xxHash', 'Dest MD5', 'Dest Hash Date']
 output_csv_matched_list = []
 output_csv_unfound_list = []
 output_csv_mismatched_list = []
 previous_img_sequence_hash = None
 frames_in_src_img_seq_clip = []
 frames_in_dest_img_seq_clip = []
-destination_toc_length = 0
-five_percent_toc_length = 0
-last_matched_location = 0
+summary_status_counts = {'MATCHED': 0, 'MISMATCHED': 0, 'UNFOUND': 0}
+summary_status_bytes = {'MATCHED': 0, 'MISMATCHED': 0, 'UNFOUND': 0}
+summary_offending_paths = []
+fail_fast_triggered = False
 
 BLUE = "\033[0;34m"
 DEFAULT = "\033[0m"
@@ -37,14 +106,113 @@ GREEN = '\033[1;32m'
 RED = '\033[1;31m'
 ORANGE = '\033[0;31m'
 
+# Directories, frame name templates and hash dates shared by hash records, so each is only held in memory once
+shared_values = {}
+# An image sequence frame name, eg: E007_C001_20211027_R00000.dng or A143C002_211028_AOI3.1322831.arx
+FRAME_FILE_PATTERN = re.compile(r'^(.*\D)?(\d+)(\.(?:ari|arx|dng))$')
+
+
+def shared_value(value):
+    return shared_values.setdefault(value, value)
+
+
+def read_mapped_field(mhl_data, tag, start, end):
+    # Text of the last <tag> in a simple <hash> between start and end of a mapped MHL, as the scanner would have read it
+    field_start = mhl_data.rfind(b'<' + tag + b'>', start, end)
+    if field_start == -1:
+        return ""
+    field_start += len(tag) + 2
+    # ElementTree gives None for an empty element
+    return mhl_data[field_start:mhl_data.find(b'</', field_start)].decode('utf-8') or None
+
+
 class FileHash:
+    # Millions of frames repeat the same roll, clip and date in their paths, so the path is not kept as one string.
+    # location is a shared directory and name the basename, or for image sequence frames location is a shared
+    # (directory, name before the frame number, digits, extension) template and name the frame number.
+    # The full path is only put back together when it is asked for, eg: when a report row is written.
+    # A hash read from a mapped MHL keeps the offset of its <hash> element in _md5 and the mapped MHL in _hashdate,
+    # until the MD5 or hash date is asked for and they are read from the element.
+    __slots__ = ('location', 'name', 'size', 'xxhash64be', '_md5', '_hashdate')
+
     def __init__(self, file="", size="", xxhash64be="", md5="", hashdate=""):
+        self._md5 = ""
         self.file = file
         self.size = size
         self.xxhash64be = xxhash64be
         self.md5 = md5
         self.hashdate = hashdate
-    
+
+    @property
+    def file(self):
+        if self.location is None:
+            return self.name
+        if type(self.name) is int:
+            directory, prefix, digits, extension = self.location
+            return directory + prefix + str(self.name).zfill(digits) + extension
+        return self.location + self.name
+
+    @file.setter
+    def file(self, file):
+        if not file:
+            # "" or None (an empty <file/>)
+            self.location = None
+            self.name = file
+            return
+        directory, separator, basename = file.rpartition('/')
+        frame = FRAME_FILE_PATTERN.match(basename)
+        if frame:
+            self.location = shared_value((directory + separator, frame.group(1) or "", len(frame.group(2)), frame.group(3)))
+            self.name = int(frame.group(2))
+        else:
+            self.location = shared_value(directory + separator)
+            self.name = basename
+
+    @property
+    def md5(self):
+        if type(self._md5) is int:
+            self.load_fields()
+        return self._md5
+
+    @md5.setter
+    def md5(self, md5):
+        if type(self._md5) is int:
+            self.load_fields()
+        self._md5 = md5
+
+    @property
+    def hashdate(self):
+        if type(self._md5) is int:
+            self.load_fields()
+        return self._hashdate
+
+    @hashdate.setter
+    def hashdate(self, hashdate):
+        if type(self._md5) is int:
+            self.load_fields()
+        # Files hashed in the same second share a hash date
+        self._hashdate = shared_value(hashdate) if hashdate else hashdate
+
+    def defer_fields(self, mhl_data, offset):
+        self._md5 = offset
+        self._hashdate = mhl_data
+
+    def load_fields(self):
+        offset, mhl_data = self._md5, self._hashdate
+        end = mhl_data.find(b'</hash>', offset)
+        self._md5 = read_mapped_field(mhl_data, b'md5', offset, end)
+        self._hashdate = ""
+        self.hashdate = read_mapped_field(mhl_data, b'hashdate', offset, end)
+
+    def basename(self):
+        if type(self.name) is int:
+            directory, prefix, digits, extension = self.location
+            return prefix + str(self.name).zfill(digits) + extension
+        return self.name
+
+    def fields(self):
+        return [self.file, self.size, self.xxhash64be, self.md5, self.hashdate]
+
     def is_image_seq(self):
         return self.file.endswith(('.ari', '.arx', '.dng'))
 
@@ -75,71 +243,493 @@ def args_parse(argv):
     global USE_MD5
     global SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM
     global SAVE_LOCATION
+    global SUMMARY_ONLY_PATH_LIMIT
+    global FAIL_FAST_LIMIT
+    global COMPRESS_OUTPUT
+    global PREFETCH_FILES
+    global PREFETCH_MAX_BYTES
+    global XML_BACKEND
+    global LAZY_FIELDS_MIN_BYTES
+    global USE_DISK_INDEX
+    global SHARD_COUNT
     parser = argparse.ArgumentParser()
     parser.add_argument('-o', '--output-dir', help="The directory to save the output CSV file to.", default=SAVE_LOCATION)
-    parser.add_argument('-s', '--sources', nargs='+', help="One or more source MHLs (eg: such as MHLs from Silverstack)")
-    parser.add_argument('-d', '--destination', help="The destination mhl you wish to use (eg: such as MHLs from YoYotta)")
+    parser.add_argument('-s', '--sources', nargs='+', help="One or more source MHLs (eg: such as MHLs from Silverstack), or volumes with an ascmhl folder")
+    parser.add_argument('-d', '--destination', help="The destination mhl you wish to use (eg: such as MHLs from YoYotta), or a volume with an ascmhl folder")
+    parser.add_argument('-m', '--manifest', help="A CSV or JSON manifest of batch jobs to check against the destination (replaces -s)")
     parser.add_argument('--skip-summarise-img-seq', action='store_true', help="Include to skip the combine image seq checksums step")
+    parser.add_argument('--summary-only', nargs='?', type=int, const=10, metavar='N', help="Only count results (no report CSV), listing the first N unfound/mismatched files (default 10)")
+    parser.add_argument('--follow', action='store_true', help="Source MHLs are still being written, keep reading new hashes as they are appended until each MHL is complete")
+    parser.add_argument('--watch', help="Watch a folder for new source MHLs and check each one against the destination as it arrives")
+    parser.add_argument('--state', help="Project state file for incremental checks. Only new or changed source MHLs are checked, earlier results are merged into the report")
+    parser.add_argument('--fail-fast', nargs='?', type=int, const=1, metavar='N', help="Stop after N unfound or mismatched files (default 1), write a partial report and exit with an error")
+    parser.add_argument('--compress', choices=['gz', 'xz', 'zst'], help="Compress the report CSVs")
+    parser.add_argument('--prefetch', type=int, default=PREFETCH_FILES, metavar='N', help="Source MHLs read ahead while the current one is parsed (default 4, 0 turns read-ahead off)")
+    parser.add_argument('--prefetch-mib', type=int, default=PREFETCH_MAX_BYTES // (1024 * 1024), help="MiB of MHL data held in memory by the read-ahead (default 256)")
+    parser.add_argument('--xml-backend', choices=XML_BACKENDS, default=XML_BACKEND, help="How MHLs are parsed (default auto: the v1 scanner for v1 MHLs, lxml for large v2 MHLs when installed, otherwise the standard library)")
+    parser.add_argument('--load-all-fields', action='store_true', help="Read every field of every hash up front, instead of leaving the MD5 and hash date of large MHLs on disk until a report row needs them")
+    parser.add_argument('--disk-index', action='store_true', help="Index the destination in SQLite on disk with a Bloom filter of its filenames, for archive catalogues too big to index in memory. Kept in the output directory and reused while the destination is unchanged")
+    parser.add_argument('--shards', type=int, default=SHARD_COUNT, metavar='N', help="Split the comparison across N worker processes (default 1). The report is the same whatever N is")
     checksum_type_group = parser.add_mutually_exclusive_group()
     checksum_type_group.add_argument('--xxhash', help="Use xxHash checksum (default)")
     checksum_type_group.add_argument('--md5', action='store_true', help="Use md5 checksum")
     parsed_arguments = parser.parse_args(argv[1:]) # skip the first argument (the script name)
+    if parsed_arguments.fail_fast is not None and parsed_arguments.fail_fast < 1:
+        parser.error("--fail-fast needs at least 1 unfound or mismatched file to stop on")
+    if parsed_arguments.state:
+        # Only complete results can be recorded as checked, and the state records source MHLs given with -s
+        if not parsed_arguments.sources:
+            parser.error("--state needs the source MHLs to check (-s)")
+        for flag, value in (('--summary-only', parsed_arguments.summary_only), ('--fail-fast', parsed_arguments.fail_fast),
+                            ('--follow', parsed_arguments.follow), ('--watch', parsed_arguments.watch), ('--manifest', parsed_arguments.manifest)):
+            if value is not None and value is not False:
+                parser.error(f"--state can not be combined with {flag}")
+    if parsed_arguments.manifest:
+        # Every job writes its own full report, from the sources listed in the manifest
+        for flag, value in (('-s', parsed_arguments.sources), ('--summary-only', parsed_arguments.summary_only),
+                            ('--follow', parsed_arguments.follow), ('--watch', parsed_arguments.watch)):
+            if value is not None and value is not False:
+                parser.error(f"--manifest can not be combined with {flag}")
+    if parsed_arguments.compress == 'zst' and zstandard is None:
+        parser.error("Writing .zst reports needs the zstandard package (pip3 install zstandard)")
+    if parsed_arguments.xml_backend == 'lxml' and lxml_etree is None:
+        parser.error("--xml-backend lxml needs the lxml package (pip3 install lxml)")
     USE_MD5 = parsed_arguments.md5
+    COMPRESS_OUTPUT = parsed_arguments.compress
+    PREFETCH_FILES = parsed_arguments.prefetch
+    PREFETCH_MAX_BYTES = parsed_arguments.prefetch_mib * 1024 * 1024
+    XML_BACKEND = parsed_arguments.xml_backend
+    USE_DISK_INDEX = parsed_arguments.disk_index
+    SHARD_COUNT = max(parsed_arguments.shards, 1)
+    if parsed_arguments.load_all_fields:
+        LAZY_FIELDS_MIN_BYTES = None
     SAVE_LOCATION = parsed_arguments.output_dir
     SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM = parsed_arguments.skip_summarise_img_seq
+    SUMMARY_ONLY_PATH_LIMIT = parsed_arguments.summary_only
+    FAIL_FAST_LIMIT = parsed_arguments.fail_fast
 
     return parsed_arguments
 
 
+def open_input(path, text=False, read_ahead_bytes=None):
+    # MHLs, CSVs and manifests, decompressed as they are read when gzip, xz or zstd compressed
+    input_file = open_mhl(path, read_ahead_bytes)
+    return io.TextIOWrapper(input_file, encoding='utf-8', newline='') if text else input_file
+
+
+def open_output(path, compression=None):
+    # Text file for writing a CSV, compressed as it is written when compression is 'gz', 'xz' or 'zst'
+    if compression == 'gz':
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    if compression == 'xz':
+        return lzma.open(path, 'wt', encoding='utf-8', newline='')
+    if compression == 'zst':
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True), encoding='utf-8', newline='')
+    return open(path, 'w', newline='')
+
+
+def output_path(name, compression=None):
+    return SAVE_LOCATION + name + (f".{compression}" if compression else "")
+
+
+def local_tag(element):
+    # ASC MHL v2 tags are namespaced, eg: {urn:ASC:MHL:v2.0}hash. lxml comments have no tag name.
+    if not isinstance(element.tag, str):
+        return ''
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def set_hash_field(hash, tag, text, attrib):
+    if tag == 'file':
+        hash.file = text
+    if tag == 'size':
+        hash.size = text
+    if tag == 'xxhash64be':
+        hash.xxhash64be = text
+    if tag == 'md5':
+        hash.md5 = text
+    if tag == 'hashdate':
+        hash.hashdate = text
+    # ASC MHL v2: <path size="..">file</path> and <xxh64 hashdate="..">checksum</xxh64>
+    if tag == 'path':
+        hash.file = text
+        hash.size = attrib.get('size', '')
+    if tag == 'xxh64':
+        hash.xxhash64be = text
+        hash.hashdate = attrib.get('hashdate', hash.hashdate)
+    if tag == 'md5' and 'hashdate' in attrib:
+        hash.hashdate = hash.hashdate or attrib['hashdate']
+
+
 def create_hash_object(mhl_hash):
     hash = FileHash()
     for element in mhl_hash:
-        if element.tag == 'file':
-            hash.file = element.text
-        if element.tag == 'size':
-            hash.size = element.text
-        if element.tag == 'xxhash64be':
-            hash.xxhash64be = element.text
-        if element.tag == 'md5':
-            hash.md5 = element.text
-        if element.tag == 'hashdate':
-            hash.hashdate = element.text
+        set_hash_field(hash, local_tag(element), element.text, element.attrib)
     return hash
 
 
-def smarter_find(search_term, content):
-    global total_source_file_count
-    global destination_toc_length
-    global five_percent_toc_length
-    global last_matched_location
+def find_ascmhl_folder(path):
+    # A volume root or its ascmhl folder, as long as it has an ASC MHL chain file
+    if not os.path.isdir(path):
+        return None
+    for folder in (path, os.path.join(path, ASCMHL_FOLDER)):
+        if os.path.isfile(os.path.join(folder, ASCMHL_CHAIN_FILE)):
+            return folder
+    return None
+
+
+def read_ascmhl_chain(ascmhl_folder):
+    # [(sequence number, generation file name, c4 id)] in generation order
+    chain = []
+    with open_input(os.path.join(ascmhl_folder, ASCMHL_CHAIN_FILE)) as chain_file:
+        chain_root = et.parse(chain_file).getroot()
+    for hashlist in chain_root:
+        path = hashlist.find(f"{{{ASC_MHL_DIRECTORY_NAMESPACE}}}path")
+        c4 = hashlist.find(f"{{{ASC_MHL_DIRECTORY_NAMESPACE}}}c4")
+        chain.append((int(hashlist.attrib["sequencenr"]), path.text, c4.text if c4 is not None else ""))
+    return sorted(chain)
+
 
-    matched_location = content.find(search_term, last_matched_location)
+def ascmhl_history_cache_path(ascmhl_folder):
+    return os.path.join(SAVE_LOCATION, "ascmhl_history", xxhash.xxh64(os.path.abspath(ascmhl_folder).encode()).hexdigest() + ".json")
 
-    if matched_location == -1:
-        matched_location = content.find(search_term, max(0, last_matched_location - five_percent_toc_length))
-    if matched_location == -1:
-        matched_location = content.find(search_term)
-    last_matched_location = matched_location
-    if matched_location == -1:
-        print(f"\t{RED}Could not find {search_term} in destination MHL{YELLOW}")
-    return matched_location
 
+def merge_generation_hash(resolved_hashes, file_hash):
+    # A later generation replaces the checksums it lists and keeps any other hash formats from earlier generations
+    current_hash = resolved_hashes.get(file_hash.file)
+    if current_hash is None:
+        resolved_hashes[file_hash.file] = file_hash
+        return
+    for field in ('size', 'xxhash64be', 'md5', 'hashdate'):
+        if getattr(file_hash, field):
+            setattr(current_hash, field, getattr(file_hash, field))
 
-def find_matching_hash(filename, destination_toc):
+
+def load_ascmhl_history(ascmhl_folder):
+    # Every generation repeats most of the hashes before it. The resolved state of the generations already read is cached,
+    # so only generations added to the chain since are parsed. The cache is rebuilt if the earlier chain no longer matches it.
+    chain = [list(generation) for generation in read_ascmhl_chain(ascmhl_folder)]
+    cache_path = ascmhl_history_cache_path(ascmhl_folder)
+    applied_generations = []
+    resolved_hashes = {}
+    if os.path.isfile(cache_path):
+        with open(cache_path) as cache_file:
+            cache = json.load(cache_file)
+        if cache["generations"] == chain[:len(cache["generations"])]:
+            applied_generations = cache["generations"]
+            resolved_hashes = {fields[0]: FileHash(*fields) for fields in cache["hashes"]}
+    generation_paths = [os.path.join(ascmhl_folder, generation_name) for sequence_number, generation_name, c4 in chain[len(applied_generations):]]
+    for generation_path, generation_file in prefetch_mhls(generation_paths):
+        print(f"\t{DEFAULT}Reading ASC MHL generation {os.path.basename(generation_path)}...")
+        for file_hash in parse_mhl_hashes(generation_path, generation_file):
+            merge_generation_hash(resolved_hashes, file_hash)
+    if len(chain) > len(applied_generations):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Written to a temporary file first so an interrupted run never leaves a half written cache
+        with open(cache_path + ".tmp", 'w') as cache_file:
+            json.dump({
+                "generations": chain,
+                "hashes": [file_hash.fields() for file_hash in resolved_hashes.values()],
+            }, cache_file)
+        os.replace(cache_path + ".tmp", cache_path)
+    return resolved_hashes
+
+
+def open_prefetched_mhl(mhl_path, read_ahead_bytes):
+    # ASC MHL volumes are yielded without a file, their generations are read ahead when the history is loaded.
+    # MHLs the v1 scanner reads from a mapping are mapped instead of opened, so they are not read a second time.
+    if find_ascmhl_folder(mhl_path):
+        return None
+    return map_mhl(mhl_path) or open_input(mhl_path, read_ahead_bytes=read_ahead_bytes)
+
+
+def prefetch_mhls(mhl_paths):
+    # Yields (path, open MHL) in order, the current MHL and the next PREFETCH_FILES read ahead sharing PREFETCH_MAX_BYTES
+    return mhl_input.prefetch_mhls([mhl_path.strip() for mhl_path in mhl_paths], PREFETCH_FILES, PREFETCH_MAX_BYTES, open_prefetched_mhl)
+
+
+def iter_hashes_etree(mhl_file):
+    # iterparse lets each <hash> be dropped once it is read, instead of holding the whole MHL tree in memory
+    for event, element in et.iterparse(mhl_file):
+        if local_tag(element) == 'hash':
+            yield create_hash_object(element)
+            element.clear()
+
+
+def iter_hashes_lxml(mhl_file):
+    # lxml's parser is faster, and huge_tree lifts its limits on very large documents and text nodes.
+    # lxml keeps cleared elements attached to the root, so earlier siblings are removed too.
+    # Its syntax errors are raised as ElementTree's, so a truncated MHL is handled the same whichever backend read it.
     try:
-        # matched_location = destination_toc.find(filename)
-        matched_location = smarter_find(filename, destination_toc)
-        if matched_location == -1:
+        for event, element in lxml_etree.iterparse(mhl_file, events=('end',), huge_tree=True):
+            if local_tag(element) == 'hash':
+                yield create_hash_object(element)
+                element.clear(keep_tail=True)
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+    except lxml_etree.XMLSyntaxError as error:
+        raise et.ParseError(str(error)) from error
+
+
+def iter_hashes_scan(mhl_file, mhl_data=None):
+    # v1 MHLs are a flat list of <hash> elements with plain text children, so the fields can be picked out
+    # with a regex instead of building elements. A <hash> that is not that simple is parsed with ElementTree.
+    # mhl_data is the same MHL mapped into memory, a hash with an MD5 that is not being compared then leaves its MD5
+    # and hash date in the mapped MHL until a report row needs them.
+    buffer = b''
+    buffer_offset = 0
+    while True:
+        chunk = mhl_file.read(SCAN_CHUNK_BYTES)
+        buffer += chunk
+        position = 0
+        while True:
+            start = buffer.find(b'<hash', position)
+            # Waits for the next chunk when the tag name might carry on into it
+            if start == -1 or start + 5 >= len(buffer):
+                break
+            # Skips <hashlist> and the like
+            if buffer[start + 5:start + 6] not in (b'>', b' ', b'\t', b'\r', b'\n'):
+                position = start + 5
+                continue
+            end = buffer.find(b'</hash>', start)
+            if end == -1:
+                break
+            position = end + len(b'</hash>')
+            element = buffer[start:position].decode('utf-8')
+            fields = V1_HASH_FIELD.findall(element)
+            # <hash>, </hash> and two per plain child, any other tag or markup means it is not a simple hash
+            if element.count('<') == 2 * len(fields) + 2 and '&' not in element and element.startswith('<hash>'):
+                hash = FileHash()
+                is_deferred = mhl_data is not None and not USE_MD5 and '<md5>' in element
+                for tag, text in fields:
+                    # ElementTree gives None for an empty element
+                    if is_deferred and tag in ('md5', 'hashdate'):
+                        continue
+                    if tag in V1_HASH_FIELDS:
+                        setattr(hash, tag, text or None)
+                    else:
+                        set_hash_field(hash, tag, text or None, {})
+                if is_deferred:
+                    hash.defer_fields(mhl_data, buffer_offset + start)
+                yield hash
+            else:
+                yield create_hash_object(et.fromstring(element))
+        buffer = buffer[position:]
+        buffer_offset += position
+        if not chunk:
+            # A truncated MHL (eg: one still being copied) fails as it does in ElementTree, rather than passing as complete
+            end = buffer.rfind(b'</hashlist')
+            if end == -1 or b'<hash' in buffer[:end]:
+                raise et.ParseError(f"{getattr(mhl_file, 'name', 'MHL')}: no closing </hashlist>, the MHL is incomplete")
+            return
+
+
+def map_mhl(mhl_path):
+    # Maps an uncompressed MHL of at least LAZY_FIELDS_MIN_BYTES that the v1 scanner will read into memory, otherwise None
+    if LAZY_FIELDS_MIN_BYTES is None:
+        return None
+    try:
+        if detect_compression(mhl_path) or os.path.getsize(mhl_path) < max(LAZY_FIELDS_MIN_BYTES, 1):
             return None
-        # make an extract_area substring of 2000 chars around the found string for regex parsing. 
-        # the max()functions ensure minimum of 0 and 1000 on each side respectively (negative number breaks it)
-        extract_area = destination_toc[max(0,matched_location-1000):max(1000,matched_location+1000)]
-        matched_hash_string = re.search(f'(?s)<hash>(?:(?!<hash>).)*?{re.escape(filename)}(?:(?!</hash>).)*?</hash>', extract_area).group()
-        parsed_match = et.ElementTree(et.fromstring(matched_hash_string))
-        return create_hash_object(parsed_match.getroot())
-    except:
-        print(f"\t{RED}Found match in destination MHL for {filename}, but could not extract the hash. {DEFAULT}")
+        with open(mhl_path, 'rb') as mhl_file:
+            mhl_data = mmap.mmap(mhl_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
         return None
+    if xml_backend_for_head(mhl_path, mhl_data[:MHL_HEAD_BYTES]) != 'scan':
+        mhl_data.close()
+        return None
+    # The kernel reads the mapped MHL ahead instead of a read-ahead thread, so it is only read once
+    if hasattr(mmap, 'MADV_WILLNEED'):
+        mhl_data.madvise(mmap.MADV_WILLNEED)
+    return mhl_data
+
+
+MHL_PARSERS = {'etree': iter_hashes_etree, 'lxml': iter_hashes_lxml, 'scan': iter_hashes_scan}
+
+
+def choose_xml_backend(mhl_path, mhl_file):
+    # Picks the parser for an MHL from its version and size, read from the start of the file without using it up
+    head = mhl_file.peek(MHL_HEAD_BYTES)[:MHL_HEAD_BYTES] if hasattr(mhl_file, 'peek') else b''
+    return xml_backend_for_head(mhl_path, head)
+
+
+def xml_backend_for_head(mhl_path, head):
+    if XML_BACKEND != 'auto':
+        return XML_BACKEND
+    version = MHL_VERSION_PATTERN.search(head)
+    encoding = MHL_ENCODING_PATTERN.search(head)
+    is_utf8 = encoding is None or encoding.group(1).lower() in (b'utf-8', b'utf8', b'us-ascii')
+    if version and int(version.group(1)) < 2 and is_utf8:
+        return 'scan'
+    try:
+        is_large = os.path.getsize(mhl_path) >= LXML_MIN_BYTES
+    except OSError:
+        is_large = False
+    if lxml_etree is not None and is_large:
+        return 'lxml'
+    return 'etree'
+
+
+def parse_mhl_hashes(mhl_path, mhl_file=None):
+    # mhl_file is an MHL already opened or mapped by prefetch_mhls, otherwise mhl_path is opened here
+    ascmhl_folder = find_ascmhl_folder(mhl_path.strip())
+    if ascmhl_folder:
+        yield from load_ascmhl_history(ascmhl_folder).values()
+        return
+    mhl_file = mhl_file or map_mhl(mhl_path.strip()) or open_input(mhl_path.strip())
+    if isinstance(mhl_file, mmap.mmap):
+        # The mapped MHL stays open for as long as a hash needs it
+        yield from iter_hashes_scan(mhl_file, mhl_file)
+        return
+    with mhl_file:
+        yield from MHL_PARSERS[choose_xml_backend(mhl_path.strip(), mhl_file)](mhl_file)
+
+
+class BloomFilter:
+    # A set of strings held in a fixed number of bits. A string that was added is always found, a string that was not
+    # is wrongly found about BLOOM_FALSE_POSITIVE_RATE of the time.
+    def __init__(self, bit_count, hash_count, bits=None):
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.bits = bits if bits is not None else bytearray((bit_count + 7) // 8)
+
+    def bit_positions(self, item):
+        # Double hashing, every position is worked out from two 64 bit hashes
+        item = item.encode('utf-8')
+        first = xxhash.xxh64_intdigest(item, seed=0)
+        second = xxhash.xxh64_intdigest(item, seed=1) | 1
+        return [(first + index * second) % self.bit_count for index in range(self.hash_count)]
+
+    def add(self, item):
+        for position in self.bit_positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.bit_positions(item))
+
+
+def new_bloom_filter(expected_items):
+    bit_count = max(64, math.ceil(-expected_items * math.log(BLOOM_FALSE_POSITIVE_RATE) / math.log(2) ** 2))
+    hash_count = max(1, round(bit_count / max(expected_items, 1) * math.log(2)))
+    return BloomFilter(bit_count, hash_count)
+
+
+class DiskDestinationIndex:
+    # The destination hashes in an SQLite file, looked up by basename like the {basename: [hashes]} index held in memory.
+    # Filenames the Bloom filter has never seen are unfound without touching the disk, only probable hits are queried.
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.connection = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+        bit_count, hash_count, bits = self.connection.execute("SELECT bit_count, hash_count, bits FROM bloom_filter").fetchone()
+        self.bloom_filter = BloomFilter(bit_count, hash_count, bits)
+        self.hash_count = self.connection.execute("SELECT hash_count FROM destination").fetchone()[0]
+        self.definite_misses = 0
+        self.disk_lookups = 0
+
+    def get(self, basename, default=None):
+        if basename not in self.bloom_filter:
+            self.definite_misses += 1
+            return default
+        self.disk_lookups += 1
+        rows = self.connection.execute("SELECT file, size, xxhash64be, md5, hashdate FROM hashes WHERE basename = ? ORDER BY rowid", (basename,))
+        return [FileHash(*row) for row in rows] or default
+
+    def reopen(self):
+        # An SQLite connection can not be shared with a forked process, each worker opens its own
+        self.connection = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True)
+
+
+def disk_index_path(destination):
+    return os.path.join(SAVE_LOCATION, "destination_index", xxhash.xxh64(os.path.abspath(destination).encode()).hexdigest() + ".sqlite")
+
+
+def destination_stat(destination):
+    return json.dumps(mhl_file_stat(destination))
+
+
+def read_disk_index_stat(index_path):
+    if not os.path.isfile(index_path):
+        return None
+    try:
+        connection = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+        try:
+            return connection.execute("SELECT stat FROM destination").fetchone()[0]
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return None
+
+
+def build_disk_index(destination, index_path):
+    # Hashes are written in batches so memory stays flat however big the destination is. The Bloom filter is sized
+    # once the filenames have been counted, and filled from a second pass over them in SQLite.
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    if os.path.exists(index_path + ".tmp"):
+        os.remove(index_path + ".tmp")
+    connection = sqlite3.connect(index_path + ".tmp")
+    # Nothing to recover if the build is interrupted, the index only gets its final name once it is complete
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("CREATE TABLE hashes (basename TEXT, file TEXT, size TEXT, xxhash64be TEXT, md5 TEXT, hashdate TEXT)")
+    batch = []
+    for destination_path, destination_file in prefetch_mhls([destination]):
+        for destination_hash in parse_mhl_hashes(destination_path, destination_file):
+            if destination_hash.file:
+                batch.append([destination_hash.basename()] + destination_hash.fields())
+            if len(batch) >= DISK_INDEX_BATCH_SIZE:
+                connection.executemany("INSERT INTO hashes VALUES (?, ?, ?, ?, ?, ?)", batch)
+                batch = []
+    connection.executemany("INSERT INTO hashes VALUES (?, ?, ?, ?, ?, ?)", batch)
+    connection.execute("CREATE INDEX hashes_basename ON hashes (basename)")
+    hash_count = connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+    bloom_filter = new_bloom_filter(connection.execute("SELECT COUNT(DISTINCT basename) FROM hashes").fetchone()[0])
+    for (basename,) in connection.execute("SELECT basename FROM hashes"):
+        bloom_filter.add(basename)
+    connection.execute("CREATE TABLE bloom_filter (bit_count INTEGER, hash_count INTEGER, bits BLOB)")
+    connection.execute("INSERT INTO bloom_filter VALUES (?, ?, ?)", (bloom_filter.bit_count, bloom_filter.hash_count, bytes(bloom_filter.bits)))
+    connection.execute("CREATE TABLE destination (stat TEXT, hash_count INTEGER)")
+    connection.execute("INSERT INTO destination VALUES (?, ?)", (destination_stat(destination), hash_count))
+    connection.commit()
+    connection.close()
+    os.replace(index_path + ".tmp", index_path)
+
+
+def open_disk_index(destination):
+    # The index is kept between runs and only rebuilt when the destination MHL has changed
+    index_path = disk_index_path(destination)
+    if read_disk_index_stat(index_path) == destination_stat(destination):
+        print(f"\t{DEFAULT}Using destination index {index_path}")
+    else:
+        print(f"\t{DEFAULT}Indexing destination MHL to {index_path}...")
+        build_disk_index(destination, index_path)
+    destination_index = DiskDestinationIndex(index_path)
+    print(f"\t{destination_index.hash_count} hashes in destination MHL.\n")
+    return destination_index
+
+
+def build_destination_index(destination):
+    # Indexes destination hashes by basename, so each lookup only has to check the few records sharing a filename
+    if USE_DISK_INDEX:
+        return open_disk_index(destination)
+    print(f"\t{DEFAULT}Indexing destination MHL...")
+    destination_index = {}
+    destination_hash_count = 0
+    for destination_path, destination_file in prefetch_mhls([destination]):
+        for destination_hash in parse_mhl_hashes(destination_path, destination_file):
+            if destination_hash.file:
+                destination_index.setdefault(destination_hash.basename(), []).append(destination_hash)
+                destination_hash_count += 1
+    print(f"\t{destination_hash_count} hashes in destination MHL.\n")
+    return destination_index
+
+
+def find_matching_hash(filename, destination_index):
+    # Source paths are relative to the card, destination paths include the project folders above it
+    for destination_hash in destination_index.get(os.path.basename(filename), []):
+        if destination_hash.file.endswith(filename):
+            return destination_hash
+    print(f"\t{RED}Could not find {filename} in destination MHL{YELLOW}")
+    return None
 
 
 def generate_output_csv_line(status, src_hash, dest_hash):
@@ -151,6 +741,44 @@ def generate_output_csv_line(status, src_hash, dest_hash):
         return [status, src_hash.file, src_hash.size, src_hash.xxhash64be, src_hash.md5, src_hash.hashdate]
 
 
+class ReportRow(Sequence):
+    # A report row that holds its two hashes and only builds its fields when it is written out, so MD5s and hash dates
+    # left in a mapped MHL are not read for every row at compare time. Reads like the list generate_output_csv_line gives.
+    __slots__ = ('status', 'src_hash', 'dest_hash')
+
+    def __init__(self, status, src_hash, dest_hash):
+        self.status = status
+        self.src_hash = src_hash
+        self.dest_hash = dest_hash
+
+    def fields(self):
+        return generate_output_csv_line(self.status, self.src_hash, self.dest_hash)
+
+    def __getitem__(self, index):
+        # The status and source path are asked for while comparing, neither needs a lazy field
+        if index == 0:
+            return self.status
+        if index == 1:
+            return self.src_hash.file
+        return self.fields()[index]
+
+    def __len__(self):
+        return 11 if self.dest_hash else 6
+
+    def __iter__(self):
+        return iter(self.fields())
+
+    def __eq__(self, other):
+        if isinstance(other, (list, ReportRow)):
+            return self.fields() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.fields())
+
+
 def generate_hash_file_name(first_clip, last_clip):
     if first_clip.file_extension() == '.dng':
         return f'{first_clip.clipname()}{first_clip.frame_number()}-{last_clip.frame_number()}{first_clip.file_extension()}'
@@ -160,8 +788,12 @@ def generate_hash_file_name(first_clip, last_clip):
 
 
 def generate_img_seq_clip_hash(hash_list):
-    # Builds a new combined hash by looping over the list of hashes
-    hash_file_name = generate_hash_file_name(hash_list[0], hash_list[-1])
+    # Builds a new combined hash by looping over the list of hashes. Frames missing from the destination are None,
+    # a clip with no frames found at all has no combined hash.
+    found_hashes = [hash for hash in hash_list if hash]
+    if not found_hashes:
+        return None
+    hash_file_name = generate_hash_file_name(found_hashes[0], found_hashes[-1])
     xxhash64 = xxhash.xxh64()
     xxhash64_output = ""
     md5 = hashlib.md5()
@@ -178,7 +810,18 @@ def generate_img_seq_clip_hash(hash_list):
                 md5_output = md5.hexdigest()
             size += int(hash.size)
     return FileHash(file=hash_file_name, size=size, 
-                    xxhash64be=xxhash64_output, md5=md5_output, hashdate=hash_list[-1].hashdate)
+                    xxhash64be=xxhash64_output, md5=md5_output, hashdate=found_hashes[-1].hashdate)
+
+
+def flush_img_seq_clip():
+    global frames_in_src_img_seq_clip
+    global frames_in_dest_img_seq_clip
+    src_img_seq_hash = generate_img_seq_clip_hash(frames_in_src_img_seq_clip)
+    dest_img_seq_hash = generate_img_seq_clip_hash(frames_in_dest_img_seq_clip)
+    record_hash_result(src_img_seq_hash, dest_img_seq_hash)
+    # Reset the lists ready for the next clip
+    frames_in_src_img_seq_clip = []
+    frames_in_dest_img_seq_clip = []
 
 
 def build_image_sequenced_clip_row(source_hash, destination_hash, is_last_file):
@@ -188,8 +831,7 @@ def build_image_sequenced_clip_row(source_hash, destination_hash, is_last_file):
     
     if destination_hash is None:
         # Immediately create a missing row for individual frames not found in an image sequence
-        row_for_csv_output = check_hash(source_hash, destination_hash)
-        add_row_to_output_list(row_for_csv_output)   
+        record_hash_result(source_hash, destination_hash)
     
     if previous_img_sequence_hash:
         if source_hash.clipname() != previous_img_sequence_hash.clipname() or is_last_file:
@@ -198,14 +840,8 @@ def build_image_sequenced_clip_row(source_hash, destination_hash, is_last_file):
             # Add last file to the frame list
                 frames_in_src_img_seq_clip.append(source_hash)
                 frames_in_dest_img_seq_clip.append(destination_hash)
-            # 1. Generate a hash for both src and dest for the previous clip frames, check them and add them to the output list
-            src_img_seq_hash = generate_img_seq_clip_hash(frames_in_src_img_seq_clip)
-            dest_img_seq_hash = generate_img_seq_clip_hash(frames_in_dest_img_seq_clip)
-            row_for_csv_output = check_hash(src_img_seq_hash, dest_img_seq_hash)
-            add_row_to_output_list(row_for_csv_output)
-            # 2. Reset the lists ready for the next clip
-            frames_in_src_img_seq_clip = []
-            frames_in_dest_img_seq_clip = []
+            # Generate a hash for both src and dest for the previous clip frames, check them and add them to the output list
+            flush_img_seq_clip()
     
     frames_in_src_img_seq_clip.append(source_hash)
     frames_in_dest_img_seq_clip.append(destination_hash)
@@ -213,35 +849,52 @@ def build_image_sequenced_clip_row(source_hash, destination_hash, is_last_file):
     previous_img_sequence_hash = source_hash
 
 
-def check_hash(source_hash, destination_hash):
+def hash_status(source_hash, destination_hash):
     if destination_hash is None:
-        output_line = generate_output_csv_line('UNFOUND', source_hash, destination_hash)
+        return 'UNFOUND'
+    if USE_MD5:
+        if source_hash.md5 == destination_hash.md5:
+            return 'MATCHED'
+        print(f"\t{RED}The MD5 checksum for {source_hash.file} does not match. src: {source_hash.md5} dest: {destination_hash.md5}")
     else:
-        if USE_MD5:
-            if source_hash.md5 == destination_hash.md5:
-                output_line = generate_output_csv_line('MATCHED', source_hash, destination_hash)
-            else:
-                output_line = generate_output_csv_line('MISMATCHED', source_hash, destination_hash)
-                print(f"\t{RED}The MD5 checksum for {source_hash.file} does not match. src: {source_hash.md5} dest: {destination_hash.md5}")
-        else:
-            if source_hash.xxhash64be == destination_hash.xxhash64be:
-                output_line = generate_output_csv_line('MATCHED', source_hash, destination_hash)
-            else:
-                output_line = generate_output_csv_line('MISMATCHED', source_hash, destination_hash)
-                print(f"\t{RED}The xxHash checksum for {source_hash.file} does not match. src: {source_hash.xxhash64be} dest: {destination_hash.xxhash64be}")
-    return output_line
+        if source_hash.xxhash64be == destination_hash.xxhash64be:
+            return 'MATCHED'
+        print(f"\t{RED}The xxHash checksum for {source_hash.file} does not match. src: {source_hash.xxhash64be} dest: {destination_hash.xxhash64be}")
+    return 'MISMATCHED'
+
+
+def check_hash(source_hash, destination_hash):
+    return generate_output_csv_line(hash_status(source_hash, destination_hash), source_hash, destination_hash)
+
+
+def record_hash_result(source_hash, destination_hash):
+    if SUMMARY_ONLY_PATH_LIMIT is None:
+        add_row_to_output_list(ReportRow(hash_status(source_hash, destination_hash), source_hash, destination_hash))
+    else:
+        count_hash_status(hash_status(source_hash, destination_hash), source_hash)
+
+
+def count_hash_status(status, source_hash):
+    # --summary-only keeps counters and the first few offending paths instead of report rows
+    summary_status_counts[status] += 1
+    try:
+        summary_status_bytes[status] += int(source_hash.size)
+    except (TypeError, ValueError):
+        pass
+    if status != 'MATCHED' and len(summary_offending_paths) < SUMMARY_ONLY_PATH_LIMIT:
+        summary_offending_paths.append((status, source_hash.file))
 
 
 def export_output_csv():
     processed_rows_count = 0
     mhls_skipped = 0
 
-    with open(SAVE_LOCATION + output_report_csv_name, 'w') as new_file:
-        header = ['Status', 'Src File', 'Src Size', 'Src xxHash', 'Src MD5', 'Src Hash Date', 'Dest File', 'Dest Size', 'Dest xxHash', 'Dest MD5', 'Dest Hash Date']
+    with open_output(output_path(output_report_csv_name, COMPRESS_OUTPUT), COMPRESS_OUTPUT) as new_file:
         csv_writer = csv.writer(new_file)
-        csv_writer.writerow(header)
+        csv_writer.writerow(OUTPUT_CSV_HEADER)
 
         for line in output_csv_matched_list + output_csv_mismatched_list + output_csv_unfound_list:
+            line = list(line)
             if '.mhl' in line:
                 mhls_skipped += 1
             else:
@@ -254,10 +907,50 @@ def export_output_csv():
     print(f"\t{GREEN}\u2713{DEFAULT} Matched files: {len(output_csv_matched_list)}")
     print(f"\t{RED}\u00D7{DEFAULT} Unfound files: {len(output_csv_unfound_list)}")
     print(f"\t{ORANGE}?{DEFAULT} Mismatched files: {len(output_csv_mismatched_list)}")
-    print(f"\n\tCheck complete. Output report CSV has been saved to {SAVE_LOCATION + output_report_csv_name}")
+    if fail_fast_triggered:
+        print(f"\n\t{RED}Check stopped early after {failed_hash_count()} unfound/mismatched files (--fail-fast). This is a partial report.{DEFAULT}")
+    print(f"\n\tCheck complete. Output report CSV has been saved to {output_path(output_report_csv_name, COMPRESS_OUTPUT)}")
     print(f"\tPlease note this only reports files present in the source MHLs, any additional files on the destination are not included.")
 
 
+def print_summary_only():
+    print(f"\n\t{DEFAULT}Total files processed from source MHLs: {total_touched_files}\n")
+    print(f"\t{GREEN}\u2713{DEFAULT} Matched files: {summary_status_counts['MATCHED']} ({summary_status_bytes['MATCHED']} bytes)")
+    print(f"\t{RED}\u00D7{DEFAULT} Unfound files: {summary_status_counts['UNFOUND']} ({summary_status_bytes['UNFOUND']} bytes)")
+    print(f"\t{ORANGE}?{DEFAULT} Mismatched files: {summary_status_counts['MISMATCHED']} ({summary_status_bytes['MISMATCHED']} bytes)")
+    if summary_offending_paths:
+        print(f"\n\t{DEFAULT}First {len(summary_offending_paths)} unfound/mismatched files:")
+        for status, file in summary_offending_paths:
+            print(f"\t\t{status}: {file}")
+    if fail_fast_triggered:
+        print(f"\n\t{RED}Check stopped early after {failed_hash_count()} unfound/mismatched files (--fail-fast).{DEFAULT}")
+    if summary_status_counts['MISMATCHED'] or summary_status_counts['UNFOUND']:
+        print(f"\n\t{RED}NO-GO: not every source file matched the destination.{DEFAULT}")
+    else:
+        print(f"\n\t{GREEN}GO: every source file matched the destination.{DEFAULT}")
+
+
+def failed_hash_count():
+    if SUMMARY_ONLY_PATH_LIMIT is None:
+        return len(output_csv_mismatched_list) + len(output_csv_unfound_list)
+    return summary_status_counts['MISMATCHED'] + summary_status_counts['UNFOUND']
+
+
+def report_summary():
+    if SUMMARY_ONLY_PATH_LIMIT is None:
+        matched, mismatched, unfound = len(output_csv_matched_list), len(output_csv_mismatched_list), len(output_csv_unfound_list)
+    else:
+        matched, mismatched, unfound = summary_status_counts['MATCHED'], summary_status_counts['MISMATCHED'], summary_status_counts['UNFOUND']
+    return {
+        "total_source_file_count": total_source_file_count,
+        "total_touched_files": total_touched_files,
+        "output_csv_matched_list_length": matched,
+        "output_csv_mismatched_list_length": mismatched,
+        "output_csv_unfound_list_length": unfound,
+        "fail_fast_triggered": fail_fast_triggered,
+    }
+
+
 def create_save_directory():
     folderChecker = os.path.isdir(SAVE_LOCATION)
     if folderChecker == False:
@@ -278,12 +971,18 @@ def print_info():
         print(f"\t{YELLOW}\t- Skipping summarise image sequence to clip step. Skip summarise image sequences step flag provided.")
     else:
         print(f"\t{YELLOW}\t- Summarising image sequences to a single MHL per clip. You can skip this by providing the --skip-summarise-img-seq flag.")
+
+    if SUMMARY_ONLY_PATH_LIMIT is not None:
+        print(f"\t{YELLOW}\t- Summary only flag provided - counting results without writing a report CSV.")
+
+    if FAIL_FAST_LIMIT is not None:
+        print(f"\t{YELLOW}\t- Fail fast flag provided - stopping after {FAIL_FAST_LIMIT} unfound or mismatched files.")
     print("\n")
 
 
 def copy_csv_content_to_clipboard(csv_path):
-    csv = open(csv_path, "r")
-    subprocess.run("pbcopy", universal_newlines=True, input=csv.read())
+    with open_input(csv_path, text=True) as csv:
+        subprocess.run("pbcopy", universal_newlines=True, input=csv.read())
     print("\tCSV report contents has been copied to the clipboard.\n")
 
 
@@ -298,103 +997,675 @@ def add_row_to_output_list(row):
 
 def print_progress(total_hashes, current_hash):
     if str(current_hash)[-3:] == "000":
-                print(f"\t{YELLOW}Currently processing hash {str(current_hash)} of {str(total_hashes)}")
+        if total_hashes:
+            print(f"\t{YELLOW}Currently processing hash {str(current_hash)} of {str(total_hashes)}")
+        else:
+            print(f"\t{YELLOW}Currently processing hash {str(current_hash)}")
 
 
 def build_hash_list(sources):
     global total_source_file_count
     print(f"\t{DEFAULT}Gathering all hashes from source MHLs...")
     hash_list = []
-    for source_mhl_file in sources:
-        mhl_root = et.parse(source_mhl_file.strip()).getroot()
-
-        for child in mhl_root:
-            if child.tag == 'hash':
-                source_hash = create_hash_object(child)
-                hash_list.append(source_hash)
+    for source_mhl_file, mhl_file in prefetch_mhls(sources):
+        hash_list.extend(parse_mhl_hashes(source_mhl_file, mhl_file))
     total_source_file_count = len(hash_list)
     print(f"\t{total_source_file_count} hashes in source MHLs.\n")
     return hash_list
 
 
-def main(argv):
-    global output_report_csv_name
+def iter_source_hashes(sources):
+    # Streams hashes straight from the source MHLs, counting them as they go past
     global total_source_file_count
-    global total_touched_files
-    global destination_toc_length
-    global five_percent_toc_length
-    arguments = args_parse(argv)
-    print_info()
-    create_save_directory()
-    destination_toc = open(arguments.destination.strip()).read()
-    destination_toc_length = len(destination_toc)
-    five_percent_toc_length = int(destination_toc_length / 20)
-    # output_report_csv_name = "_".join(map(lambda x: os.path.basename(x).split("_")[0].split(".")[0], arguments.sources))
-    # output_report_csv_name += "_verified.csv"
-    output_report_csv_name = f"{os.path.basename(arguments.destination).split('.')[0]}_verfied.csv"
+    for source_mhl_file, mhl_file in prefetch_mhls(sources):
+        for source_hash in parse_mhl_hashes(source_mhl_file, mhl_file):
+            total_source_file_count += 1
+            yield source_hash
 
-    source_hash_list = build_hash_list(arguments.sources)
+
+def read_appended_hashes(mhl_path, offset):
+    # Parses only the complete <hash> elements written after offset, so the unterminated root of an MHL
+    # that is still being written is never parsed. Returns the hashes, the offset after the last complete
+    # element and whether the closing </hashlist> has been written. An MHL that has not been created yet reads as empty.
+    try:
+        with open(mhl_path, 'rb') as mhl_file:
+            mhl_file.seek(offset)
+            appended = mhl_file.read()
+    except FileNotFoundError:
+        return [], offset, False
+    hashes = []
+    position = 0
+    while True:
+        start = appended.find(b'<hash>', position)
+        end = appended.find(b'</hash>', start)
+        if start == -1 or end == -1:
+            break
+        position = end + len(b'</hash>')
+        hashes.append(create_hash_object(et.fromstring(appended[start:position])))
+    is_complete = b'</hashlist>' in appended[position:]
+    return hashes, offset + position, is_complete
+
+
+def follow_source_hashes(sources):
+    # Yields hashes as they are appended to each source MHL, waiting for more until the MHL is complete
+    global total_source_file_count
+    for source_mhl_file in sources:
+        source_mhl_file = source_mhl_file.strip()
+        if not os.path.exists(source_mhl_file):
+            # The offload has not started writing it yet
+            print(f"\t{DEFAULT}Waiting for {source_mhl_file}...")
+            while not os.path.exists(source_mhl_file):
+                time.sleep(FOLLOW_POLL_SECONDS)
+        if detect_compression(source_mhl_file):
+            # A compressed MHL has already been written, there is nothing to follow
+            for source_hash in parse_mhl_hashes(source_mhl_file):
+                total_source_file_count += 1
+                yield source_hash
+            continue
+        print(f"\t{DEFAULT}Following {source_mhl_file}...")
+        offset = 0
+        while True:
+            hashes, offset, is_complete = read_appended_hashes(source_mhl_file, offset)
+            for source_hash in hashes:
+                total_source_file_count += 1
+                yield source_hash
+            if is_complete:
+                break
+            time.sleep(FOLLOW_POLL_SECONDS)
+
+
+def with_last_flag(iterable):
+    # Looks one item ahead so streamed hashes know when they are the last file, like indexing into a full list does
+    iterator = iter(iterable)
+    previous = next(iterator, None)
+    if previous is None:
+        return
+    for item in iterator:
+        yield previous, False
+        previous = item
+    yield previous, True
+
+
+def run_comparison(source_hashes, destination_index):
+    global total_touched_files
+    global fail_fast_triggered
+    if SHARD_COUNT > 1 and can_shard_comparison(source_hashes):
+        run_sharded_comparison(source_hashes, destination_index)
+        return
     print(f"\t{DEFAULT}Finding matches and comparing checksums...")
-        
-    for index, source_hash in enumerate(source_hash_list):
+
+    for index, (source_hash, is_last_file) in enumerate(with_last_flag(source_hashes)):
         print_progress(total_source_file_count, index)
-        destination_hash = find_matching_hash(source_hash.file, destination_toc)
+        destination_hash = find_matching_hash(source_hash.file, destination_index)
 
         if not SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM and source_hash.is_image_seq():
             total_touched_files += 1
-            is_last_file = (index == total_source_file_count - 1)
             build_image_sequenced_clip_row(source_hash, destination_hash, is_last_file) 
         else:
             total_touched_files += 1
-            row_for_csv_output = check_hash(source_hash, destination_hash)
-            add_row_to_output_list(row_for_csv_output)
-                    
-    export_output_csv()
-    copy_csv_content_to_clipboard(SAVE_LOCATION + output_report_csv_name)
+            record_hash_result(source_hash, destination_hash)
 
-    # Counts returned when running tests 
-    if __name__ != '__main__':
-        return {
-            "total_source_file_count": total_source_file_count,
-            "total_touched_files": total_touched_files,
-            "output_csv_matched_list_length": len(output_csv_matched_list),
-            "output_csv_mismatched_list_length": len(output_csv_mismatched_list),
-            "output_csv_unfound_list_length": len(output_csv_unfound_list), 
-        }
+        if FAIL_FAST_LIMIT is not None and failed_hash_count() >= FAIL_FAST_LIMIT:
+            fail_fast_triggered = True
+            # The clip in progress still gets its row in the partial report
+            if frames_in_src_img_seq_clip and not is_last_file:
+                flush_img_seq_clip()
+            print(f"\t{RED}Reached {failed_hash_count()} unfound/mismatched files, stopping early.{DEFAULT}")
+            break
 
 
-# Runs when opened from command line, passing sys.argv through to allow tests to run script
-if __name__ == '__main__':
-    sys.exit(main(sys.argv))
+def can_shard_comparison(source_hashes):
+    # Streamed sources, --summary-only and --fail-fast need the hashes compared one at a time in order.
+    # Workers are forked so they share the destination index without copying it, which Windows can not do.
+    return (isinstance(source_hashes, list) and SUMMARY_ONLY_PATH_LIMIT is None and FAIL_FAST_LIMIT is None
+            and previous_img_sequence_hash is None and 'fork' in multiprocessing.get_all_start_methods())
 
 
-def reset_for_tests():
-    # Tests dont run independently, so we need to reset the global variables
+def plan_comparison_units(source_hashes):
+    # Splits the sources into the units run_comparison writes rows for, without matching anything: each file on its own
+    # and each run of image sequence frames from one clip. A unit is (source indexes, row key of its clip row or None).
+    # The clip row is written when run_comparison would have written it, as it reaches the first frame of the next clip
+    # (or the last file), so the frames of a clip whose row is never written still get their unfound rows.
+    units = []
+    frames = []
+    previous_frame = None
+    last_index = len(source_hashes) - 1
+    for index, source_hash in enumerate(source_hashes):
+        if SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM or not source_hash.is_image_seq():
+            units.append(([index], None))
+            continue
+        if previous_frame and (source_hash.clipname() != previous_frame.clipname() or index == last_index):
+            if index == last_index:
+                frames.append(index)
+            units.append((frames, (index, 1)))
+            frames = []
+        frames.append(index)
+        previous_frame = source_hash
+    # The last file is already in the clip it ended
+    if frames and not (units and units[-1][1] == (last_index, 1)):
+        units.append((frames, None))
+    return units
+
+
+def start_shard_worker():
+    if isinstance(shard_destination_index, DiskDestinationIndex):
+        shard_destination_index.reopen()
+
+
+def compare_shard(units):
+    # Runs in a worker process. Returns (row key, row) for every row the units write, a row key being
+    # (index of the source hash run_comparison writes it at, 0 for the file's own row or 1 for a clip row).
+    rows = []
+    for indexes, clip_row_key in units:
+        source_hashes = [shard_source_hashes[index] for index in indexes]
+        destination_hashes = [find_matching_hash(source_hash.file, shard_destination_index) for source_hash in source_hashes]
+        for index, source_hash, destination_hash in zip(indexes, source_hashes, destination_hashes):
+            if SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM or not source_hash.is_image_seq() or destination_hash is None:
+                rows.append(((index, 0), check_hash(source_hash, destination_hash)))
+        if clip_row_key:
+            rows.append((clip_row_key, check_hash(generate_img_seq_clip_hash(source_hashes), generate_img_seq_clip_hash(destination_hashes))))
+    return rows
+
+
+def run_sharded_comparison(source_hashes, destination_index):
+    # Units are shared out between SHARD_COUNT worker processes by the hash of their first path. The rows that come back
+    # are put in the order run_comparison would have written them, so the report is the same whatever the shard count.
+    global total_touched_files
+    global shard_source_hashes
+    global shard_destination_index
+    print(f"\t{DEFAULT}Finding matches and comparing checksums in {SHARD_COUNT} processes...")
+    shards = [[] for shard in range(SHARD_COUNT)]
+    for unit in plan_comparison_units(source_hashes):
+        shards[xxhash.xxh64_intdigest(source_hashes[unit[0][0]].file.encode('utf-8')) % SHARD_COUNT].append(unit)
+    shard_source_hashes = source_hashes
+    shard_destination_index = destination_index
+    # Keeps the garbage collector in the workers away from the hashes they inherit, so their memory stays shared instead of being copied
+    gc.freeze()
+    try:
+        with multiprocessing.get_context('fork').Pool(SHARD_COUNT, initializer=start_shard_worker) as pool:
+            shard_rows = pool.map(compare_shard, shards)
+    finally:
+        gc.unfreeze()
+        shard_source_hashes = []
+        shard_destination_index = {}
+    for row_key, row in sorted((keyed_row for rows in shard_rows for keyed_row in rows), key=lambda keyed_row: keyed_row[0]):
+        add_row_to_output_list(row)
+    total_touched_files += len(source_hashes)
+
+
+def parse_manifest_flag(value, default):
+    if isinstance(value, bool):
+        return value
+    if value is None or str(value).strip() == "":
+        return default
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+
+def load_manifest(manifest_path):
+    # JSON manifests are a list of jobs (or {"jobs": [...]}), CSV manifests have a header row with the same keys.
+    # Multiple sources in a CSV cell are separated with ";". Relative source paths are relative to the manifest.
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open_input(manifest_path, text=True) as manifest_file:
+        if '.json' in manifest_path.lower():
+            entries = json.load(manifest_file)
+            if isinstance(entries, dict):
+                entries = entries["jobs"]
+        else:
+            entries = list(csv.DictReader(manifest_file))
+
+    jobs = []
+    for entry in entries:
+        sources = entry["sources"]
+        if isinstance(sources, str):
+            sources = [source for source in sources.split(";") if source.strip()]
+        sources = [os.path.join(manifest_dir, source.strip()) for source in sources]
+        report_name = entry.get("report") or "_".join(map(lambda x: os.path.basename(x).split("_")[0].split(".")[0], sources))
+        if not report_name.endswith(".csv"):
+            report_name += "_verified.csv"
+        jobs.append({
+            "report": report_name,
+            "sources": sources,
+            "md5": parse_manifest_flag(entry.get("md5"), USE_MD5),
+            "skip_summarise_img_seq": parse_manifest_flag(entry.get("skip_summarise_img_seq"), SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM),
+        })
+    return jobs
+
+
+def reset_job_state():
     global total_source_file_count
     global total_touched_files
-    global USE_MD5
-    global SAVE_LOCATION
-    global SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM
     global output_csv_matched_list
     global output_csv_unfound_list
     global output_csv_mismatched_list
     global previous_img_sequence_hash
     global frames_in_src_img_seq_clip
     global frames_in_dest_img_seq_clip
-    global destination_toc_length
-    global five_percent_toc_length
-    global last_matched_location
+    global summary_status_counts
+    global summary_status_bytes
+    global summary_offending_paths
+    global fail_fast_triggered
     total_source_file_count = 0
     total_touched_files = 0
-    USE_MD5 = False
-    SAVE_LOCATION = os.path.expanduser("~/Desktop/MHL_Verification_Reports/")
-    SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM = False
     output_csv_matched_list = []
     output_csv_unfound_list = []
     output_csv_mismatched_list = []
     previous_img_sequence_hash = None
     frames_in_src_img_seq_clip = []
     frames_in_dest_img_seq_clip = []
-    destination_toc_length = 0
-    five_percent_toc_length = 0
-    last_matched_location = 0
\ No newline at end of file
+    summary_status_counts = {'MATCHED': 0, 'MISMATCHED': 0, 'UNFOUND': 0}
+    summary_status_bytes = {'MATCHED': 0, 'MISMATCHED': 0, 'UNFOUND': 0}
+    summary_offending_paths = []
+    fail_fast_triggered = False
+
+
+def is_job_passed(job_summary):
+    return not job_summary["output_csv_mismatched_list_length"] and not job_summary["output_csv_unfound_list_length"]
+
+
+def export_batch_summary_csv(batch_summary_name, job_summaries):
+    with open_output(output_path(batch_summary_name, COMPRESS_OUTPUT), COMPRESS_OUTPUT) as new_file:
+        header = ['Report', 'Sources', 'Source Hashes', 'Files Processed', 'Matched', 'Mismatched', 'Unfound', 'Result']
+        csv_writer = csv.writer(new_file)
+        csv_writer.writerow(header)
+        for job_summary in job_summaries:
+            csv_writer.writerow([
+                job_summary["report"],
+                ";".join(os.path.basename(source) for source in job_summary["sources"]),
+                job_summary["total_source_file_count"],
+                job_summary["total_touched_files"],
+                job_summary["output_csv_matched_list_length"],
+                job_summary["output_csv_mismatched_list_length"],
+                job_summary["output_csv_unfound_list_length"],
+                "PASSED" if is_job_passed(job_summary) else "FAILED",
+            ])
+    print(f"\n\t{DEFAULT}Batch complete. Roll-up summary CSV has been saved to {output_path(batch_summary_name, COMPRESS_OUTPUT)}")
+
+
+def run_batch(manifest_path, destination, destination_index):
+    global output_report_csv_name
+    global USE_MD5
+    global SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM
+    jobs = load_manifest(manifest_path)
+    job_summaries = []
+
+    for job_number, job in enumerate(jobs, start=1):
+        print(f"\t{BLUE}Batch job {job_number} of {len(jobs)}: {job['report']}{DEFAULT}")
+        reset_job_state()
+        USE_MD5 = job["md5"]
+        SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM = job["skip_summarise_img_seq"]
+        output_report_csv_name = job["report"]
+        source_hash_list = build_hash_list(job["sources"])
+        run_comparison(source_hash_list, destination_index)
+        export_output_csv()
+        job_summaries.append(dict(report_summary(), report=job["report"], sources=job["sources"]))
+
+    batch_summary_name = f"{os.path.basename(destination).split('.')[0]}_batch_summary.csv"
+    export_batch_summary_csv(batch_summary_name, job_summaries)
+    copy_csv_content_to_clipboard(output_path(batch_summary_name, COMPRESS_OUTPUT))
+    return job_summaries
+
+
+def mhl_chain_or_file(mhl_path):
+    # An ASC MHL volume changes when a generation is added to its chain, so its chain file stands in for the volume
+    ascmhl_folder = find_ascmhl_folder(mhl_path)
+    return os.path.join(ascmhl_folder, ASCMHL_CHAIN_FILE) if ascmhl_folder else mhl_path
+
+
+def mhl_file_stat(mhl_path):
+    stat = os.stat(mhl_chain_or_file(mhl_path))
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def mhl_file_digest(mhl_path):
+    digest = xxhash.xxh64()
+    with open(mhl_chain_or_file(mhl_path), 'rb') as mhl_file:
+        for chunk in iter(lambda: mhl_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_mhl_unchanged(mhl_path, recorded):
+    # Size and mtime are enough to skip a file, the digest catches MHLs that were only touched or copied again
+    if not recorded:
+        return False
+    current = mhl_file_stat(mhl_path)
+    if current["size"] != recorded["size"]:
+        return False
+    if current["mtime"] == recorded["mtime"]:
+        return True
+    if mhl_file_digest(mhl_path) == recorded["digest"]:
+        recorded["mtime"] = current["mtime"]
+        return True
+    return False
+
+
+def load_verification_state(state_path):
+    if not os.path.isfile(state_path):
+        return {"sources": {}}
+    with open(state_path) as state_file:
+        return json.load(state_file)
+
+
+def save_verification_state(state_path, state):
+    # Written to a temporary file first so an interrupted run never leaves a half written state file
+    with open(state_path + ".tmp", 'w') as state_file:
+        json.dump(state, state_file)
+    os.replace(state_path + ".tmp", state_path)
+
+
+def run_incremental(arguments):
+    global output_report_csv_name
+    global total_source_file_count
+    global total_touched_files
+    state = load_verification_state(arguments.state)
+    settings = {"md5": USE_MD5, "skip_summarise_img_seq": SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM}
+    if state.get("settings") != settings:
+        state["sources"] = {}
+    destination_path = os.path.abspath(arguments.destination.strip())
+    destination_changed = not is_mhl_unchanged(destination_path, state.get("destination"))
+
+    recorded_sources = state["sources"]
+    current_sources = {}
+    sources_to_check = []
+    for source in arguments.sources:
+        source_path = os.path.abspath(source.strip())
+        recorded = recorded_sources.get(source_path)
+        if not is_mhl_unchanged(source_path, recorded):
+            sources_to_check.append(source_path)
+        elif destination_changed:
+            # The destination has grown or changed, files it was missing might be there now and files it matched might not be
+            sources_to_check.append(source_path)
+        current_sources[source_path] = recorded
+    print(f"\t{DEFAULT}{len(arguments.sources) - len(sources_to_check)} source MHLs unchanged since the last run, {len(sources_to_check)} to check.\n")
+
+    if sources_to_check:
+        destination_index = build_destination_index(destination_path)
+        for source_path in sources_to_check:
+            reset_job_state()
+            run_comparison(build_hash_list([source_path]), destination_index)
+            current_sources[source_path] = dict(
+                mhl_file_stat(source_path),
+                digest=mhl_file_digest(source_path),
+                total_source_file_count=total_source_file_count,
+                total_touched_files=total_touched_files,
+                rows={"MATCHED": [list(row) for row in output_csv_matched_list], "MISMATCHED": [list(row) for row in output_csv_mismatched_list], "UNFOUND": [list(row) for row in output_csv_unfound_list]},
+            )
+
+    state["settings"] = settings
+    if destination_changed:
+        state["destination"] = dict(mhl_file_stat(destination_path), digest=mhl_file_digest(destination_path))
+    state["sources"] = current_sources
+    save_verification_state(arguments.state, state)
+
+    # Merge every source's rows back into the output lists to build the cumulative report
+    reset_job_state()
+    for recorded in current_sources.values():
+        total_source_file_count += recorded["total_source_file_count"]
+        total_touched_files += recorded["total_touched_files"]
+        for status in ("MATCHED", "MISMATCHED", "UNFOUND"):
+            for row in recorded["rows"][status]:
+                add_row_to_output_list(row)
+    output_report_csv_name = f"{os.path.basename(arguments.destination).split('.')[0]}_verfied.csv"
+    export_output_csv()
+    copy_csv_content_to_clipboard(output_path(output_report_csv_name, COMPRESS_OUTPUT))
+
+    if __name__ != '__main__':
+        return dict(report_summary(), checked_sources=sources_to_check)
+
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+
+
+def open_inotify():
+    # Linux only, returns None elsewhere (eg: macOS) so the watch falls back to polling the folder
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        inotify_fd = libc.inotify_init1(os.O_NONBLOCK)
+    except (OSError, AttributeError, TypeError):
+        return None
+    if inotify_fd < 0:
+        return None
+    return {"libc": libc, "fd": inotify_fd, "watch_dirs": {}}
+
+
+def add_inotify_watches(inotify, folder):
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith(".")]
+        watch_descriptor = inotify["libc"].inotify_add_watch(inotify["fd"], os.fsencode(dirpath), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if watch_descriptor >= 0:
+            inotify["watch_dirs"][watch_descriptor] = dirpath
+
+
+def read_inotify_events(inotify, timeout):
+    # Returns the paths inotify reported as written or moved into the watched folders
+    changed_paths = []
+    readable, _, _ = select.select([inotify["fd"]], [], [], timeout)
+    if not readable:
+        return changed_paths
+    try:
+        buffer = os.read(inotify["fd"], 64 * 1024)
+    except BlockingIOError:
+        return changed_paths
+    offset = 0
+    while offset < len(buffer):
+        watch_descriptor, mask, cookie, name_length = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+        offset += INOTIFY_EVENT_HEADER.size
+        name = buffer[offset:offset + name_length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+        offset += name_length
+        if watch_descriptor not in inotify["watch_dirs"]:
+            continue
+        path = os.path.join(inotify["watch_dirs"][watch_descriptor], name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # New roll folder, watch it and pick up any MHLs that landed before the watch was added
+                add_inotify_watches(inotify, path)
+                changed_paths.extend(scan_watch_folder(path))
+        else:
+            changed_paths.append(path)
+    return changed_paths
+
+
+def is_watched_mhl(path):
+    # Compressed MHLs are picked up too, hidden files (eg: ._A001.mhl) are not
+    return path.endswith(MHL_SUFFIXES) and not os.path.basename(path).startswith(".")
+
+
+def scan_watch_folder(watch_folder):
+    mhl_stats = {}
+    for dirpath, dirnames, filenames in os.walk(watch_folder):
+        dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith(".")]
+        for filename in filenames:
+            mhl_path = os.path.join(dirpath, filename)
+            if is_watched_mhl(mhl_path):
+                try:
+                    mhl_stats[mhl_path] = mhl_file_stat(mhl_path)
+                except FileNotFoundError:
+                    pass
+    return mhl_stats
+
+
+def append_rows_to_rolling_report(rolling_report_path, mhl_path, rows):
+    is_new_report = not os.path.isfile(rolling_report_path)
+    checked_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with open(rolling_report_path, 'a') as report_file:
+        csv_writer = csv.writer(report_file)
+        if is_new_report:
+            csv_writer.writerow(['Checked At', 'Source MHL'] + OUTPUT_CSV_HEADER)
+        for row in rows:
+            csv_writer.writerow([checked_at, os.path.basename(mhl_path)] + list(row))
+
+
+def verify_watched_mhl(mhl_path, destination_index, rolling_report_path, is_last_try=False):
+    reset_job_state()
+    # Errors from the XML parser and each decompressor for an MHL that is cut short or corrupt
+    read_errors = (et.ParseError, EOFError, OSError, lzma.LZMAError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+    try:
+        source_hash_list = build_hash_list([mhl_path])
+    except read_errors as error:
+        if not is_last_try:
+            # Still being written, try again once it has settled again
+            return False
+        failed_row = ['FAILED', f"MHL could not be read: {error}"] + [''] * (len(OUTPUT_CSV_HEADER) - 2)
+        append_rows_to_rolling_report(rolling_report_path, mhl_path, [failed_row])
+        print(f"\t{RED}{os.path.basename(mhl_path)}: could not be read after {WATCH_MAX_RETRIES} tries, logged as failed ({error}){DEFAULT}")
+        return True
+    run_comparison(source_hash_list, destination_index)
+    append_rows_to_rolling_report(rolling_report_path, mhl_path, output_csv_matched_list + output_csv_mismatched_list + output_csv_unfound_list)
+    colour = GREEN if not failed_hash_count() else RED
+    print(f"\t{colour}{os.path.basename(mhl_path)}: {len(output_csv_matched_list)} matched, {len(output_csv_mismatched_list)} mismatched, {len(output_csv_unfound_list)} unfound{DEFAULT}")
+    return True
+
+
+def watch_folder(watch_folder_path, destination, destination_index, max_polls=None):
+    # Keeps the destination index in memory and checks each new MHL once its size and modified time stop changing
+    rolling_report_path = SAVE_LOCATION + f"{os.path.basename(destination).split('.')[0]}_watch_verified.csv"
+    checked_mhls = scan_watch_folder(watch_folder_path)
+    pending_mhls = {}
+    inotify = open_inotify()
+    if inotify:
+        add_inotify_watches(inotify, watch_folder_path)
+        print(f"\t{DEFAULT}Watching {watch_folder_path} for new MHLs (inotify). {len(checked_mhls)} existing MHLs skipped.")
+    else:
+        print(f"\t{DEFAULT}Watching {watch_folder_path} for new MHLs (polling every {WATCH_POLL_SECONDS}s). {len(checked_mhls)} existing MHLs skipped.")
+    print(f"\tResults are appended to {rolling_report_path}. Press Ctrl+C to stop.\n")
+
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            polls += 1
+            if inotify:
+                changed_paths = read_inotify_events(inotify, WATCH_SETTLE_SECONDS if pending_mhls else None)
+                changed_paths = [path for path in changed_paths if is_watched_mhl(path)]
+            else:
+                if polls > 1:
+                    time.sleep(WATCH_POLL_SECONDS)
+                current_mhls = scan_watch_folder(watch_folder_path)
+                changed_paths = [path for path, stat in current_mhls.items() if checked_mhls.get(path) != stat]
+
+            now = time.time()
+            for path in changed_paths:
+                try:
+                    stat = mhl_file_stat(path)
+                except FileNotFoundError:
+                    pending_mhls.pop(path, None)
+                    continue
+                if path not in pending_mhls or pending_mhls[path][0] != stat:
+                    pending_mhls[path] = (stat, now, 0)
+
+            for path, (last_stat, last_changed, failed_tries) in list(pending_mhls.items()):
+                try:
+                    current_stat = mhl_file_stat(path)
+                except FileNotFoundError:
+                    del pending_mhls[path]
+                    continue
+                if current_stat != last_stat:
+                    # Still growing, the tries only count once it has stopped changing
+                    pending_mhls[path] = (current_stat, now, 0)
+                elif now - last_changed >= WATCH_SETTLE_SECONDS:
+                    if verify_watched_mhl(path, destination_index, rolling_report_path, failed_tries + 1 >= WATCH_MAX_RETRIES):
+                        checked_mhls[path] = current_stat
+                        del pending_mhls[path]
+                    else:
+                        pending_mhls[path] = (current_stat, now, failed_tries + 1)
+    except KeyboardInterrupt:
+        print(f"\n\t{DEFAULT}Stopped watching {watch_folder_path}.")
+    finally:
+        if inotify:
+            os.close(inotify["fd"])
+    return rolling_report_path
+
+
+def main(argv):
+    global output_report_csv_name
+    arguments = args_parse(argv)
+    print_info()
+    create_save_directory()
+    if arguments.state:
+        print(f"\t{YELLOW}Incremental check using state file {arguments.state}{DEFAULT}")
+        return run_incremental(arguments)
+    destination_index = build_destination_index(arguments.destination)
+
+    if arguments.watch:
+        rolling_report_path = watch_folder(arguments.watch, arguments.destination, destination_index)
+        if __name__ != '__main__':
+            return rolling_report_path
+        return
+
+    if arguments.manifest:
+        job_summaries = run_batch(arguments.manifest, arguments.destination, destination_index)
+        # Per job counts returned when running tests
+        if __name__ != '__main__':
+            return job_summaries
+        # Scripted batch runs can tell from the exit status that a job failed
+        return 0 if all(map(is_job_passed, job_summaries)) else 1
+
+    # output_report_csv_name = "_".join(map(lambda x: os.path.basename(x).split("_")[0].split(".")[0], arguments.sources))
+    # output_report_csv_name += "_verified.csv"
+    output_report_csv_name = f"{os.path.basename(arguments.destination).split('.')[0]}_verfied.csv"
+
+    if SUMMARY_ONLY_PATH_LIMIT is not None:
+        run_comparison(follow_source_hashes(arguments.sources) if arguments.follow else iter_source_hashes(arguments.sources), destination_index)
+        print_summary_only()
+        if __name__ != '__main__':
+            return report_summary()
+        return 1 if summary_status_counts['MISMATCHED'] or summary_status_counts['UNFOUND'] else 0
+
+    if arguments.follow:
+        try:
+            run_comparison(follow_source_hashes(arguments.sources), destination_index)
+        except KeyboardInterrupt:
+            print(f"\n\t{RED}Stopped following before the source MHLs were complete. This is a partial report.{DEFAULT}")
+    elif FAIL_FAST_LIMIT is not None:
+        # Stream the sources so a failing check stops without reading the rest of the MHLs
+        run_comparison(iter_source_hashes(arguments.sources), destination_index)
+    else:
+        source_hash_list = build_hash_list(arguments.sources)
+        run_comparison(source_hash_list, destination_index)
+    export_output_csv()
+    copy_csv_content_to_clipboard(output_path(output_report_csv_name, COMPRESS_OUTPUT))
+
+    # Counts returned when running tests 
+    if __name__ != '__main__':
+        return report_summary()
+    if fail_fast_triggered:
+        return 1
+
+
+# Runs when opened from command line, passing sys.argv through to allow tests to run script
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
+
+
+def reset_for_tests():
+    # Tests dont run independently, so we need to reset the global variables
+    global USE_MD5
+    global SAVE_LOCATION
+    global SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM
+    global SUMMARY_ONLY_PATH_LIMIT
+    global FAIL_FAST_LIMIT
+    global COMPRESS_OUTPUT
+    global PREFETCH_FILES
+    global PREFETCH_MAX_BYTES
+    global XML_BACKEND
+    global LAZY_FIELDS_MIN_BYTES
+    global USE_DISK_INDEX
+    global SHARD_COUNT
+    reset_job_state()
+    USE_MD5 = False
+    SAVE_LOCATION = os.path.expanduser("~/Desktop/MHL_Verification_Reports/")
+    SKIP_IMAGE_SEQ_TO_CLIP_CHECKSUM = False
+    SUMMARY_ONLY_PATH_LIMIT = None
+    FAIL_FAST_LIMIT = None
+    COMPRESS_OUTPUT = None
+    PREFETCH_FILES = 4
+    PREFETCH_MAX_BYTES = 256 * 1024 * 1024
+    XML_BACKEND = 'auto'
+    LAZY_FIELDS_MIN_BYTES = 8 * 1024 * 1024
+    USE_DISK_INDEX = False
+    SHARD_COUNT = 1
@@ -0,0 +1,124 @@
+"""
+Unit tests for ascmhl_writer.py
+Run with:
+$ pytest test_ascmhl_writer.py -vs
+
+#    ✅ 1. Writes a compare report as an ASC MHL v2 generation with a chain file
+#    ✅ 2. Adds later generations to the chain
+#    ✅ 3. Streams re-hash results into a generation in the root's ascmhl folder, saving the files checked before a stopped re-hash
+#    ✅ 4. Memory use does not grow with the number of hashes written
+"""
+
+import os
+import tempfile
+import tracemalloc
+import unittest
+import xml.etree.ElementTree as et
+import ascmhl_writer
+import mhl_rehash
+import source_destination_mhl_compare as mhl_compare
+from test_mhl_rehash import MEDIA_FILES, write_mhl
+
+NAMESPACES = {'mhl': ascmhl_writer.ASC_MHL_NAMESPACE, 'chain': ascmhl_writer.ASC_MHL_DIRECTORY_NAMESPACE}
+
+
+class TestAscMhlWriter(unittest.TestCase):
+    def setUp(self):
+        mhl_rehash.reset_for_tests()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.temp_dir.name, 'RESTORE')
+        os.makedirs(self.root)
+        self.output_dir = os.path.join(self.temp_dir.name, 'reports') + '/'
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_writes_report_as_generation(self):
+        mhl_compare.main(['source_destination_mhl_compare.py', '-s', 'tests/fixtures/test-wrong-xxhash-src.mhl', '-d', 'tests/fixtures/test-wrong-xxhash-dest.mhl', '-o', self.output_dir])
+        report_path = self.output_dir + 'test-wrong-xxhash-dest_verfied.csv'
+        report_summary = ascmhl_writer.main(['ascmhl_writer.py', report_path, '-r', self.root])
+
+        assert report_summary["sequence_number"] == 1
+        assert report_summary["hash_count"] == len(mhl_compare.output_csv_matched_list) + len(mhl_compare.output_csv_mismatched_list)
+        assert report_summary["skipped_rows"] == len(mhl_compare.output_csv_unfound_list)
+        assert os.path.dirname(report_summary["generation_path"]) == os.path.join(self.root, 'ascmhl')
+        assert os.path.basename(report_summary["generation_path"]).startswith('0001_RESTORE_')
+        hashlist = et.parse(report_summary["generation_path"]).getroot()
+        assert hashlist.attrib['version'] == '2.0'
+        actions = [element.attrib['action'] for element in hashlist.iterfind('mhl:hashes/mhl:hash/mhl:xxh64', NAMESPACES)]
+        assert actions.count('failed') == len(mhl_compare.output_csv_mismatched_list)
+        # The generation reads back with the same files and checksums as the report
+        generation_hashes = {hash.file: hash.xxhash64be for hash in mhl_compare.parse_mhl_hashes(report_summary["generation_path"])}
+        assert generation_hashes == {row[6]: row[8].lower() for row in mhl_compare.output_csv_matched_list + mhl_compare.output_csv_mismatched_list}
+
+        chain = et.parse(os.path.join(self.root, 'ascmhl', 'ascmhl_chain.xml')).getroot()
+        assert chain.find('chain:hashlist/chain:path', NAMESPACES).text == os.path.basename(report_summary["generation_path"])
+        assert chain.find('chain:hashlist/chain:c4', NAMESPACES).text == ascmhl_writer.c4_id(report_summary["generation_path"])
+        assert len(ascmhl_writer.c4_id(report_summary["generation_path"])) == 90
+
+    def test_adds_generations_to_chain(self):
+        with ascmhl_writer.AscMhlWriter(self.root) as writer:
+            writer.add_hash('A001/A001C001.mxf', 10, {'xxh64': '0EA03B369A463D9D'}, 'original')
+        with ascmhl_writer.AscMhlWriter(self.root) as second_writer:
+            second_writer.add_hash('A001/A001C001.mxf', 10, {'xxh64': '0ea03b369a463d9d'}, 'verified')
+
+        assert second_writer.sequence_number == 2
+        assert [entry[0] for entry in ascmhl_writer.read_ascmhl_chain(os.path.join(self.root, 'ascmhl'))] == [1, 2]
+        # A generation that fails part way is never added to the chain
+        with self.assertRaises(ValueError):
+            with ascmhl_writer.AscMhlWriter(self.root) as failed_writer:
+                raise ValueError()
+        assert len(ascmhl_writer.read_ascmhl_chain(os.path.join(self.root, 'ascmhl'))) == 2
+        assert not os.path.exists(failed_writer.generation_path + '.tmp')
+
+    def test_rehash_writes_generation(self):
+        for file, content in MEDIA_FILES.items():
+            os.makedirs(os.path.dirname(os.path.join(self.root, file)), exist_ok=True)
+            with open(os.path.join(self.root, file), 'wb') as media_file:
+                media_file.write(content)
+        mhl_path = os.path.join(self.temp_dir.name, 'A001.mhl')
+        write_mhl(mhl_path, MEDIA_FILES)
+        mhl_rehash.main(['mhl_rehash.py', mhl_path, '-r', self.root, '-o', self.output_dir, '--write-mhl'])
+
+        generations = [file for file in os.listdir(os.path.join(self.root, 'ascmhl')) if file.endswith('.mhl')]
+        assert len(generations) == 1
+        generation_hashes = list(mhl_compare.parse_mhl_hashes(os.path.join(self.root, 'ascmhl', generations[0])))
+        assert sorted(hash.file for hash in generation_hashes) == sorted(MEDIA_FILES)
+        assert all(hash.hashdate for hash in generation_hashes)
+
+    def test_stopped_rehash_writes_files_checked_so_far(self):
+        for file, content in MEDIA_FILES.items():
+            os.makedirs(os.path.dirname(os.path.join(self.root, file)), exist_ok=True)
+            with open(os.path.join(self.root, file), 'wb') as media_file:
+                media_file.write(content)
+        mhl_path = os.path.join(self.temp_dir.name, 'A001.mhl')
+        write_mhl(mhl_path, MEDIA_FILES)
+        hash_file = mhl_rehash.hash_file
+
+        def stopped_hash_file(path, device=None, hasher=None):
+            # Ctrl+C while the last file is being hashed
+            if path.endswith('A001C003.mxf'):
+                raise KeyboardInterrupt
+            return hash_file(path, device, hasher)
+
+        mhl_rehash.hash_file = stopped_hash_file
+        try:
+            assert mhl_rehash.main(['mhl_rehash.py', mhl_path, '-r', self.root, '-o', self.output_dir, '--write-mhl', '--workers', '1']) == 1
+        finally:
+            mhl_rehash.hash_file = hash_file
+
+        generations = [file for file in os.listdir(os.path.join(self.root, 'ascmhl')) if file.endswith('.mhl')]
+        generation_hashes = list(mhl_compare.parse_mhl_hashes(os.path.join(self.root, 'ascmhl', generations[0])))
+        assert sorted(hash.file for hash in generation_hashes) == ['A001/A001C001.mxf', 'A001/A001C002.mxf']
+
+    def test_memory_does_not_grow_with_hash_count(self):
+        peaks = []
+        for hash_count in (2000, 20000):
+            tracemalloc.start()
+            with ascmhl_writer.AscMhlWriter(self.root) as writer:
+                for index in range(hash_count):
+                    writer.add_hash(f'A001/A001C{index:06d}.mxf', index, {'xxh64': f'{index:016x}'}, 'verified', '2021-10-27T19:15:03Z')
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        assert peaks[1] < peaks[0] * 2
@@ -0,0 +1,120 @@
+"""
+Unit tests for duplicate_finder.py
+Run with:
+$ pytest test_duplicate_finder.py -vs
+
+#    ✅ 1. Finds media duplicated across drives and MHLs with the bytes that can be reclaimed
+#    ✅ 2. Only reads files that share a size, and only fully hashes files whose partial hash collides
+#    ✅ 3. Duplicates between MHLs are found from their checksums without reading any media
+#    ✅ 4. MD5 only MHLs are matched with files on disk and xxHash MHLs, MHL entries with other checksums are left out
+#    ✅ 5. Files on disk the same size as an MHL entry are partially hashed first, files that can not be read are reported
+"""
+
+import csv
+import os
+import tempfile
+import unittest
+import duplicate_finder
+from test_mhl_rehash import write_mhl
+
+
+class TestDuplicateFinder(unittest.TestCase):
+    def setUp(self):
+        duplicate_finder.reset_for_tests()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = os.path.join(self.temp_dir.name, 'reports') + '/'
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_files(self, volume, media_files):
+        root = os.path.join(self.temp_dir.name, volume)
+        for file, content in media_files.items():
+            os.makedirs(os.path.dirname(os.path.join(root, file)), exist_ok=True)
+            with open(os.path.join(root, file), 'wb') as media_file:
+                media_file.write(content)
+        return root
+
+    def test_finds_duplicates_across_drives_and_mhls(self):
+        shuttle = self.write_files('SHUTTLE_01', {'A001/A001C001.mxf': b'clip one' * 100, 'A001/A001C002.mxf': b'clip two' * 100})
+        raid = self.write_files('RAID', {'Day01/A001/A001C001.mxf': b'clip one' * 100, 'Day01/B001/B001C001.mxf': b'b camera'})
+        lto_mhl = os.path.join(self.temp_dir.name, 'LTO001.mhl')
+        write_mhl(lto_mhl, {'Day01/A001/A001C001.mxf': b'clip one' * 100, 'Day01/B001/B001C001.mxf': b'b camera', 'Day01/B001/B001C002.mxf': b'b camera'})
+        report_summary = duplicate_finder.main(['duplicate_finder.py', shuttle, raid + '/', lto_mhl, '-o', self.output_dir])
+
+        assert report_summary["total_files"] == 7
+        assert report_summary["duplicate_group_count"] == 2
+        assert report_summary["reclaimable_bytes"] == 800 * 2 + 8 * 2
+        with open(self.output_dir + 'SHUTTLE_01_RAID_LTO001_duplicates.csv') as report_file:
+            rows = list(csv.reader(report_file))
+        assert rows[0] == duplicate_finder.DUPLICATES_CSV_HEADER
+        assert [(row[0], row[3], row[5], row[6]) for row in rows[1:4]] == [
+            ('1', '3', shuttle, 'A001/A001C001.mxf'),
+            ('1', '3', raid, 'Day01/A001/A001C001.mxf'),
+            ('1', '3', lto_mhl, 'Day01/A001/A001C001.mxf'),
+        ]
+        assert [row[6] for row in rows[4:]] == ['Day01/B001/B001C001.mxf', 'Day01/B001/B001C001.mxf', 'Day01/B001/B001C002.mxf']
+
+    def test_only_hashes_collisions(self):
+        head, tail = b'H' * 2048, b'T' * 2048
+        shuttle = self.write_files('SHUTTLE_01', {
+            'A001/A001C001.mxf': head + b'1' * 4096 + tail,
+            'A001/A001C002.mxf': head + b'2' * 4096 + tail,
+            'A001/A001C003.mxf': b'different start' + b'3' * 8177,
+            'A001/A001C004.mxf': b'a unique size',
+        })
+        raid = self.write_files('RAID', {'A001/A001C001.mxf': head + b'1' * 4096 + tail, 'A001/A001C005.mxf': b''})
+        report_summary = duplicate_finder.main(['duplicate_finder.py', shuttle, raid, '-o', self.output_dir, '--partial-mib', '0.001'])
+
+        # The unique size and the empty file are never read, the different start drops out after the partial hash
+        assert report_summary["size_candidate_files"] == 4
+        assert report_summary["partial_hashed_files"] == 4
+        assert report_summary["full_hashed_files"] == 3
+        assert report_summary["duplicate_group_count"] == 1
+        assert report_summary["reclaimable_bytes"] == 8192
+        assert duplicate_finder.duplicate_groups[0][2] == [(0, 'A001/A001C001.mxf'), (1, 'A001/A001C001.mxf')]
+
+    def test_mhl_duplicates_need_no_hashing(self):
+        frames = {f'E007_C001_20211027_R1/E007_C001_20211027_R{frame:05d}.dng': bytes([frame]) * 64 for frame in range(5)}
+        first_mhl = os.path.join(self.temp_dir.name, 'SHUTTLE_01.mhl')
+        second_mhl = os.path.join(self.temp_dir.name, 'SHUTTLE_02.mhl')
+        write_mhl(first_mhl, frames)
+        write_mhl(second_mhl, dict(list(frames.items())[:3]))
+        report_summary = duplicate_finder.main(['duplicate_finder.py', first_mhl, second_mhl, '-o', self.output_dir])
+
+        assert report_summary["partial_hashed_files"] == 0
+        assert report_summary["full_hashed_files"] == 0
+        assert report_summary["duplicate_group_count"] == 3
+        assert report_summary["reclaimable_bytes"] == 3 * 64
+
+    def test_md5_only_mhls_and_unsupported_checksums(self):
+        shuttle = self.write_files('SHUTTLE_01', {'A001/A001C001.mxf': b'clip one' * 100, 'A001/A001C002.mxf': b'clip two' * 100})
+        md5_mhl = os.path.join(self.temp_dir.name, 'LTO001.mhl')
+        write_mhl(md5_mhl, {'A001/A001C001.mxf': b'clip one' * 100}, use_md5=True)
+        xxhash_mhl = os.path.join(self.temp_dir.name, 'LTO002.mhl')
+        write_mhl(xxhash_mhl, {'A001/A001C001.mxf': b'clip one' * 100})
+        c4_mhl = os.path.join(self.temp_dir.name, 'C4.mhl')
+        with open(c4_mhl, 'w') as mhl_file:
+            mhl_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<hashlist version="1.1">\n  <hash>\n    <file>A001/A001C002.mxf</file>\n'
+                           '    <size>800</size>\n    <c4>c45zwa9rxLzJZ8aQFpcvddtkrWaxhYVkQtjJqz5hm1rnENwD1A2E</c4>\n  </hash>\n</hashlist>\n')
+        report_summary = duplicate_finder.main(['duplicate_finder.py', shuttle, md5_mhl, xxhash_mhl, c4_mhl, '-o', self.output_dir])
+
+        assert report_summary["unsupported_checksum_files"] == 1
+        assert report_summary["full_hashed_files"] == 2
+        assert report_summary["duplicate_group_count"] == 1
+        # The shuttle, the MD5 MHL and the xxHash MHL, nothing from the C4 MHL
+        assert duplicate_finder.duplicate_groups[0][2] == [(0, 'A001/A001C001.mxf'), (1, 'A001/A001C001.mxf'), (2, 'A001/A001C001.mxf')]
+
+    def test_partial_hashes_next_to_mhl_entries_and_reports_unreadable_files(self):
+        # A decomposed name (as macOS can hand back) no longer opens once the path is normalised
+        decomposed_name = 'A001/A001C003_U\u0308.mxf'
+        shuttle = self.write_files('SHUTTLE_01', {'A001/A001C001.mxf': b'clip one' * 100, 'A001/A001C002.mxf': b'clip two' * 100, decomposed_name: b'clip ^3' * 100 + b'^' * 100})
+        lto_mhl = os.path.join(self.temp_dir.name, 'LTO001.mhl')
+        write_mhl(lto_mhl, {'A001/A001C001.mxf': b'clip one' * 100})
+        report_summary = duplicate_finder.main(['duplicate_finder.py', shuttle, lto_mhl, '-o', self.output_dir])
+
+        assert report_summary["partial_hashed_files"] == 2
+        assert report_summary["full_hashed_files"] == 2
+        assert report_summary["unreadable_file_count"] == 1
+        assert duplicate_finder.unreadable_files[0].endswith('A001C003_\u00dc.mxf')
+        assert duplicate_finder.duplicate_groups[0][2] == [(0, 'A001/A001C001.mxf'), (1, 'A001/A001C001.mxf')]
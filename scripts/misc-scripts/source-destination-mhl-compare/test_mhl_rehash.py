@@ -0,0 +1,262 @@
+"""
+Unit tests for mhl_rehash.py
+Run with:
+$ pytest test_mhl_rehash.py -vs
+
+#    ✅ 1. Matches files whose checksum is unchanged on disk
+#    ✅ 2. Reports changed files as mismatched and missing or unreadable files as unfound
+#    ✅ 3. Correctly uses xxhash or MD5
+#    ✅ 4. Groups files by device and orders them for sequential reads, hashing unidentified drives in parallel
+#    ✅ 5. Read-ahead hashing of large files gives the same checksum
+#    ✅ 6. Resumes from the journal, only re-hashing files that changed or were not reached
+#    ✅ 7. Writes the report from the journal alone
+#    ✅ 8. Samples image sequence frames reproducibly, always hashing the first and last frame
+#    ✅ 9. Quick check flags truncated, zero-filled and missing files and reuses cached partial checksums
+"""
+
+import csv
+import errno
+import hashlib
+import os
+import tempfile
+import unittest
+import xxhash
+import mhl_rehash
+
+MEDIA_FILES = {
+    'A001/A001C001.mxf': b'\x00\x01' * 700000,
+    'A001/A001C002.mxf': b'clip two' * 1000,
+    'A001/A001C003.mxf': b'',
+}
+
+
+def write_mhl(mhl_path, media_files, use_md5=False):
+    with open(mhl_path, 'w') as mhl_file:
+        mhl_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<hashlist version="1.1">\n')
+        for file, content in media_files.items():
+            checksum = f'<md5>{hashlib.md5(content).hexdigest()}</md5>' if use_md5 else f'<xxhash64be>{xxhash.xxh64(content).hexdigest()}</xxhash64be>'
+            mhl_file.write(f'  <hash>\n    <file>{file}</file>\n    <size>{len(content)}</size>\n    {checksum}\n    <hashdate>2021-10-27T19:15:03Z</hashdate>\n  </hash>\n')
+        mhl_file.write('</hashlist>\n')
+
+
+class TestMhlRehash(unittest.TestCase):
+    def setUp(self):
+        mhl_rehash.reset_for_tests()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.temp_dir.name, 'volume')
+        for file, content in MEDIA_FILES.items():
+            os.makedirs(os.path.dirname(os.path.join(self.root, file)), exist_ok=True)
+            with open(os.path.join(self.root, file), 'wb') as media_file:
+                media_file.write(content)
+        self.output_dir = os.path.join(self.temp_dir.name, 'reports') + '/'
+        self.mhl_path = os.path.join(self.temp_dir.name, 'A001.mhl')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_matches_unchanged_files(self):
+        write_mhl(self.mhl_path, MEDIA_FILES)
+        report_summary = mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir, '--device-workers', 'hdd=2,ssd=2'])
+
+        assert report_summary["files_hashed"] == 3
+        assert report_summary["total_bytes_hashed"] == sum(len(content) for content in MEDIA_FILES.values())
+        assert report_summary["output_csv_matched_list_length"] == 3
+        assert os.path.isfile(self.output_dir + 'A001_rehash_verified.csv')
+
+    def test_detects_changed_and_missing_files(self):
+        write_mhl(self.mhl_path, dict(MEDIA_FILES, **{'A001/A001C004.mxf': b'missing'}))
+        with open(os.path.join(self.root, 'A001/A001C002.mxf'), 'r+b') as media_file:
+            media_file.write(b'CLIP')
+        report_summary = mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir])
+
+        assert report_summary["output_csv_matched_list_length"] == 2
+        assert report_summary["output_csv_mismatched_list_length"] == 1
+        assert report_summary["output_csv_unfound_list_length"] == 1
+        assert mhl_rehash.output_csv_mismatched_list[0][1] == 'A001/A001C002.mxf'
+
+    def test_unreadable_file_is_unfound(self):
+        write_mhl(self.mhl_path, MEDIA_FILES)
+        hash_file = mhl_rehash.hash_file
+
+        def failing_hash_file(path, device=None):
+            if path.endswith('A001C002.mxf'):
+                raise OSError(errno.EIO, os.strerror(errno.EIO), path)
+            return hash_file(path, device)
+
+        mhl_rehash.hash_file = failing_hash_file
+        try:
+            report_summary = mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir])
+        finally:
+            mhl_rehash.hash_file = hash_file
+
+        assert report_summary["output_csv_matched_list_length"] == 2
+        assert report_summary["output_csv_unfound_list_length"] == 1
+        assert mhl_rehash.output_csv_unfound_list[0][1] == 'A001/A001C002.mxf'
+
+    def test_md5(self):
+        write_mhl(self.mhl_path, MEDIA_FILES, use_md5=True)
+        report_summary = mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir, '--md5'])
+
+        assert report_summary["output_csv_matched_list_length"] == 3
+
+    def test_groups_files_by_device(self):
+        write_mhl(self.mhl_path, MEDIA_FILES)
+        jobs = [(source_hash, os.path.join(self.root, source_hash.file)) for source_hash in mhl_rehash.mhl_compare.parse_mhl_hashes(self.mhl_path)]
+        jobs.append((jobs[0][0], os.path.join(self.root, 'missing.mxf')))
+        device_queues, device_classes, file_stats = mhl_rehash.plan_device_queues(jobs)
+
+        assert list(device_queues) == [os.stat(self.root).st_dev]
+        assert list(device_classes.values())[0] in mhl_rehash.DEVICE_CLASS_WORKERS
+        queue = device_queues[os.stat(self.root).st_dev]
+        assert sorted(index for _, index, _ in queue) == [0, 1, 2]
+        assert [inode for inode, _, _ in queue] == sorted(os.stat(path).st_ino for _, path in jobs[:3])
+        assert sorted(file_stats) == [0, 1, 2]
+
+    def test_unidentified_drives_and_workers_override(self):
+        assert mhl_rehash.device_class(self.root, os.makedev(4095, 4095), []) == 'ssd'
+        assert mhl_rehash.device_class('/mnt/nas/A001', os.makedev(4095, 4095), [('/mnt/nas', 'nfs4')]) == 'network'
+        write_mhl(self.mhl_path, MEDIA_FILES)
+        report_summary = mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir, '-w', '3'])
+
+        assert mhl_rehash.HASH_WORKERS == 3
+        assert report_summary["output_csv_matched_list_length"] == 3
+
+    def test_multiple_mhls_with_a_root_each(self):
+        write_mhl(self.mhl_path, MEDIA_FILES)
+        second_root = os.path.join(self.temp_dir.name, 'shuttle')
+        os.makedirs(os.path.join(second_root, 'B001'))
+        with open(os.path.join(second_root, 'B001/B001C001.mxf'), 'wb') as media_file:
+            media_file.write(b'b camera')
+        second_mhl_path = os.path.join(self.temp_dir.name, 'B001.mhl')
+        write_mhl(second_mhl_path, {'B001/B001C001.mxf': b'b camera'})
+        report_summary = mhl_rehash.main(['mhl_rehash.py', self.mhl_path, second_mhl_path, '-r', self.root, second_root, '-o', self.output_dir])
+
+        assert report_summary["files_hashed"] == 4
+        assert report_summary["output_csv_matched_list_length"] == 4
+        assert sum(stats['files'] for stats in mhl_rehash.device_stats.values()) == 4
+
+    def test_read_ahead_matches_plain_read(self):
+        path = os.path.join(self.root, 'A001/A001C001.mxf')
+        plain_size, plain_digest = mhl_rehash.hash_file(path)
+        mhl_rehash.READ_AHEAD_MIN_SIZE, mhl_rehash.READ_BUFFER_SIZE = 0, 65536
+        mhl_rehash.thread_buffers.__dict__.clear()
+        try:
+            read_ahead_size, read_ahead_digest = mhl_rehash.hash_file(path)
+        finally:
+            mhl_rehash.READ_AHEAD_MIN_SIZE, mhl_rehash.READ_BUFFER_SIZE = 64 * 1024 * 1024, 8 * 1024 * 1024
+            mhl_rehash.thread_buffers.__dict__.clear()
+
+        assert plain_size == read_ahead_size == len(MEDIA_FILES['A001/A001C001.mxf'])
+        assert plain_digest == read_ahead_digest == xxhash.xxh64(MEDIA_FILES['A001/A001C001.mxf']).hexdigest()
+
+    def test_resume_only_hashes_files_not_journaled(self):
+        write_mhl(self.mhl_path, MEDIA_FILES)
+        mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir])
+        journal_path = self.output_dir + 'A001_rehash_journal.jsonl'
+        with open(journal_path) as journal:
+            lines = journal.readlines()
+        assert len(lines) == 3
+        # Lose the last file as if the job was stopped mid-write, and change another on disk
+        with open(journal_path, 'w') as journal:
+            journal.writelines(lines[:2] + [lines[2][:20]])
+        unfinished_file = next(file for file in MEDIA_FILES if file in lines[2])
+        changed_file = next(file for file in MEDIA_FILES if file in lines[0])
+        with open(os.path.join(self.root, changed_file), 'ab') as media_file:
+            media_file.write(b'changed')
+
+        mhl_rehash.reset_for_tests()
+        report_summary = mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir, '--resume'])
+
+        assert report_summary["files_hashed"] == 3
+        assert report_summary["total_bytes_hashed"] == len(MEDIA_FILES[unfinished_file]) + len(MEDIA_FILES[changed_file]) + len(b'changed')
+        assert report_summary["output_csv_matched_list_length"] == 2
+        assert report_summary["output_csv_mismatched_list_length"] == 1
+        assert len(mhl_rehash.load_journal(journal_path)) == 3
+
+    def test_report_from_journal(self):
+        write_mhl(self.mhl_path, dict(MEDIA_FILES, **{'A001/A001C004.mxf': b'missing'}))
+        mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir])
+        with open(self.output_dir + 'A001_rehash_verified.csv') as report:
+            hashed_report = sorted(csv.reader(report))
+        os.remove(self.output_dir + 'A001_rehash_verified.csv')
+
+        mhl_rehash.reset_for_tests()
+        report_summary = mhl_rehash.main(['mhl_rehash.py', '--report-from-journal', self.output_dir + 'A001_rehash_journal.jsonl', '-o', self.output_dir])
+
+        assert report_summary["output_csv_matched_list_length"] == 3
+        assert report_summary["output_csv_unfound_list_length"] == 1
+        with open(self.output_dir + 'A001_rehash_verified.csv') as report:
+            # Rows come out in the order files finished hashing
+            assert sorted(csv.reader(report)) == hashed_report
+
+    def test_samples_image_sequence_frames(self):
+        frames = {f'A002/A002C00{clip}_210101_R1AB.{frame:07d}.ari': f'clip {clip} frame {frame}'.encode() for clip in (1, 2) for frame in range(50)}
+        for file, content in frames.items():
+            os.makedirs(os.path.dirname(os.path.join(self.root, file)), exist_ok=True)
+            with open(os.path.join(self.root, file), 'wb') as media_file:
+                media_file.write(content)
+        write_mhl(self.mhl_path, dict(MEDIA_FILES, **frames))
+        jobs = [(source_hash, os.path.join(self.root, source_hash.file)) for source_hash in mhl_rehash.mhl_compare.parse_mhl_hashes(self.mhl_path)]
+        mhl_rehash.SAMPLE_PERCENT, mhl_rehash.SAMPLE_SEED = 10, 7
+        sampled_files = [source_hash.file for source_hash, _ in mhl_rehash.sample_image_sequences(jobs)]
+
+        assert len(sampled_files) == 3 + 2 * 5
+        assert 'A002/A002C001_210101_R1AB.0000000.ari' in sampled_files and 'A002/A002C001_210101_R1AB.0000049.ari' in sampled_files
+        assert sorted(sampled_files) == sorted(source_hash.file for source_hash, _ in mhl_rehash.sample_image_sequences(list(reversed(jobs))))
+
+        with open(os.path.join(self.root, 'A002/A002C002_210101_R1AB.0000049.ari'), 'wb') as media_file:
+            media_file.write(b'bad frame')
+        mhl_rehash.reset_for_tests()
+        report_summary = mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir, '--sample', '10', '--seed', '7'])
+
+        assert report_summary["files_hashed"] == 13
+        assert report_summary["sampled_frames"] == 10
+        assert report_summary["sequence_frames"] == 100
+        assert report_summary["output_csv_mismatched_list_length"] == 1
+        # Only the 3 frames picked at random from each clip count, not the first and last
+        assert mhl_rehash.sample_stats["random_frames"] == 6
+        assert round(mhl_rehash.sampled_frames_bad_fraction_bound(), 4) == 0.3930
+
+    def test_quick_check_flags_truncated_files(self):
+        media_files = dict(MEDIA_FILES, **{'A001/A001C004.mxf': b'\x01' * 200000, 'A001/A001C005.mxf': b'missing'})
+        write_mhl(self.mhl_path, media_files)
+        with open(os.path.join(self.root, 'A001/A001C004.mxf'), 'wb') as media_file:
+            media_file.write(b'\x01' * 100000 + b'\x00' * 100000)
+        with open(os.path.join(self.root, 'A001/A001C002.mxf'), 'r+b') as media_file:
+            media_file.truncate(4000)
+        report_summary = mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir, '--quick', '1'])
+
+        assert report_summary["files_checked"] == 5
+        assert report_summary["quick_ok_list_length"] == 2
+        assert report_summary["quick_flagged_list_length"] == 3
+        assert {row[1]: row[5] for row in mhl_rehash.quick_flagged_list} == {
+            'A001/A001C002.mxf': 'truncated',
+            'A001/A001C004.mxf': 'zero-filled tail',
+            'A001/A001C005.mxf': 'missing',
+        }
+        # Files smaller than the first and last MiB together are read once
+        assert report_summary["total_bytes_hashed"] == 1400000 + 4000 + 200000
+        assert os.path.isfile(self.output_dir + 'A001_quick_check.csv')
+
+        mhl_rehash.reset_for_tests()
+        report_summary = mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir, '--quick', '1'])
+
+        assert report_summary["total_bytes_hashed"] == 0
+        assert report_summary["quick_flagged_list_length"] == 3
+
+        with open(os.path.join(self.root, 'A001/A001C001.mxf'), 'r+b') as media_file:
+            media_file.write(b'XX')
+        mhl_rehash.reset_for_tests()
+        report_summary = mhl_rehash.main(['mhl_rehash.py', self.mhl_path, '-r', self.root, '-o', self.output_dir, '--quick', '1'])
+
+        assert report_summary["total_bytes_hashed"] == 1400000
+        assert mhl_rehash.quick_flagged_list[0][1:] == ['A001/A001C001.mxf', '1400000', 1400000, mhl_rehash.quick_flagged_list[0][4], 'changed since last quick check']
+
+        large_path = os.path.join(self.root, 'A001/A001C006.mxf')
+        with open(large_path, 'wb') as media_file:
+            media_file.write(b'\x02' * 3 * 1024 * 1024)
+        result = mhl_rehash.partial_hash(large_path)
+
+        assert result["size"] == 3 * 1024 * 1024
+        assert result["bytes_read"] == 2 * 1024 * 1024
+        assert result["digest"] == xxhash.xxh64(b'\x02' * 2 * 1024 * 1024).hexdigest()
@@ -13,9 +13,35 @@ $ pytest test_source_destination_mhl_compare.py -vs
 #    ✅ 8. Works with multiple source MHLs
 #    ✅ 9. Handles incorrect MD5 or xxHash value
 #    - 9. Check what is does with transcodes in destination
+#    ✅ 10. Runs a batch manifest against one destination
+#    ✅ 11. Summary only mode counts results without writing a report
+#    ✅ 12. Fail fast stops early and writes a partial report, including the image sequence clip it stopped in
+#    ✅ 13. Incremental state file only checks new source MHLs, or every source when the destination changes, including ASC MHL volumes
+#    ✅ 14. Watch folder checks new MHLs into a rolling report, logging MHLs that stay unreadable as failed
+#    ✅ 15. Follows MHLs that are still being written, or not created yet
+#    ✅ 16. Reads an ASC MHL v2 history, only parsing generations added since the last run
+#    ✅ 17. Reads gzip, xz and zstd compressed MHLs and writes compressed reports
+#    ✅ 18. Reading MHLs ahead gives the same hashes and report, and stops reading ahead when no longer needed
+#    ✅ 19. Every XML backend reads the same hashes from every fixture, fails on a truncated MHL, and the backend is picked from the MHL version
+#    ✅ 20. Hash records share directories and frame names, giving back the same paths in a third of the memory
+#    ✅ 21. MD5s and hash dates left in a mapped MHL, and in report rows until they are written, are read back the same as reading every field up front
+#    ✅ 22. A destination indexed on disk gives the same report, is reused until the destination changes and Bloom filter misses skip the disk
+#    ✅ 23. Sharding the comparison across worker processes writes the same report whatever the shard count
 """
 
+import csv
+import gzip
+import mmap
+import json
+import lzma
+import os
+import re
+import shutil
+import sys
+import tempfile
+import tracemalloc
 import unittest
+import ascmhl_writer
 import source_destination_mhl_compare
 
 class TestMhlCompare(unittest.TestCase):
@@ -145,4 +171,603 @@ class TestMhlCompare(unittest.TestCase):
         assert report_summary["output_csv_matched_list_length"] == 20
         assert report_summary["output_csv_mismatched_list_length"] == 0
         assert report_summary["output_csv_unfound_list_length"] == 0
-    
\ No newline at end of file
+
+
+    def test_batch_manifest(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            manifest_path = os.path.join(output_dir, 'manifest.json')
+            with open(manifest_path, 'w') as manifest_file:
+                json.dump([
+                    {'report': 'day1', 'sources': [os.path.abspath('tests/fixtures/test-file-count-src1.mhl')]},
+                    {'report': 'day2', 'sources': [os.path.abspath('tests/fixtures/test-file-count-src2.mhl')], 'skip_summarise_img_seq': True},
+                ], manifest_file)
+
+            job_summaries = source_destination_mhl_compare.main(
+                ['source_destination_mhl_compare.py', 
+                '-m', manifest_path,
+                '-d', 'tests/fixtures/test-file-count-dest.mhl',
+                '--output-dir', output_dir + '/'
+            ])
+
+            assert [job['report'] for job in job_summaries] == ['day1_verified.csv', 'day2_verified.csv']
+            for job in job_summaries:
+                assert job['total_source_file_count'] == 10
+                assert job["output_csv_matched_list_length"] == 10
+                assert os.path.isfile(os.path.join(output_dir, job['report']))
+            with open(os.path.join(output_dir, 'test-file-count-dest_batch_summary.csv')) as summary_file:
+                summary_rows = list(csv.DictReader(summary_file))
+            assert [row['Result'] for row in summary_rows] == ['PASSED', 'PASSED']
+
+            # A job with unfound files fails the batch
+            with open(manifest_path, 'w') as manifest_file:
+                json.dump([{'report': 'day3', 'sources': [os.path.abspath('tests/fixtures/test-missing-clip-src.mhl')]}], manifest_file)
+            source_destination_mhl_compare.reset_for_tests()
+            job_summaries = source_destination_mhl_compare.main(
+                ['source_destination_mhl_compare.py', '-m', manifest_path, '-d', 'tests/fixtures/test-missing-clip-dest.mhl', '--output-dir', output_dir + '/'])
+            assert not source_destination_mhl_compare.is_job_passed(job_summaries[0])
+
+            # Jobs take their sources from the manifest and always write a full report
+            for extra_arguments in (['-s', 'tests/fixtures/test-file-count-src1.mhl'], ['--summary-only'], ['--follow'], ['--watch', output_dir]):
+                source_destination_mhl_compare.reset_for_tests()
+                with self.assertRaises(SystemExit):
+                    source_destination_mhl_compare.main(['source_destination_mhl_compare.py', '-m', manifest_path, '-d', 'tests/fixtures/test-file-count-dest.mhl'] + extra_arguments)
+
+
+    def test_summary_only_counts_without_report(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            report_summary = source_destination_mhl_compare.main(
+                ['source_destination_mhl_compare.py', 
+                '-s', 'tests/fixtures/test-missing-frame-source.mhl',
+                '-d', 'tests/fixtures/test-missing-frame-dest.mhl',
+                '--output-dir', output_dir + '/',
+                '--summary-only', '1'
+            ])
+
+            assert os.listdir(output_dir) == []
+        assert report_summary['total_source_file_count'] == 20
+        assert report_summary["total_touched_files"] == report_summary['total_source_file_count']
+        assert report_summary["output_csv_matched_list_length"] == 1
+        assert report_summary["output_csv_mismatched_list_length"] == 1
+        assert report_summary["output_csv_unfound_list_length"] == 1
+        assert source_destination_mhl_compare.summary_offending_paths == [
+            ('UNFOUND', 'A143AOI3/A143C002_211028_AOI3/A143C002_211028_AOI3.1322832.arx')]
+
+
+    def test_fail_fast_stops_at_first_unfound(self):
+        # A390C002 mxf is missing from destination, so the check stops on the second of ten files
+        with tempfile.TemporaryDirectory() as output_dir:
+            report_summary = source_destination_mhl_compare.main(
+                ['source_destination_mhl_compare.py', 
+                '-s', 'tests/fixtures/test-missing-clip-src.mhl',
+                '-d', 'tests/fixtures/test-missing-clip-dest.mhl',
+                '--output-dir', output_dir + '/',
+                '--fail-fast'
+            ])
+
+            with open(os.path.join(output_dir, 'test-missing-clip-dest_verfied.csv')) as report_file:
+                report_rows = list(csv.reader(report_file))
+
+        assert report_summary['fail_fast_triggered']
+        assert report_summary["total_touched_files"] == 2
+        assert report_summary["output_csv_matched_list_length"] == 1
+        assert report_summary["output_csv_unfound_list_length"] == 1
+        assert [row[0] for row in report_rows[1:]] == ['MATCHED', 'UNFOUND']
+
+        for limit in ('0', '-1'):
+            source_destination_mhl_compare.reset_for_tests()
+            with self.assertRaises(SystemExit):
+                source_destination_mhl_compare.main(['source_destination_mhl_compare.py', '-s', 'tests/fixtures/test-missing-clip-src.mhl',
+                    '-d', 'tests/fixtures/test-missing-clip-dest.mhl', '--fail-fast', limit])
+
+    def test_fail_fast_writes_clip_in_progress(self):
+        # Frame 1322832 is missing from destination, the check stops on it with the A143C002 clip half read
+        with tempfile.TemporaryDirectory() as output_dir:
+            report_summary = source_destination_mhl_compare.main(
+                ['source_destination_mhl_compare.py',
+                '-s', 'tests/fixtures/test-missing-frame-source.mhl',
+                '-d', 'tests/fixtures/test-missing-frame-dest.mhl',
+                '--output-dir', output_dir + '/',
+                '--fail-fast'
+            ])
+
+            with open(os.path.join(output_dir, 'test-missing-frame-dest_verfied.csv')) as report_file:
+                report_rows = list(csv.reader(report_file))
+
+        assert report_summary['fail_fast_triggered']
+        assert report_summary["total_touched_files"] == 2
+        assert [row[:2] for row in report_rows[1:]] == [
+            ['MISMATCHED', 'A143AOI3/A143C002_211028_AOI3/A143C002_211028_AOI3.1322831-1322832.arx'],
+            ['UNFOUND', 'A143AOI3/A143C002_211028_AOI3/A143C002_211028_AOI3.1322832.arx']]
+
+
+    def test_incremental_state_only_checks_new_mhls(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            state_path = os.path.join(output_dir, 'project_state.json')
+            arguments = ['source_destination_mhl_compare.py', 
+                '-d', 'tests/fixtures/test-file-count-dest.mhl',
+                '--output-dir', output_dir + '/',
+                '--state', state_path,
+                '-s', 'tests/fixtures/test-file-count-src1.mhl']
+
+            first_run = source_destination_mhl_compare.main(arguments)
+            source_destination_mhl_compare.reset_for_tests()
+            second_run = source_destination_mhl_compare.main(arguments + ['tests/fixtures/test-file-count-src2.mhl'])
+
+        assert first_run["output_csv_matched_list_length"] == 10
+        assert second_run['checked_sources'] == [os.path.abspath('tests/fixtures/test-file-count-src2.mhl')]
+        assert second_run['total_source_file_count'] == 20
+        assert second_run["output_csv_matched_list_length"] == 20
+        assert second_run["output_csv_mismatched_list_length"] == 0
+        assert second_run["output_csv_unfound_list_length"] == 0
+
+    def test_incremental_state_rechecks_every_source_when_destination_changes(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            destination = os.path.join(output_dir, 'test-file-count-dest.mhl')
+            shutil.copy('tests/fixtures/test-file-count-dest.mhl', destination)
+            arguments = ['source_destination_mhl_compare.py', '-d', destination, '--output-dir', output_dir + '/',
+                '--state', os.path.join(output_dir, 'project_state.json'), '-s', 'tests/fixtures/test-file-count-src1.mhl']
+            first_run = source_destination_mhl_compare.main(arguments)
+            assert first_run["output_csv_matched_list_length"] == 10
+
+            # Every hash of the destination is overwritten, the previously matched source now mismatches
+            with open(destination) as mhl_file:
+                mhl_contents = mhl_file.read()
+            with open(destination, 'w') as mhl_file:
+                mhl_file.write(re.sub(r'<xxhash64be>\w+</xxhash64be>', '<xxhash64be>0000000000000000</xxhash64be>', mhl_contents))
+            source_destination_mhl_compare.reset_for_tests()
+            second_run = source_destination_mhl_compare.main(arguments)
+            assert second_run['checked_sources'] == [os.path.abspath('tests/fixtures/test-file-count-src1.mhl')]
+            assert second_run["output_csv_mismatched_list_length"] == 10
+
+            # Modes that leave results incomplete, or have no source list, can not be recorded in the state
+            for extra_arguments in (['--summary-only'], ['--fail-fast'], ['--follow']):
+                source_destination_mhl_compare.reset_for_tests()
+                with self.assertRaises(SystemExit):
+                    source_destination_mhl_compare.main(arguments + extra_arguments)
+            with self.assertRaises(SystemExit):
+                source_destination_mhl_compare.main(['source_destination_mhl_compare.py', '-d', destination, '--state', os.path.join(output_dir, 'project_state.json'), '-m', 'manifest.csv'])
+
+
+    def test_incremental_state_with_ascmhl_volumes(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            volumes = {}
+            for name, mhl_path in (('SOURCE', 'tests/fixtures/test-file-count-src1.mhl'), ('DESTINATION', 'tests/fixtures/test-file-count-dest.mhl')):
+                volumes[name] = os.path.join(output_dir, name)
+                with ascmhl_writer.AscMhlWriter(volumes[name]) as writer:
+                    for mhl_hash in source_destination_mhl_compare.parse_mhl_hashes(mhl_path):
+                        writer.add_hash(mhl_hash.file, mhl_hash.size, {'xxh64': mhl_hash.xxhash64be}, 'original', mhl_hash.hashdate)
+            arguments = ['source_destination_mhl_compare.py', '-d', volumes['DESTINATION'], '--output-dir', output_dir + '/',
+                '--state', os.path.join(output_dir, 'project_state.json'), '-s', volumes['SOURCE']]
+
+            first_run = source_destination_mhl_compare.main(arguments)
+            source_destination_mhl_compare.reset_for_tests()
+            second_run = source_destination_mhl_compare.main(arguments)
+            # A new generation on the destination volume changes its chain
+            with ascmhl_writer.AscMhlWriter(volumes['DESTINATION']) as writer:
+                writer.add_hash('A001/NEW.mxf', 1, {'xxh64': '0000000000000000'}, 'original')
+            source_destination_mhl_compare.reset_for_tests()
+            third_run = source_destination_mhl_compare.main(arguments)
+
+        assert first_run["output_csv_matched_list_length"] == 10
+        assert second_run['checked_sources'] == []
+        assert second_run["output_csv_matched_list_length"] == 10
+        assert third_run['checked_sources'] == [os.path.abspath(volumes['SOURCE'])]
+
+
+    def test_watch_folder_checks_new_mhl_into_rolling_report(self):
+        destination_index = source_destination_mhl_compare.build_destination_index('tests/fixtures/test-file-count-dest.mhl')
+        with tempfile.TemporaryDirectory() as output_dir:
+            rolling_report_path = os.path.join(output_dir, 'rolling.csv')
+            for source in ['test-file-count-src1.mhl', 'test-file-count-src2.mhl']:
+                assert source_destination_mhl_compare.verify_watched_mhl('tests/fixtures/' + source, destination_index, rolling_report_path)
+
+            with open(rolling_report_path) as report_file:
+                report_rows = list(csv.DictReader(report_file))
+
+        assert len(report_rows) == 20
+        assert {row['Source MHL'] for row in report_rows} == {'test-file-count-src1.mhl', 'test-file-count-src2.mhl'}
+        assert {row['Status'] for row in report_rows} == {'MATCHED'}
+
+
+    def test_watch_folder_logs_unreadable_mhl_as_failed(self):
+        destination_index = source_destination_mhl_compare.build_destination_index('tests/fixtures/test-file-count-dest.mhl')
+        with open('tests/fixtures/test-file-count-src1.mhl', 'rb') as mhl_file:
+            mhl_content = mhl_file.read()
+        compressors = {'A001.mhl': lambda content: content[:len(content) // 2], 'A002.mhl.xz': lambda content: lzma.compress(content)[:-100]}
+        if source_destination_mhl_compare.zstandard:
+            compressors['A003.mhl.zst'] = lambda content: source_destination_mhl_compare.zstandard.ZstdCompressor().compress(content)[:8] + b'corrupt' * 50
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            watch_dir = os.path.join(output_dir, 'watch')
+            os.mkdir(watch_dir)
+            polls = []
+
+            def write_mhls_on_first_poll(seconds):
+                # The MHLs arrive after the watch has started, broken and never finished
+                if not polls:
+                    for name, compress in compressors.items():
+                        with open(os.path.join(watch_dir, name), 'wb') as mhl_file:
+                            mhl_file.write(compress(mhl_content))
+                polls.append(seconds)
+
+            saved = (source_destination_mhl_compare.open_inotify, source_destination_mhl_compare.time.sleep,
+                     source_destination_mhl_compare.WATCH_SETTLE_SECONDS, source_destination_mhl_compare.SAVE_LOCATION)
+            source_destination_mhl_compare.open_inotify = lambda: None
+            source_destination_mhl_compare.time.sleep = write_mhls_on_first_poll
+            source_destination_mhl_compare.WATCH_SETTLE_SECONDS = 0
+            source_destination_mhl_compare.SAVE_LOCATION = output_dir + '/'
+            try:
+                rolling_report_path = source_destination_mhl_compare.watch_folder(watch_dir, 'test-file-count-dest.mhl', destination_index, max_polls=10)
+            finally:
+                (source_destination_mhl_compare.open_inotify, source_destination_mhl_compare.time.sleep,
+                 source_destination_mhl_compare.WATCH_SETTLE_SECONDS, source_destination_mhl_compare.SAVE_LOCATION) = saved
+
+            with open(rolling_report_path) as report_file:
+                report_rows = list(csv.DictReader(report_file))
+
+        assert sorted(row['Source MHL'] for row in report_rows) == sorted(compressors)
+        assert {row['Status'] for row in report_rows} == {'FAILED'}
+
+
+    def test_watch_folder_inotify_reports_new_mhl(self):
+        inotify = source_destination_mhl_compare.open_inotify()
+        if inotify is None:
+            self.skipTest("inotify is only available on Linux")
+        with tempfile.TemporaryDirectory() as watch_dir:
+            source_destination_mhl_compare.add_inotify_watches(inotify, watch_dir)
+            os.mkdir(os.path.join(watch_dir, 'A001'))
+            source_destination_mhl_compare.read_inotify_events(inotify, 1)
+            with open(os.path.join(watch_dir, 'A001', 'A001.mhl'), 'w') as mhl_file:
+                mhl_file.write('<hashlist version="1.1"></hashlist>')
+            with gzip.open(os.path.join(watch_dir, 'A001', 'A001_LTO.mhl.gz'), 'wt') as mhl_file:
+                mhl_file.write('<hashlist version="1.1"></hashlist>')
+
+            changed_paths = source_destination_mhl_compare.read_inotify_events(inotify, 1)
+            os.close(inotify["fd"])
+
+        watched_paths = [path for path in changed_paths if source_destination_mhl_compare.is_watched_mhl(path)]
+        assert os.path.join(watch_dir, 'A001', 'A001.mhl') in watched_paths
+        assert os.path.join(watch_dir, 'A001', 'A001_LTO.mhl.gz') in watched_paths
+
+
+    def test_reads_hashes_appended_to_mhl_being_written(self):
+        with open('tests/fixtures/test-wrong-xxhash-src.mhl', 'rb') as mhl_file:
+            mhl_content = mhl_file.read()
+        cut = mhl_content.index(b'</hash>', mhl_content.index(b'</hash>') + 1) + 20
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            mhl_path = os.path.join(output_dir, 'in-progress.mhl')
+            with open(mhl_path, 'wb') as mhl_file:
+                mhl_file.write(mhl_content[:cut])
+            first_hashes, offset, first_complete = source_destination_mhl_compare.read_appended_hashes(mhl_path, 0)
+
+            with open(mhl_path, 'ab') as mhl_file:
+                mhl_file.write(mhl_content[cut:])
+            more_hashes, _, second_complete = source_destination_mhl_compare.read_appended_hashes(mhl_path, offset)
+
+        assert len(first_hashes) == 2 and not first_complete
+        assert len(more_hashes) == 3 and second_complete
+        assert first_hashes[0].file == 'A390CDQE/Clip/A390C001_211024QE/A390C001_211024QE.mxf'
+
+
+    def test_follows_mhl_created_after_following_starts(self):
+        with open('tests/fixtures/test-wrong-xxhash-src.mhl', 'rb') as mhl_file:
+            mhl_content = mhl_file.read()
+        cut = mhl_content.index(b'</hash>') + 20
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            mhl_path = os.path.join(output_dir, 'not-started.mhl')
+            assert source_destination_mhl_compare.read_appended_hashes(mhl_path, 0) == ([], 0, False)
+            writes = [mhl_content[:cut], mhl_content[cut:]]
+
+            def write_more_while_waiting(seconds):
+                # The offload creates the MHL, then finishes it, while it is being followed
+                if writes:
+                    with open(mhl_path, 'ab') as mhl_file:
+                        mhl_file.write(writes.pop(0))
+
+            saved_sleep = source_destination_mhl_compare.time.sleep
+            source_destination_mhl_compare.time.sleep = write_more_while_waiting
+            try:
+                followed_hashes = list(source_destination_mhl_compare.follow_source_hashes([mhl_path]))
+            finally:
+                source_destination_mhl_compare.time.sleep = saved_sleep
+
+        assert [hash.file for hash in followed_hashes] == [hash.file for hash in source_destination_mhl_compare.parse_mhl_hashes('tests/fixtures/test-wrong-xxhash-src.mhl')]
+
+
+    def test_follow_mode_matches_normal_check(self):
+        report_summary = source_destination_mhl_compare.main(
+            ['source_destination_mhl_compare.py', 
+            '-s', 'tests/fixtures/test-missing-frame-source.mhl',
+            '-d', 'tests/fixtures/test-missing-frame-dest.mhl',
+            '--output-dir', 'tests/test_outputs/',
+            '--follow'
+        ])
+
+        assert report_summary['total_source_file_count'] == 20
+        assert report_summary["output_csv_matched_list_length"] == 1
+        assert report_summary["output_csv_mismatched_list_length"] == 1
+        assert report_summary["output_csv_unfound_list_length"] == 1
+
+
+    def test_reads_ascmhl_history_incrementally(self):
+        destination_hashes = list(source_destination_mhl_compare.parse_mhl_hashes('tests/fixtures/test-wrong-xxhash-dest.mhl'))
+        plain_summary = source_destination_mhl_compare.main(
+            ['source_destination_mhl_compare.py', '-s', 'tests/fixtures/test-wrong-xxhash-src.mhl', '-d', 'tests/fixtures/test-wrong-xxhash-dest.mhl', '--output-dir', 'tests/test_outputs/'])
+        matched_file = source_destination_mhl_compare.output_csv_matched_list[0][6]
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            volume = os.path.join(temp_dir, 'VOLUME')
+            with ascmhl_writer.AscMhlWriter(volume) as writer:
+                for destination_hash in destination_hashes:
+                    writer.add_hash(destination_hash.file, destination_hash.size, {'xxh64': destination_hash.xxhash64be}, 'original', destination_hash.hashdate)
+            # A later generation where one file failed verification
+            with ascmhl_writer.AscMhlWriter(volume) as writer:
+                writer.add_hash(matched_file, 1, {'xxh64': '0000000000000000'}, 'failed')
+            arguments = ['source_destination_mhl_compare.py', '-s', 'tests/fixtures/test-wrong-xxhash-src.mhl', '-d', volume, '--output-dir', temp_dir + '/']
+            source_destination_mhl_compare.reset_for_tests()
+            report_summary = source_destination_mhl_compare.main(arguments)
+
+            assert report_summary["output_csv_matched_list_length"] == plain_summary["output_csv_matched_list_length"] - 1
+            assert report_summary["output_csv_mismatched_list_length"] == plain_summary["output_csv_mismatched_list_length"] + 1
+            assert os.path.isfile(source_destination_mhl_compare.ascmhl_history_cache_path(os.path.join(volume, 'ascmhl')))
+
+            # The first generations come from the cache, so only the newest one has to still be readable
+            with ascmhl_writer.AscMhlWriter(volume) as writer:
+                writer.add_hash(matched_file, destination_hashes[0].size, {'xxh64': next(hash.xxhash64be for hash in destination_hashes if hash.file == matched_file)}, 'verified')
+            for generation_name in [generation[1] for generation in source_destination_mhl_compare.read_ascmhl_chain(os.path.join(volume, 'ascmhl'))][:2]:
+                os.remove(os.path.join(volume, 'ascmhl', generation_name))
+            source_destination_mhl_compare.reset_for_tests()
+            report_summary = source_destination_mhl_compare.main(arguments)
+
+            assert report_summary["output_csv_matched_list_length"] == plain_summary["output_csv_matched_list_length"]
+            assert report_summary["output_csv_mismatched_list_length"] == plain_summary["output_csv_mismatched_list_length"]
+
+
+    def test_reads_compressed_mhls_and_writes_compressed_reports(self):
+        arguments = ['source_destination_mhl_compare.py', '-s', 'tests/fixtures/test-missing-frame-source.mhl', '-d', 'tests/fixtures/test-missing-frame-dest.mhl']
+        compressors = {'gz': gzip.compress, 'xz': lzma.compress}
+        if source_destination_mhl_compare.zstandard:
+            compressors['zst'] = source_destination_mhl_compare.zstandard.ZstdCompressor().compress
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            plain_summary = source_destination_mhl_compare.main(arguments + ['--output-dir', output_dir + '/plain/'])
+            with open(output_dir + '/plain/test-missing-frame-dest_verfied.csv') as plain_report:
+                plain_rows = list(csv.reader(plain_report))
+            for compression, compress in compressors.items():
+                compressed_mhls = []
+                for mhl_path in (arguments[2], arguments[4]):
+                    # Named without an extension, compression is recognised from the file contents
+                    compressed_mhls.append(os.path.join(output_dir, f'{compression}-{os.path.basename(mhl_path)}'))
+                    with open(mhl_path, 'rb') as mhl_file, open(compressed_mhls[-1], 'wb') as compressed_file:
+                        compressed_file.write(compress(mhl_file.read()))
+                source_destination_mhl_compare.reset_for_tests()
+                report_summary = source_destination_mhl_compare.main(
+                    ['source_destination_mhl_compare.py', '-s', compressed_mhls[0], '-d', compressed_mhls[1], '--output-dir', output_dir + f'/{compression}/', '--compress', compression])
+                report_path = output_dir + f'/{compression}/{compression}-test-missing-frame-dest_verfied.csv.{compression}'
+
+                assert report_summary == plain_summary
+                assert source_destination_mhl_compare.detect_compression(report_path) == compression
+                with source_destination_mhl_compare.open_input(report_path, text=True) as report:
+                    assert list(csv.reader(report)) == plain_rows
+
+    def test_prefetch_reads_same_hashes(self):
+        sources = ['tests/fixtures/test-file-count-src1.mhl', 'tests/fixtures/test-file-count-src2.mhl']
+        plain_hashes = [hash.fields() for source in sources for hash in source_destination_mhl_compare.parse_mhl_hashes(source)]
+        # Small chunks and a small limit so each MHL is read ahead a chunk at a time
+        source_destination_mhl_compare.mhl_input.PREFETCH_CHUNK_BYTES = 512
+        source_destination_mhl_compare.PREFETCH_MAX_BYTES = 4096
+        try:
+            prefetched_hashes = [hash.fields() for source, mhl_file in source_destination_mhl_compare.prefetch_mhls(sources)
+                                 for hash in source_destination_mhl_compare.parse_mhl_hashes(source, mhl_file)]
+            assert prefetched_hashes == plain_hashes
+            prefetched = source_destination_mhl_compare.prefetch_mhls(sources + ['tests/fixtures/missing.mhl'])
+            first_path, first_file = next(prefetched)
+            next_file = next(prefetched)[1]
+            # A missing MHL is only an error when it is reached
+            with self.assertRaises(FileNotFoundError):
+                next(prefetched)
+            assert first_file.closed and next_file.closed
+        finally:
+            source_destination_mhl_compare.mhl_input.PREFETCH_CHUNK_BYTES = 4 * 1024 * 1024
+
+        # A share of the budget smaller than a chunk is read in smaller chunks, so what is held ahead stays within it
+        with open('tests/fixtures/test-file-count-src1.mhl', 'rb') as mhl_file:
+            read_ahead_file = source_destination_mhl_compare.mhl_input.ReadAheadFile(mhl_file, 1024 * 1024)
+            assert read_ahead_file.chunk_bytes * (read_ahead_file.chunks.maxsize + 1) <= 1024 * 1024
+            read_ahead_file.close()
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            arguments = ['source_destination_mhl_compare.py', '-s'] + sources + ['-d', 'tests/fixtures/test-file-count-dest.mhl']
+            prefetch_summary = source_destination_mhl_compare.main(arguments + ['--output-dir', output_dir + '/prefetch/', '--prefetch', '1', '--prefetch-mib', '1'])
+            source_destination_mhl_compare.reset_for_tests()
+            plain_summary = source_destination_mhl_compare.main(arguments + ['--output-dir', output_dir + '/plain/', '--prefetch', '0'])
+            assert prefetch_summary == plain_summary
+            with open(output_dir + '/prefetch/test-file-count-dest_verfied.csv') as prefetch_report, open(output_dir + '/plain/test-file-count-dest_verfied.csv') as plain_report:
+                assert prefetch_report.read() == plain_report.read()
+
+    def test_xml_backends_read_same_hashes(self):
+        backends = ['etree', 'scan'] + (['lxml'] if source_destination_mhl_compare.lxml_etree else [])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Entities, attributes, comments and empty elements make the v1 scanner fall back to ElementTree for that hash
+            unusual_mhl = os.path.join(temp_dir, 'unusual.mhl')
+            with open(unusual_mhl, 'w') as mhl_file:
+                mhl_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<hashlist version="1.1">\n'
+                               '  <hash><file>A001/Sound &amp; Picture.wav</file><size>10</size><xxhash64be>0ea03b369a463d9d</xxhash64be></hash>\n'
+                               '  <hash><file>A001/A001C001.mxf</file><!-- rehashed --><size>20</size><md5></md5><hashdate>2021-10-27T19:15:03Z</hashdate></hash>\n'
+                               '  <hash><file>A001/Caf\u00e9.mxf</file><size>30</size><xxhash64be>1ea03b369a463d9d</xxhash64be></hash>\n'
+                               '</hashlist>\n')
+            volume = os.path.join(temp_dir, 'RESTORE')
+            with ascmhl_writer.AscMhlWriter(volume) as writer:
+                writer.add_hash('A001/A001C001.mxf', 20, {'xxh64': '0ea03b369a463d9d', 'md5': '9e107d9d372bb6826bd81d3542a419d6'}, 'verified', '2021-10-27T19:15:03Z')
+            fixtures = sorted(os.path.join('tests/fixtures', name) for name in os.listdir('tests/fixtures') if name.endswith('.mhl'))
+            for mhl_path in fixtures + [unusual_mhl, writer.generation_path]:
+                hashes_by_backend = {}
+                for backend in backends:
+                    source_destination_mhl_compare.XML_BACKEND = backend
+                    hashes_by_backend[backend] = [hash.fields() for hash in source_destination_mhl_compare.parse_mhl_hashes(mhl_path)]
+                assert hashes_by_backend['etree'], mhl_path
+                for backend in backends:
+                    assert hashes_by_backend[backend] == hashes_by_backend['etree'], (backend, mhl_path)
+                # Hashes split across the chunks the scanner reads
+                source_destination_mhl_compare.XML_BACKEND = 'scan'
+                source_destination_mhl_compare.SCAN_CHUNK_BYTES = 7
+                try:
+                    assert [hash.fields() for hash in source_destination_mhl_compare.parse_mhl_hashes(mhl_path)] == hashes_by_backend['etree'], mhl_path
+                finally:
+                    source_destination_mhl_compare.SCAN_CHUNK_BYTES = 4 * 1024 * 1024
+
+            # An MHL cut off part way, eg: still being copied, is an error for every backend rather than a shorter list
+            with open('tests/fixtures/test-file-count-src1.mhl', 'rb') as mhl_file:
+                truncated_content = mhl_file.read(3000)
+            truncated_mhl = os.path.join(temp_dir, 'truncated.mhl')
+            with open(truncated_mhl, 'wb') as mhl_file:
+                mhl_file.write(truncated_content)
+            for backend in backends:
+                source_destination_mhl_compare.XML_BACKEND = backend
+                with self.assertRaises(source_destination_mhl_compare.et.ParseError, msg=backend):
+                    list(source_destination_mhl_compare.parse_mhl_hashes(truncated_mhl))
+            source_destination_mhl_compare.XML_BACKEND = 'auto'
+            destination_index = source_destination_mhl_compare.build_destination_index('tests/fixtures/test-file-count-dest.mhl')
+            assert not source_destination_mhl_compare.verify_watched_mhl(truncated_mhl, destination_index, os.path.join(temp_dir, 'rolling.csv'))
+
+            source_destination_mhl_compare.XML_BACKEND = 'auto'
+            with source_destination_mhl_compare.open_input(fixtures[0]) as mhl_file:
+                assert source_destination_mhl_compare.choose_xml_backend(fixtures[0], mhl_file) == 'scan'
+            with source_destination_mhl_compare.open_input(writer.generation_path) as mhl_file:
+                assert source_destination_mhl_compare.choose_xml_backend(writer.generation_path, mhl_file) == 'etree'
+
+    def test_hash_records_share_path_prefixes(self):
+        FileHash = source_destination_mhl_compare.FileHash
+        for file in ['E007_C001_20211027_R1/E007_C001_20211027_R00000.dng', 'A143AOI3/A143C002_211028_AOI3/A143C002_211028_AOI3.1322831.arx',
+                     'A001/A001C001.mxf', 'A001C001.mxf', '0001.ari', 'A001/', '', None]:
+            assert FileHash(file=file).file == file
+        frames = [FileHash(file=f'DAY_01/A001R1AB/E007_C001_20211027_R1/E007_C001_20211027_R{frame:05d}.dng') for frame in (1, 12345)]
+        assert frames[0].location is frames[1].location
+        assert frames[1].basename() == 'E007_C001_20211027_R12345.dng'
+
+        paths = [f'DAY_01/A001R1AB/E007_C{clip:03d}_20211027_R1/E007_C{clip:03d}_20211027_R{frame:05d}.dng' for clip in range(4) for frame in range(5000)]
+        tracemalloc.start()
+        empty_records = [FileHash() for path in paths]
+        empty_memory = tracemalloc.get_traced_memory()[0]
+        records = [FileHash(file=path) for path in paths]
+        path_memory = tracemalloc.get_traced_memory()[0] - empty_memory * 2
+        tracemalloc.stop()
+        assert path_memory * 3 < sum(sys.getsizeof(path) for path in paths)
+        assert [record.file for record in records] == paths
+
+    def test_deferred_fields_match_loading_every_field(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            unusual_mhl = os.path.join(temp_dir, 'unusual.mhl')
+            with open(unusual_mhl, 'w') as mhl_file:
+                mhl_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<hashlist version="1.1">\n'
+                               '  <hash><file>A001/A001C001.mxf</file><size>20</size><md5></md5><hashdate>2021-10-27T19:15:03Z</hashdate><hashdate>2021-10-27T19:15:04Z</hashdate></hash>\n'
+                               '  <hash><file>A001/A001C002.mxf</file><size>30</size><md5>9e107d9d372bb6826bd81d3542a419d6</md5></hash>\n'
+                               '  <hash><file>A001/Caf\u00e9.mxf</file><md5>e4d909c290d0fb1ca068ffaddf22cbd0</md5><size>40</size></hash>\n'
+                               '</hashlist>\n')
+            for mhl_path in ['tests/fixtures/test-md5-dest.mhl', 'tests/fixtures/test-dng-dest.mhl', unusual_mhl]:
+                source_destination_mhl_compare.LAZY_FIELDS_MIN_BYTES = None
+                all_fields = [hash.fields() for hash in source_destination_mhl_compare.parse_mhl_hashes(mhl_path)]
+                source_destination_mhl_compare.LAZY_FIELDS_MIN_BYTES = 0
+                hashes = list(source_destination_mhl_compare.parse_mhl_hashes(mhl_path))
+                # Only hashes with an MD5 leave it in the mapped MHL, the rest keep their hash date as before
+                assert [type(hash._md5) is int for hash in hashes] == [bool(fields[3]) or fields[3] is None for fields in all_fields], mhl_path
+                assert [hash.fields() for hash in hashes] == all_fields, mhl_path
+                assert not any(type(hash._md5) is int for hash in hashes)
+
+        arguments = ['source_destination_mhl_compare.py', '-s', 'tests/fixtures/test-wrong-md5-src.mhl', '-d', 'tests/fixtures/test-wrong-md5-dest.mhl', '--output-dir', 'tests/test_outputs/', '--summary-only']
+        for checksum_arguments in ([], ['--md5']):
+            source_destination_mhl_compare.reset_for_tests()
+            source_destination_mhl_compare.main(arguments + checksum_arguments + ['--load-all-fields'])
+            all_fields_counts = dict(source_destination_mhl_compare.summary_status_counts)
+            source_destination_mhl_compare.reset_for_tests()
+            source_destination_mhl_compare.LAZY_FIELDS_MIN_BYTES = 0
+            source_destination_mhl_compare.main(arguments + checksum_arguments)
+            assert source_destination_mhl_compare.summary_status_counts == all_fields_counts
+        assert all_fields_counts['MISMATCHED'] > 0
+
+        # A mapped MHL is not also read ahead, and report rows leave the fields in it until they are written out
+        source_destination_mhl_compare.reset_for_tests()
+        rows_by_setting = []
+        for lazy_fields_min_bytes in (None, 0):
+            source_destination_mhl_compare.LAZY_FIELDS_MIN_BYTES = lazy_fields_min_bytes
+            source_destination_mhl_compare.reset_job_state()
+            if lazy_fields_min_bytes is not None:
+                [(mhl_path, mhl_file)] = source_destination_mhl_compare.prefetch_mhls(['tests/fixtures/test-md5-dest.mhl'])
+                assert isinstance(mhl_file, mmap.mmap)
+            destination_index = source_destination_mhl_compare.build_destination_index('tests/fixtures/test-md5-dest.mhl')
+            source_destination_mhl_compare.run_comparison(source_destination_mhl_compare.build_hash_list(['tests/fixtures/test-md5-source.mhl']), destination_index)
+            rows = source_destination_mhl_compare.output_csv_matched_list + source_destination_mhl_compare.output_csv_mismatched_list + source_destination_mhl_compare.output_csv_unfound_list
+            if lazy_fields_min_bytes is not None:
+                assert all(type(row.src_hash._md5) is int for row in rows if not row.src_hash.is_image_seq())
+            rows_by_setting.append([list(row) for row in rows])
+        assert rows_by_setting[0] == rows_by_setting[1]
+        assert rows_by_setting[0]
+
+    def test_disk_index_matches_memory_index(self):
+        bloom_filter = source_destination_mhl_compare.new_bloom_filter(1000)
+        for number in range(1000):
+            bloom_filter.add(f'A001C{number:03d}.mxf')
+        assert all(f'A001C{number:03d}.mxf' in bloom_filter for number in range(1000))
+        assert sum(f'B001C{number:03d}.mxf' in bloom_filter for number in range(1000)) < 50
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            destination = os.path.join(temp_dir, 'test-missing-clip-dest.mhl')
+            shutil.copy('tests/fixtures/test-missing-clip-dest.mhl', destination)
+            arguments = ['source_destination_mhl_compare.py', '-s', 'tests/fixtures/test-missing-clip-src.mhl', '-d', destination]
+            memory_summary = source_destination_mhl_compare.main(arguments + ['--output-dir', temp_dir + '/memory/'])
+            source_destination_mhl_compare.reset_for_tests()
+            disk_summary = source_destination_mhl_compare.main(arguments + ['--output-dir', temp_dir + '/disk/', '--disk-index'])
+            assert disk_summary == memory_summary
+            assert disk_summary['output_csv_unfound_list_length'] > 0
+            with open(temp_dir + '/memory/test-missing-clip-dest_verfied.csv') as memory_report, open(temp_dir + '/disk/test-missing-clip-dest_verfied.csv') as disk_report:
+                assert disk_report.read() == memory_report.read()
+
+            source_destination_mhl_compare.SAVE_LOCATION = temp_dir + '/disk/'
+            index_path = source_destination_mhl_compare.disk_index_path(destination)
+            built_at = os.stat(index_path).st_mtime_ns
+            destination_index = source_destination_mhl_compare.build_destination_index(destination)
+            assert os.stat(index_path).st_mtime_ns == built_at
+            # Filenames that were never in the destination are unfound without a query
+            assert source_destination_mhl_compare.find_matching_hash('A001/A999C001.mxf', destination_index) is None
+            assert destination_index.definite_misses == 1 and destination_index.disk_lookups == 0
+
+            with open(destination) as mhl_file:
+                mhl_contents = mhl_file.read()
+            with open(destination, 'w') as mhl_file:
+                mhl_file.write(mhl_contents.replace('</hashlist>', '<hash><file>A001/A999C001.mxf</file><size>1</size><xxhash64be>0ea03b369a463d9d</xxhash64be></hash></hashlist>'))
+            destination_index = source_destination_mhl_compare.build_destination_index(destination)
+            assert source_destination_mhl_compare.find_matching_hash('A001/A999C001.mxf', destination_index).xxhash64be == '0ea03b369a463d9d'
+            assert destination_index.disk_lookups == 1
+
+    def test_sharded_comparison_writes_same_report(self):
+        comparisons = [
+            (['tests/fixtures/test-dng-source.mhl'], 'tests/fixtures/test-dng-dest.mhl', []),
+            (['tests/fixtures/test-arx-source.mhl'], 'tests/fixtures/test-arx-dest.mhl', []),
+            (['tests/fixtures/test-arx-source.mhl'], 'tests/fixtures/test-arx-dest.mhl', ['--skip-summarise-img-seq']),
+            (['tests/fixtures/test-missing-frame-source.mhl'], 'tests/fixtures/test-missing-frame-dest.mhl', []),
+            (['tests/fixtures/test-file-count-src1.mhl', 'tests/fixtures/test-file-count-src2.mhl'], 'tests/fixtures/test-file-count-dest.mhl', []),
+            (['tests/fixtures/test-wrong-md5-src.mhl'], 'tests/fixtures/test-wrong-md5-dest.mhl', ['--md5']),
+        ]
+        with tempfile.TemporaryDirectory() as output_dir:
+            for sources, destination, extra_arguments in comparisons:
+                reports = {}
+                for shard_count in (1, 2, 3):
+                    source_destination_mhl_compare.reset_for_tests()
+                    summary = source_destination_mhl_compare.main(['source_destination_mhl_compare.py', '-s'] + sources + ['-d', destination,
+                        '--output-dir', f'{output_dir}/{shard_count}/', '--shards', str(shard_count)] + extra_arguments)
+                    with open(f'{output_dir}/{shard_count}/{os.path.basename(destination).split(".")[0]}_verfied.csv') as report:
+                        reports[shard_count] = (summary, report.read())
+                assert reports[2] == reports[1], destination
+                assert reports[3] == reports[1], destination
+
+        # A clip split by other files, a clip cut short by the last file and a last file that starts a new clip
+        FileHash = source_destination_mhl_compare.FileHash
+        source_hashes = [FileHash(file=file, size='1', xxhash64be='0ea03b369a463d9d') for file in [
+            'A/C1.0000001.arx', 'A/C1.0000002.arx', 'A/A001.mxf', 'A/C1.0000003.arx', 'A/C2.0000001.arx', 'A/C3.0000001.arx']]
+        assert source_destination_mhl_compare.plan_comparison_units(source_hashes) == [
+            ([2], None), ([0, 1, 3], (4, 1)), ([4, 5], (5, 1))]
+        assert source_destination_mhl_compare.plan_comparison_units(source_hashes[:4]) == [
+            ([2], None), ([0, 1, 3], (3, 1))]
+        assert source_destination_mhl_compare.plan_comparison_units(source_hashes[:3]) == [([2], None), ([0, 1], None)]
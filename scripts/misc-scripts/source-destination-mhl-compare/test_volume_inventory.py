@@ -0,0 +1,113 @@
+"""
+Unit tests for volume_inventory.py
+Run with:
+$ pytest test_volume_inventory.py -vs
+
+#    ✅ 1. Finds every file in the MHL with the right size
+#    ✅ 2. Reports missing, size mismatched and extra files
+#    ✅ 3. Leaves OS housekeeping files and ignored patterns out of the extras
+#    ✅ 4. A rescan only lists changed folders again and reports the same as a full scan, which also finds files written to in place
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import volume_inventory
+from test_mhl_rehash import MEDIA_FILES, write_mhl
+
+
+class TestVolumeInventory(unittest.TestCase):
+    def setUp(self):
+        volume_inventory.reset_for_tests()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.temp_dir.name, 'SHUTTLE')
+        self.media_files = dict(MEDIA_FILES, **{'B001/Clip/B001C001/B001C001.mxf': b'b camera', 'README.txt': b'notes'})
+        for file, content in self.media_files.items():
+            self.write_file(file, content)
+        self.output_dir = os.path.join(self.temp_dir.name, 'reports') + '/'
+        self.mhl_path = os.path.join(self.temp_dir.name, 'SHUTTLE.mhl')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_file(self, file, content):
+        os.makedirs(os.path.dirname(os.path.join(self.root, file)), exist_ok=True)
+        with open(os.path.join(self.root, file), 'wb') as media_file:
+            media_file.write(content)
+
+    def test_finds_every_file(self):
+        write_mhl(self.mhl_path, self.media_files)
+        report_summary = volume_inventory.main(['volume_inventory.py', self.mhl_path, '-r', self.root, '-o', self.output_dir])
+
+        assert report_summary["total_mhl_files"] == 5
+        assert report_summary["total_disk_files"] == 5
+        assert report_summary["total_found_files"] == 5
+        assert report_summary["inventory_extra_list_length"] == 0
+        assert os.path.isfile(self.output_dir + 'SHUTTLE_inventory.csv')
+
+    def test_reports_missing_size_mismatched_and_extra_files(self):
+        write_mhl(self.mhl_path, dict(self.media_files, **{'A001/A001C004.mxf': b'missing'}))
+        self.write_file('A001/A001C002.mxf', b'truncated')
+        self.write_file('B001/Clip/B001C002/B001C002.mxf', b'not in the mhl')
+        report_summary = volume_inventory.main(['volume_inventory.py', self.mhl_path, '-r', self.root, '-o', self.output_dir, '--workers', '2'])
+
+        assert report_summary["total_found_files"] == 4
+        assert volume_inventory.inventory_missing_list[0][:2] == ['MISSING', 'A001/A001C004.mxf']
+        assert volume_inventory.inventory_size_mismatch_list[0][:4] == ['SIZE_MISMATCH', 'A001/A001C002.mxf', '8000', 9]
+        assert [row[1] for row in volume_inventory.inventory_extra_list] == ['B001/Clip/B001C002/B001C002.mxf']
+
+    def test_ignores_housekeeping_files(self):
+        write_mhl(self.mhl_path, self.media_files)
+        self.write_file('.DS_Store', b'finder')
+        self.write_file('A001/._A001C001.mxf', b'resource fork')
+        self.write_file('.Spotlight-V100/store.db', b'index')
+        self.write_file('B001/Clip/B001C001/B001C001M01.XML', b'<xml/>')
+        report_summary = volume_inventory.main(['volume_inventory.py', self.mhl_path, '-r', self.root, '-o', self.output_dir, '--ignore', '*.XML'])
+
+        assert report_summary["total_disk_files"] == 5
+        assert report_summary["inventory_extra_list_length"] == 0
+
+    def test_rescan_reuses_unchanged_folders(self):
+        write_mhl(self.mhl_path, self.media_files)
+        arguments = ['volume_inventory.py', self.mhl_path, '-r', self.root, '-o', self.output_dir]
+        first_summary = volume_inventory.main(arguments)
+        # SHUTTLE, A001, B001, B001/Clip, B001/Clip/B001C001
+        assert first_summary["directories_rescanned"] == 5
+
+        volume_inventory.reset_for_tests()
+        second_summary = volume_inventory.main(arguments)
+        assert second_summary["directories_rescanned"] == 0
+        assert second_summary["directories_reused"] == 5
+        assert second_summary["total_found_files"] == 5
+
+        # Appending to a file leaves its folder unchanged, only a full scan reads its new size
+        with open(os.path.join(self.root, 'A001/A001C001.mxf'), 'ab') as media_file:
+            media_file.write(b'appended')
+        volume_inventory.reset_for_tests()
+        appended_summary = volume_inventory.main(arguments)
+        assert appended_summary["directories_rescanned"] == 0
+        assert volume_inventory.inventory_size_mismatch_list == []
+        volume_inventory.reset_for_tests()
+        volume_inventory.main(arguments + ['--full-scan'])
+        assert [row[1] for row in volume_inventory.inventory_size_mismatch_list] == ['A001/A001C001.mxf']
+        with open(os.path.join(self.root, 'A001/A001C001.mxf'), 'r+b') as media_file:
+            media_file.truncate(len(self.media_files['A001/A001C001.mxf']))
+
+        # Changes deep in the tree are found, only the folders they were made in are listed again
+        self.write_file('B001/Clip/B001C002/B001C002.mxf', b'not in the mhl')
+        os.remove(os.path.join(self.root, 'A001/A001C002.mxf'))
+        shutil.rmtree(os.path.join(self.root, 'B001/Clip/B001C001'))
+        volume_inventory.reset_for_tests()
+        rescan_summary = volume_inventory.main(arguments)
+        rescan_rows = volume_inventory.inventory_missing_list + volume_inventory.inventory_extra_list
+        assert rescan_summary["directories_rescanned"] == 3
+        assert rescan_summary["directories_reused"] == 2
+
+        volume_inventory.reset_for_tests()
+        full_summary = volume_inventory.main(arguments + ['--full-scan'])
+        assert full_summary["directories_rescanned"] == 5
+        assert volume_inventory.inventory_missing_list + volume_inventory.inventory_extra_list == rescan_rows
+        assert {key: value for key, value in full_summary.items() if not key.startswith('directories')} == \
+            {key: value for key, value in rescan_summary.items() if not key.startswith('directories')}
+        assert [row[1] for row in rescan_rows] == ['A001/A001C002.mxf', 'B001/Clip/B001C001/B001C001.mxf', 'B001/Clip/B001C002/B001C002.mxf']
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+__program_name__ = "Volume Inventory Check"
+__description__ = "Walks a volume and checks every file in the MHLs is there with the right size, and that nothing else is, without hashing. Exports a CSV report."
+__author__ = "Josh Unwin/Gary Palmer"
+__version__ = "0.1"
+
+import csv
+import fnmatch
+import json
+import os
+import sys
+import argparse
+import time
+import unicodedata
+import xxhash
+from concurrent.futures import ThreadPoolExecutor
+
+import source_destination_mhl_compare as mhl_compare
+from source_destination_mhl_compare import BLUE, DEFAULT, YELLOW, GREEN, RED, ORANGE
+
+SAVE_LOCATION = os.path.expanduser("~/Desktop/MHL_Verification_Reports/")
+# Directories scanned at once, each top-level directory of the volume is walked by its own worker
+SCAN_WORKERS = 8
+# OS and tool housekeeping that is never in an MHL, so never reported as an extra
+IGNORE_PATTERNS = ['.DS_Store', '._*', '.Spotlight-V100', '.Trashes', '.fseventsd', '.TemporaryItems', '.DocumentRevisions-V100', 'Thumbs.db', 'desktop.ini', 'ascmhl']
+COMPRESS_OUTPUT = None
+USE_INVENTORY_CACHE = True
+INVENTORY_CSV_HEADER = ['Status', 'File', 'MHL Size', 'Disk Size', 'Disk Modified']
+inventory_missing_list = []
+inventory_size_mismatch_list = []
+inventory_extra_list = []
+total_mhl_files = 0
+total_disk_files = 0
+total_found_files = 0
+directories_rescanned = 0
+directories_reused = 0
+
+
+def args_parse(argv):
+    global SAVE_LOCATION
+    global SCAN_WORKERS
+    global IGNORE_PATTERNS
+    global COMPRESS_OUTPUT
+    global USE_INVENTORY_CACHE
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mhls', nargs='+', help="One or more MHLs listing the media that should be on the volume")
+    parser.add_argument('-r', '--root', required=True, help="The directory the paths in the MHLs are relative to (eg: the root of the shuttle drive)")
+    parser.add_argument('-o', '--output-dir', help="The directory to save the output CSV file to.", default=SAVE_LOCATION)
+    parser.add_argument('--workers', type=int, default=SCAN_WORKERS, help="Directories scanned at once (default 8)")
+    parser.add_argument('--ignore', nargs='+', default=[], metavar='PATTERN', help="More file or folder names to leave out of the extras, eg: '*.xml' 'Proxy'")
+    parser.add_argument('--compress', choices=['gz', 'xz', 'zst'], help="Compress the report CSV")
+    parser.add_argument('--cache', help="Where to keep the directory listings of this volume (default inventory_cache/ next to the report)")
+    parser.add_argument('--full-scan', action='store_true', help="List every directory again instead of reusing listings of unchanged directories, eg: after files were rewritten in place")
+    parsed_arguments = parser.parse_args(argv[1:]) # skip the first argument (the script name)
+    SAVE_LOCATION = parsed_arguments.output_dir
+    SCAN_WORKERS = parsed_arguments.workers
+    IGNORE_PATTERNS = IGNORE_PATTERNS + parsed_arguments.ignore
+    COMPRESS_OUTPUT = parsed_arguments.compress
+    USE_INVENTORY_CACHE = not parsed_arguments.full_scan
+
+    return parsed_arguments
+
+
+def normalise_path(path):
+    # macOS volumes often hand back decomposed unicode, MHLs are usually composed
+    return unicodedata.normalize('NFC', path)
+
+
+def is_ignored(name):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in IGNORE_PATTERNS)
+
+
+def list_directory(directory):
+    # ([subdirectory names], [(file name, size, mtime)]) from a single scandir, which gets sizes without a stat per file
+    subdirectories = []
+    files = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if is_ignored(entry.name):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.name)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.name, stat.st_size, stat.st_mtime))
+    except (PermissionError, FileNotFoundError) as error:
+        print(f"\t{YELLOW}Could not read {directory}: {error.strerror}{DEFAULT}")
+    return subdirectories, files
+
+
+def list_directory_cached(root, directory, cache, new_cache):
+    # Adding, removing or renaming an entry changes the mtime of its directory, so a directory with the same mtime
+    # as last time has the same files in it, and their sizes and mtimes are taken from the cache without a stat per file.
+    # Its subdirectories are still checked, each has its own mtime. Writing to a file in place does not change its
+    # directory, so a file rewritten since the last scan keeps its old size until --full-scan.
+    # Returns the listing and whether the directory had to be listed again.
+    try:
+        directory_mtime = os.stat(os.path.join(root, directory)).st_mtime_ns
+    except OSError:
+        directory_mtime = None
+    cached = cache.get(directory)
+    if cached and directory_mtime is not None and cached["mtime"] == directory_mtime and "files" in cached:
+        subdirectories, files = cached["dirs"], [tuple(file) for file in cached["files"]]
+        is_rescanned = False
+    else:
+        subdirectories, files = list_directory(os.path.join(root, directory))
+        is_rescanned = True
+    if directory_mtime is not None:
+        new_cache[directory] = {"mtime": directory_mtime, "dirs": subdirectories, "files": files}
+    return subdirectories, files, is_rescanned
+
+
+def scan_tree(root, relative_directory, cache):
+    # {relative path: (size, mtime)} for every file below relative_directory, the new listings for the cache,
+    # and how many directories had to be listed again
+    inventory = {}
+    new_cache = {}
+    rescanned = 0
+    pending = [relative_directory]
+    while pending:
+        directory = pending.pop()
+        subdirectories, files, is_rescanned = list_directory_cached(root, directory, cache, new_cache)
+        rescanned += is_rescanned
+        for name, size, mtime in files:
+            inventory[normalise_path(os.path.join(directory, name))] = (size, mtime)
+        pending.extend(os.path.join(directory, name) for name in subdirectories)
+    return inventory, new_cache, rescanned
+
+
+def scan_volume(root, cache=None):
+    # Files at the top of the volume are listed here, each top-level directory is walked by a worker.
+    # Returns the inventory and the listings to cache for the next scan.
+    global directories_rescanned
+    global directories_reused
+    cache = cache or {}
+    new_cache = {}
+    subdirectories, files, is_rescanned = list_directory_cached(root, "", cache, new_cache)
+    directories_rescanned += is_rescanned
+    inventory = {normalise_path(name): (size, mtime) for name, size, mtime in files}
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        for tree_inventory, tree_cache, rescanned in executor.map(lambda directory: scan_tree(root, directory, cache), subdirectories):
+            inventory.update(tree_inventory)
+            new_cache.update(tree_cache)
+            directories_rescanned += rescanned
+    directories_reused = len(new_cache) - directories_rescanned
+    return inventory, new_cache
+
+
+def inventory_cache_path(root):
+    return os.path.join(SAVE_LOCATION, "inventory_cache", xxhash.xxh64(os.path.abspath(root).encode()).hexdigest() + ".json")
+
+
+def load_inventory_cache(cache_path):
+    # Listings are filtered by the ignore patterns, so a cache made with different patterns cannot be reused
+    if not os.path.isfile(cache_path):
+        return {}
+    with open(cache_path) as cache_file:
+        cache = json.load(cache_file)
+    if cache.get("ignore") != IGNORE_PATTERNS:
+        return {}
+    return cache["directories"]
+
+
+def save_inventory_cache(cache_path, directories):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # Written to a temporary file first so an interrupted run never leaves a half written cache
+    with open(cache_path + ".tmp", 'w') as cache_file:
+        json.dump({"ignore": IGNORE_PATTERNS, "directories": directories}, cache_file)
+    os.replace(cache_path + ".tmp", cache_path)
+
+
+def load_mhl_sizes(mhl_paths):
+    # {relative path: size} for every file in the MHLs, later MHLs win when a file is listed twice
+    mhl_sizes = {}
+    for mhl_path, mhl_file in mhl_compare.prefetch_mhls(mhl_paths):
+        print(f"\t{DEFAULT}Reading {mhl_path}...")
+        for mhl_hash in mhl_compare.parse_mhl_hashes(mhl_path, mhl_file):
+            if mhl_hash.file:
+                mhl_sizes[normalise_path(mhl_hash.file.lstrip('/'))] = mhl_hash.size
+    return mhl_sizes
+
+
+def compare_inventory(mhl_sizes, inventory):
+    global total_mhl_files
+    global total_disk_files
+    global total_found_files
+    total_mhl_files = len(mhl_sizes)
+    total_disk_files = len(inventory)
+    for path, mhl_size in mhl_sizes.items():
+        disk_file = inventory.get(path)
+        if disk_file is None:
+            inventory_missing_list.append(['MISSING', path, mhl_size, '', ''])
+        elif mhl_size and int(mhl_size) != disk_file[0]:
+            inventory_size_mismatch_list.append(['SIZE_MISMATCH', path, mhl_size, disk_file[0], modified_date(disk_file[1])])
+        else:
+            total_found_files += 1
+    for path in sorted(inventory.keys() - mhl_sizes.keys()):
+        size, mtime = inventory[path]
+        inventory_extra_list.append(['EXTRA', path, '', size, modified_date(mtime)])
+
+
+def modified_date(mtime):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(mtime))
+
+
+def export_inventory_csv(output_report_csv_name):
+    report_path = SAVE_LOCATION + output_report_csv_name + (f".{COMPRESS_OUTPUT}" if COMPRESS_OUTPUT else "")
+    with mhl_compare.open_output(report_path, COMPRESS_OUTPUT) as new_file:
+        csv_writer = csv.writer(new_file)
+        csv_writer.writerow(INVENTORY_CSV_HEADER)
+        for line in inventory_missing_list + inventory_size_mismatch_list + inventory_extra_list:
+            csv_writer.writerow(line)
+
+    print(f"\n\t{GREEN}\u2713{DEFAULT} Files present with the right size: {total_found_files} of {total_mhl_files}")
+    print(f"\t{RED}\u00D7{DEFAULT} Missing files: {len(inventory_missing_list)}")
+    print(f"\t{ORANGE}?{DEFAULT} Size mismatched files: {len(inventory_size_mismatch_list)}")
+    print(f"\t{YELLOW}+{DEFAULT} Extra files on the volume: {len(inventory_extra_list)}")
+    print(f"\n\tInventory complete. Output report CSV has been saved to {report_path}")
+    print(f"\tPlease note this checks names and sizes only, re-hash the media with mhl_rehash.py to check the contents.")
+
+
+def create_save_directory():
+    if not os.path.isdir(SAVE_LOCATION):
+        os.mkdir(SAVE_LOCATION)
+
+
+def main(argv):
+    arguments = args_parse(argv)
+    print(f"\t{BLUE}\n{__program_name__} v{__version__} | {__author__}{DEFAULT}")
+    create_save_directory()
+    mhl_sizes = load_mhl_sizes(arguments.mhls)
+    print(f"\t{DEFAULT}Scanning {arguments.root}...")
+    start_time = time.time()
+    cache_path = arguments.cache or inventory_cache_path(arguments.root)
+    inventory, directories = scan_volume(arguments.root, load_inventory_cache(cache_path) if USE_INVENTORY_CACHE else None)
+    save_inventory_cache(cache_path, directories)
+    print(f"\t{DEFAULT}Found {len(inventory)} files in {time.time() - start_time:.1f}s ({directories_rescanned} folders listed, {directories_reused} unchanged since the last scan)")
+    compare_inventory(mhl_sizes, inventory)
+    output_report_csv_name = "_".join(os.path.basename(mhl).split('.')[0] for mhl in arguments.mhls) + "_inventory.csv"
+    export_inventory_csv(output_report_csv_name)
+
+    # Counts returned when running tests
+    if __name__ != '__main__':
+        return {
+            "total_mhl_files": total_mhl_files,
+            "total_disk_files": total_disk_files,
+            "total_found_files": total_found_files,
+            "inventory_missing_list_length": len(inventory_missing_list),
+            "inventory_size_mismatch_list_length": len(inventory_size_mismatch_list),
+            "inventory_extra_list_length": len(inventory_extra_list),
+            "directories_rescanned": directories_rescanned,
+            "directories_reused": directories_reused,
+        }
+    if inventory_missing_list or inventory_size_mismatch_list:
+        return 1
+
+
+# Runs when opened from command line, passing sys.argv through to allow tests to run script
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
+
+
+def reset_for_tests():
+    # Tests dont run independently, so we need to reset the global variables
+    global SAVE_LOCATION
+    global SCAN_WORKERS
+    global IGNORE_PATTERNS
+    global COMPRESS_OUTPUT
+    global inventory_missing_list
+    global inventory_size_mismatch_list
+    global inventory_extra_list
+    global total_mhl_files
+    global total_disk_files
+    global total_found_files
+    global directories_rescanned
+    global directories_reused
+    global USE_INVENTORY_CACHE
+    mhl_compare.reset_for_tests()
+    SAVE_LOCATION = os.path.expanduser("~/Desktop/MHL_Verification_Reports/")
+    SCAN_WORKERS = 8
+    IGNORE_PATTERNS = ['.DS_Store', '._*', '.Spotlight-V100', '.Trashes', '.fseventsd', '.TemporaryItems', '.DocumentRevisions-V100', 'Thumbs.db', 'desktop.ini', 'ascmhl']
+    COMPRESS_OUTPUT = None
+    inventory_missing_list = []
+    inventory_size_mismatch_list = []
+    inventory_extra_list = []
+    total_mhl_files = 0
+    total_disk_files = 0
+    total_found_files = 0
+    directories_rescanned = 0
+    directories_reused = 0
+    USE_INVENTORY_CACHE = True